@@ -0,0 +1,467 @@
+import os
+import re
+import json
+import time
+import uuid
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Hashable, Iterator, List, Optional
+
+import numpy as np
+
+from embed.config import EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_MAX_ENTRIES, EMBEDDING_CACHE_DTYPE
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+class LRUCache:
+    """
+    A thread-safe, in-memory least-recently-used cache with an optional time-to-live.
+    """
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        """
+        Initialize the LRUCache with the given parameters.
+
+        Args:
+            maxsize (int): The maximum number of entries kept.
+            ttl (float): The number of seconds an entry stays valid, or None to never expire.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Get a cached value and mark it as recently used.
+
+        Args:
+            key (Hashable): The key to look up.
+            default (Any): The value returned on a miss or an expired entry.
+
+        Returns:
+            Any: The cached value, or `default`.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+
+            value, stored_at = entry
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                return default
+
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        """
+        Cache a value, evicting the least recently used entry if the cache is full.
+
+        Args:
+            key (Hashable): The key to store the value under.
+            value (Any): The value to cache.
+        """
+        if self.maxsize <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Drop every cached entry.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class EmbeddingCache:
+    """
+    A persistent, size-bounded cache of embedding vectors for one model.
+
+    Vectors live in a memory-mapped matrix on disk, one row per slot. A second
+    memory-mapped file holds the 32-byte key of every slot and a third the
+    last-use tick used for least-recently-used eviction, so lookups and writes
+    only ever touch the rows involved.
+
+    Use `open` to share one cache per directory within a process. Writes
+    from other processes are picked up before every write, under a file lock
+    where fcntl is available, and a lookup whose slot now holds another key
+    is a miss, so a stale cache never returns the vector of another text.
+    """
+
+    KEY_SIZE = 32
+
+    # One cache per directory and process, so every embedder of a model allocates from the same slots
+    _caches: Dict[str, "EmbeddingCache"] = {}
+    _caches_lock = threading.Lock()
+
+    @classmethod
+    def open(cls, model_name: str, cache_dir: str = EMBEDDING_CACHE_DIR,
+             max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES, dtype: str = EMBEDDING_CACHE_DTYPE) -> "EmbeddingCache":
+        """
+        Get the cache of a model, opening it on first use.
+
+        Args:
+            model_name (str): The name of the embedding model whose vectors are cached.
+            cache_dir (str): The root directory of the embedding cache.
+            max_entries (int): The maximum number of cached vectors before eviction.
+            dtype (str): The storage dtype of the vectors, 'float32' or 'float16'.
+
+        Returns:
+            EmbeddingCache: The shared cache of the model.
+        """
+        key = os.path.abspath(os.path.join(cache_dir, re.sub(r"[^\w.-]", "_", model_name)))
+        with cls._caches_lock:
+            cache = cls._caches.get(key)
+            if cache is None:
+                cache = cls._caches[key] = cls(model_name, cache_dir, max_entries, dtype)
+            return cache
+
+    def __init__(self, model_name: str, cache_dir: str = EMBEDDING_CACHE_DIR,
+                 max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES, dtype: str = EMBEDDING_CACHE_DTYPE):
+        """
+        Initialize the EmbeddingCache with the given parameters.
+
+        Args:
+            model_name (str): The name of the embedding model whose vectors are cached.
+            cache_dir (str): The root directory of the embedding cache.
+            max_entries (int): The maximum number of cached vectors before eviction.
+            dtype (str): The storage dtype of the vectors, 'float32' or 'float16'.
+        """
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"Invalid dtype '{dtype}'. Valid options are: ['float32', 'float16']")
+
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.dtype = dtype
+        self.directory = os.path.join(cache_dir, re.sub(r"[^\w.-]", "_", model_name))
+        self._lock = threading.Lock()
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._meta_path = os.path.join(self.directory, "meta.json")
+        self._vectors_path = os.path.join(self.directory, "vectors.bin")
+        self._keys_path = os.path.join(self.directory, "keys.bin")
+        self._ticks_path = os.path.join(self.directory, "ticks.bin")
+
+        self.dim = None
+        self.capacity = 0
+        self.count = 0
+        self.clock = 0
+        # The id of the last write this instance loaded or made; another id on disk means another writer
+        self._writer = None
+        self._vectors = None
+        self._keys = None
+        self._ticks = None
+        self._slots: Dict[bytes, int] = {}
+        self._load()
+
+    def make_key(self, text: str) -> bytes:
+        """
+        Build the cache key of a text for this model.
+
+        Args:
+            text (str): The text to key.
+
+        Returns:
+            bytes: The 32-byte key.
+        """
+        normalized = unicodedata.normalize("NFC", " ".join(text.split()))
+        return hashlib.sha256(f"{self.model_name}\x00{normalized}".encode("utf-8")).digest()
+
+    def _load(self):
+        """
+        Open the on-disk cache, if one exists, and rebuild the key index.
+        """
+        if not os.path.exists(self._meta_path):
+            return
+
+        try:
+            with open(self._meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (IOError, json.JSONDecodeError):
+            return
+
+        if meta.get("dtype") != self.dtype:
+            # A cache written with another dtype is discarded rather than converted
+            return
+
+        self.dim = meta["dim"]
+        self.capacity = meta["capacity"]
+        self.count = meta["count"]
+        self.clock = meta["clock"]
+        self._writer = meta.get("writer")
+        self._open_maps()
+
+        keys = self._keys[:self.count].tobytes()
+        self._slots = {
+            keys[slot * self.KEY_SIZE:(slot + 1) * self.KEY_SIZE]: slot
+            for slot in range(self.count)
+        }
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        """
+        Hold the write lock of the cache directory, where fcntl is available.
+        """
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.directory, "LOCK"), "a+b") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _reload_if_changed(self):
+        """
+        Load the cache again if another instance or process wrote to it since this one did.
+        """
+        try:
+            with open(self._meta_path, "r", encoding="utf-8") as f:
+                writer = json.load(f).get("writer")
+        except (IOError, json.JSONDecodeError):
+            return
+        if writer == self._writer:
+            return
+
+        self._flush_maps()
+        self._vectors = self._keys = self._ticks = None
+        self._slots = {}
+        self._load()
+
+    def _open_maps(self):
+        """
+        Memory-map the vector, key and tick files at the current capacity.
+        """
+        sizes = (
+            (self._vectors_path, self.capacity * self.dim * np.dtype(self.dtype).itemsize),
+            (self._keys_path, self.capacity * self.KEY_SIZE),
+            (self._ticks_path, self.capacity * np.dtype(np.int64).itemsize),
+        )
+        for path, size in sizes:
+            with open(path, "ab") as f:
+                f.truncate(size)
+
+        self._vectors = np.memmap(self._vectors_path, dtype=self.dtype, mode="r+", shape=(self.capacity, self.dim))
+        self._keys = np.memmap(self._keys_path, dtype=np.uint8, mode="r+", shape=(self.capacity, self.KEY_SIZE))
+        self._ticks = np.memmap(self._ticks_path, dtype=np.int64, mode="r+", shape=(self.capacity,))
+
+    def _grow(self, needed: int):
+        """
+        Grow the memory-mapped files so that at least `needed` slots fit.
+        """
+        new_capacity = min(self.max_entries, max(needed, self.capacity * 2, 1024))
+        if new_capacity <= self.capacity:
+            return
+
+        self._flush_maps()
+        self._vectors = self._keys = self._ticks = None
+        self.capacity = new_capacity
+        self._open_maps()
+
+    def _allocate(self, n: int) -> List[int]:
+        """
+        Allocate `n` slots, evicting the least recently used entries if the cache is full.
+        """
+        if self.count + n > self.capacity:
+            self._grow(self.count + n)
+
+        used = self.count
+        free = min(n, self.capacity - used)
+        slots = list(range(used, used + free))
+        self.count += free
+
+        evict = n - free
+        if evict > 0:
+            ticks = np.asarray(self._ticks[:used])
+            victims = np.argpartition(ticks, evict - 1)[:evict] if evict < used else np.arange(used)
+            for slot in victims.tolist():
+                self._slots.pop(self._keys[slot].tobytes(), None)
+                slots.append(slot)
+        return slots
+
+    def get_many(self, keys: List[bytes]) -> Dict[bytes, List[float]]:
+        """
+        Look up cached vectors.
+
+        Args:
+            keys (List[bytes]): The keys to look up.
+
+        Returns:
+            Dict[bytes, List[float]]: The cached vectors of the keys that were found.
+        """
+        with self._lock:
+            found = {}
+            for key in keys:
+                slot = self._slots.get(key)
+                if slot is None:
+                    continue
+                if self._keys[slot].tobytes() != key:
+                    # Another writer reused the slot; the vector there belongs to another text
+                    del self._slots[key]
+                    continue
+                found[key] = slot
+            if not found:
+                return {}
+
+            slots = np.fromiter(found.values(), dtype=np.int64, count=len(found))
+            self.clock += 1
+            self._ticks[slots] = self.clock
+            rows = np.asarray(self._vectors[slots], dtype=np.float32)
+            return {key: row.tolist() for key, row in zip(found, rows)}
+
+    def put_many(self, keys: List[bytes], vectors: List[List[float]]):
+        """
+        Store vectors in the cache and persist the index.
+
+        Args:
+            keys (List[bytes]): The keys of the vectors.
+            vectors (List[List[float]]): The vectors to store.
+        """
+        if not keys:
+            return
+
+        with self._lock, self._file_lock():
+            self._reload_if_changed()
+            pending = {}
+            for key, vector in zip(keys, vectors):
+                if key not in self._slots:
+                    pending[key] = vector
+            if not pending:
+                return
+
+            matrix = np.asarray(list(pending.values()), dtype=np.float32)
+            if self.dim is None:
+                self.dim = matrix.shape[1]
+            elif matrix.shape[1] != self.dim:
+                raise ValueError(f"Expected vectors of dimension {self.dim}, got {matrix.shape[1]}.")
+
+            # Only the most recent max_entries vectors of an oversized batch can be kept
+            keys = list(pending)[-self.max_entries:]
+            matrix = matrix[-self.max_entries:]
+            slots = self._allocate(len(keys))
+            index = np.asarray(slots, dtype=np.int64)
+
+            self.clock += 1
+            self._vectors[index] = matrix.astype(self.dtype)
+            self._keys[index] = np.frombuffer(b"".join(keys), dtype=np.uint8).reshape(len(keys), self.KEY_SIZE)
+            self._ticks[index] = self.clock
+            for key, slot in zip(keys, slots):
+                self._slots[key] = slot
+
+            self._flush_maps()
+            self._save_meta()
+
+    def _flush_maps(self):
+        """
+        Flush the memory-mapped files to disk.
+        """
+        for array in (self._vectors, self._keys, self._ticks):
+            if array is not None:
+                array.flush()
+
+    def _save_meta(self):
+        """
+        Atomically write the cache metadata.
+        """
+        meta = {
+            "model_name": self.model_name,
+            "dtype": self.dtype,
+            "dim": self.dim,
+            "capacity": self.capacity,
+            "count": self.count,
+            "clock": self.clock,
+            "writer": uuid.uuid4().hex,
+        }
+        self._writer = meta["writer"]
+        tmp_path = f"{self._meta_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp_path, self._meta_path)
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+class CachedEmbeddings:
+    """
+    An embedding function that serves document embeddings from an EmbeddingCache
+    and only runs the wrapped model on texts it has never seen.
+
+    It implements the embed_documents/embed_query interface of LangChain's
+    Embeddings without importing LangChain.
+    """
+
+    def __init__(self, embeddings, cache: EmbeddingCache):
+        """
+        Initialize the CachedEmbeddings with the given parameters.
+
+        Args:
+            embeddings: The LangChain embedding function to wrap.
+            cache (EmbeddingCache): The cache to read from and write to.
+        """
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed documents, computing only the cache misses.
+
+        Args:
+            texts (List[str]): The texts to embed.
+
+        Returns:
+            List[List[float]]: One embedding per text, in input order.
+        """
+        keys = [self.cache.make_key(text) for text in texts]
+        vectors = self.cache.get_many(keys)
+
+        missing: Dict[bytes, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                missing.setdefault(key, text)
+
+        if missing:
+            computed = self.embeddings.embed_documents(list(missing.values()))
+            self.cache.put_many(list(missing), computed)
+            vectors.update(zip(missing, computed))
+
+        return [list(vectors[key]) for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Embed a query with the wrapped model.
+
+        Args:
+            text (str): The query to embed.
+
+        Returns:
+            List[float]: The query embedding.
+        """
+        return self.embeddings.embed_query(text)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed several queries in one model batch without caching them as documents.
+
+        Args:
+            texts (List[str]): The queries to embed.
+
+        Returns:
+            List[List[float]]: One embedding per query, in input order.
+        """
+        return self.embeddings.embed_documents(texts)
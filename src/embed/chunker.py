@@ -0,0 +1,244 @@
+import re
+import logging
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Tuple, Union
+
+from embed.config import CHUNK_SIZE, CHUNK_OVERLAP, CHUNK_COUNT_BATCH_SIZE
+
+# A unit is a word with its trailing whitespace; chunks are always cut between units
+UNIT_PATTERN = re.compile(r"\S+\s*")
+# Units ending a sentence or a paragraph are preferred as chunk ends
+BREAK_PATTERN = re.compile(r"(?:[.!?:;]\S*\s*|\S*\n\s*)$")
+
+class Chunk(NamedTuple):
+    """
+    A chunk of text and its character span in the source.
+    """
+    text: str
+    start: int
+    end: int
+
+class _Unit(NamedTuple):
+    text: str
+    start: int
+    tokens: int
+    is_break: bool
+
+class TokenChunker:
+    """
+    A streaming text chunker that measures chunk length in tokens of the embedding model.
+
+    Text is read piece by piece from an iterable and split into word units
+    whose token counts are computed in batches. Units are packed greedily
+    until the next one would overflow the token budget, and chunks end on a
+    sentence or paragraph boundary when one falls in the second half of the
+    chunk. Only the units of the chunk being built are held in memory, so
+    arbitrarily long inputs are chunked in bounded memory.
+    """
+
+    def __init__(self, tokenizer: Union[str, Callable[[List[str]], List[int]]], chunk_size: int = CHUNK_SIZE,
+                 chunk_overlap: int = CHUNK_OVERLAP, batch_size: int = CHUNK_COUNT_BATCH_SIZE):
+        """
+        Initialize the TokenChunker with the given parameters.
+
+        Args:
+            tokenizer (Union[str, Callable]): A Hugging Face tokenizer name, usually the embedding
+                model's, or a function returning the token count of each text in a list.
+            chunk_size (int): The maximum number of tokens per chunk, including the special tokens
+                the model adds around every input.
+            chunk_overlap (int): The number of tokens repeated between consecutive chunks.
+            batch_size (int): The number of units whose tokens are counted in one tokenizer call.
+        """
+        if chunk_overlap >= chunk_size:
+            raise ValueError(f"chunk_overlap ({chunk_overlap}) must be smaller than chunk_size ({chunk_size}).")
+
+        self.tokenizer = tokenizer
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.batch_size = batch_size
+        self._count_tokens = None
+        self._split_unit = None
+        self._budget = None
+
+    def _load_tokenizer(self):
+        """
+        Build the token counting and long-unit splitting functions for the configured tokenizer.
+        """
+        special_tokens = 0
+        tokenizer = None
+        if callable(self.tokenizer):
+            self._count_tokens = self.tokenizer
+        else:
+            try:
+                from transformers import AutoTokenizer
+                tokenizer = AutoTokenizer.from_pretrained(self.tokenizer)
+                special_tokens = tokenizer.num_special_tokens_to_add()
+                self._count_tokens = lambda texts: [
+                    len(ids) for ids in tokenizer(texts, add_special_tokens=False)["input_ids"]
+                ]
+            except Exception as e:
+                logging.warning(f"Could not load tokenizer '{self.tokenizer}', estimating token counts instead: {e}")
+                self._count_tokens = lambda texts: [len(re.findall(r"\w+|[^\w\s]", text)) for text in texts]
+
+        self._budget = max(self.chunk_size - special_tokens, 1)
+        if tokenizer is not None and tokenizer.is_fast:
+            def split_unit(text):
+                offsets = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+                return [offsets[start][0] for start in range(0, len(offsets), self._budget)][1:]
+            self._split_unit = split_unit
+        else:
+            self._split_unit = None
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        """
+        Count the tokens of each text, without special tokens.
+
+        Args:
+            texts (List[str]): The texts to measure.
+
+        Returns:
+            List[int]: The token count of each text.
+        """
+        if self._count_tokens is None:
+            self._load_tokenizer()
+        return self._count_tokens(texts)
+
+    @property
+    def budget(self) -> int:
+        """
+        The number of text tokens that fit in a chunk once special tokens are accounted for.
+        """
+        if self._budget is None:
+            self._load_tokenizer()
+        return self._budget
+
+    @staticmethod
+    def _iter_words(pieces: Iterable[str]) -> Iterator[Tuple[str, int]]:
+        """
+        Yield the word units of a stream of text pieces with their offsets in the whole stream.
+
+        A unit touching the end of the buffered text may continue in the next
+        piece, so it is held back until more text arrives.
+        """
+        buffer = ""
+        offset = 0
+        for piece in pieces:
+            buffer += piece
+            consumed = 0
+            for match in UNIT_PATTERN.finditer(buffer):
+                if match.end() == len(buffer):
+                    break
+                yield match.group(), offset + match.start()
+                consumed = match.end()
+            buffer = buffer[consumed:]
+            offset += consumed
+
+        for match in UNIT_PATTERN.finditer(buffer):
+            yield match.group(), offset + match.start()
+
+    def _iter_units(self, pieces: Iterable[str]) -> Iterator[_Unit]:
+        """
+        Yield the units of a stream of text pieces with their token counts, counted in batches.
+
+        Units longer than a whole chunk are split at token boundaries.
+        """
+        batch = []
+        for word in self._iter_words(pieces):
+            batch.append(word)
+            if len(batch) >= self.batch_size:
+                yield from self._count_units(batch)
+                batch = []
+        if batch:
+            yield from self._count_units(batch)
+
+    def _count_units(self, words: List[Tuple[str, int]]) -> Iterator[_Unit]:
+        """
+        Count the tokens of a batch of words and turn them into units.
+        """
+        for (text, start), tokens in zip(words, self.count_tokens([text for text, _ in words])):
+            if tokens <= self.budget:
+                yield _Unit(text, start, tokens, bool(BREAK_PATTERN.search(text)))
+                continue
+
+            # A single word longer than a chunk, such as a URL or a run of symbols
+            if self._split_unit is not None:
+                cuts = self._split_unit(text)
+            else:
+                step = max(len(text) * self.budget // tokens, 1)
+                cuts = list(range(step, len(text), step))
+            bounds = [0] + [cut for cut in cuts if 0 < cut < len(text)] + [len(text)]
+            parts = [text[left:right] for left, right in zip(bounds, bounds[1:])]
+            for index, (part, left, count) in enumerate(zip(parts, bounds, self.count_tokens(parts))):
+                yield _Unit(part, start + left, min(count, self.budget), index == len(parts) - 1)
+
+    @staticmethod
+    def _make_chunk(units: List[_Unit]) -> Chunk:
+        """
+        Join consecutive units into a chunk without its trailing whitespace.
+        """
+        text = "".join(unit.text for unit in units).rstrip()
+        return Chunk(text, units[0].start, units[0].start + len(text))
+
+    def iter_chunks(self, pieces: Union[str, Iterable[str]]) -> Iterator[Chunk]:
+        """
+        Lazily chunk text read from a string or a stream of string pieces.
+
+        Args:
+            pieces (Union[str, Iterable[str]]): The text, or an iterable yielding it piece by piece.
+
+        Yields:
+            Chunk: The chunks in source order, with their character offsets in the whole text.
+        """
+        if isinstance(pieces, str):
+            pieces = (pieces,)
+
+        budget = self.budget
+        units: List[_Unit] = []
+        tokens = 0
+        for unit in self._iter_units(pieces):
+            if units and tokens + unit.tokens > budget:
+                # End on the last sentence or paragraph break in the second half of the chunk, if any
+                cut = len(units)
+                running = tokens
+                if not units[-1].is_break:
+                    for index in range(len(units) - 1, 0, -1):
+                        running -= units[index].tokens
+                        if running < budget // 2:
+                            break
+                        if units[index - 1].is_break:
+                            cut = index
+                            break
+
+                yield self._make_chunk(units[:cut])
+
+                # Repeat the trailing units of the emitted chunk, up to chunk_overlap tokens
+                overlap = []
+                overlap_tokens = 0
+                for previous in reversed(units[:cut]):
+                    if overlap_tokens + previous.tokens > self.chunk_overlap:
+                        break
+                    overlap.insert(0, previous)
+                    overlap_tokens += previous.tokens
+
+                units = overlap + units[cut:]
+                tokens = sum(unit.tokens for unit in units)
+                # Give up overlap rather than overflow the next chunk
+                while units and tokens + unit.tokens > budget:
+                    tokens -= units.pop(0).tokens
+
+            units.append(unit)
+            tokens += unit.tokens
+
+        if units:
+            yield self._make_chunk(units)
+
+    def split_text(self, text: str) -> List[str]:
+        """
+        Chunk a text into a list of strings.
+
+        Args:
+            text (str): The text to chunk.
+
+        Returns:
+            List[str]: The chunk texts.
+        """
+        return [chunk.text for chunk in self.iter_chunks(text)]
@@ -1 +1,37 @@
 VECTOR_DB_DIR = "../data/vectorized/"  # directory to store your local vector database
+VECTOR_STORE_BACKEND = "chroma"  # 'chroma' or 'numpy'
+REBUILD_GRACE_PERIOD = 10  # seconds a replaced index version is kept for in-flight queries after a rebuild
+NUMPY_STORE_DTYPE = "float32"  # storage dtype of the numpy backend: 'float32', 'float16' or 'int8'
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"  # also provides the tokenizer chunks are measured with
+CHUNK_SIZE = 256  # tokens per chunk including special tokens; matches the model's input window
+CHUNK_OVERLAP = 32  # tokens repeated between consecutive chunks of a text
+CHUNK_COUNT_BATCH_SIZE = 1024  # words whose tokens are counted per tokenizer call
+
+EMBED_BATCH_SIZE = 512  # number of chunks embedded and written to the vector store per upsert
+EMBED_WORKERS = 1  # processes embedding chunks during ingest; 0 uses every core
+EMBED_THREADS_PER_WORKER = 1  # torch threads per ingest worker, keeps workers * threads within the core count
+EMBED_SHARD_SIZE = 64  # number of chunks sent to an ingest worker at once
+
+EMBEDDING_CACHE_ENABLED = True  # reuse embeddings of previously seen chunks across runs
+EMBEDDING_CACHE_DIR = "../data/embedding_cache/"  # kept outside VECTOR_DB_DIR so resets keep it
+EMBEDDING_CACHE_MAX_ENTRIES = 500000  # least recently used vectors are evicted past this size
+EMBEDDING_CACHE_DTYPE = "float32"  # 'float32' or 'float16'
+
+QUERY_EMBEDDING_CACHE_SIZE = 4096  # number of query embeddings kept in memory
+QUERY_RESULT_CACHE_SIZE = 1024  # number of (query, top_k, filter) results kept in memory
+QUERY_CACHE_TTL = 3600  # seconds before a cached query embedding or result expires
+
+BM25_K1 = 1.5  # BM25 term frequency saturation
+BM25_B = 0.75  # BM25 document length normalization
+HYBRID_ALPHA = 0.5  # weight of the vector score in hybrid queries; the rest goes to BM25
+LEXICAL_CANDIDATE_FACTOR = 10  # hybrid queries rescore top_k * this many BM25 candidates
+SHARD_RRF_K = 60  # rank offset of the reciprocal rank fusion that merges hybrid results across shards
+
+DEDUP_ENABLED = True  # skip ingesting chunks that are near-duplicates of chunks already in the shard
+DEDUP_SCOPE_FIELDS = ("source", "location", "file", "ptype", "topic", "key")  # chunks only duplicate chunks that agree on these filterable fields
+DEDUP_THRESHOLD = 0.8  # estimated Jaccard similarity of word shingles at or above which chunks are near-duplicates
+DEDUP_NUM_PERM = 128  # MinHash permutations per chunk signature
+DEDUP_BANDS = 16  # LSH bands; with 8 rows each, chunks above ~0.7 similarity almost always share a band
+DEDUP_SHINGLE_SIZE = 3  # words per shingle
+DEDUP_SEED = 1  # seed of the MinHash permutations; changing it invalidates stored signatures
@@ -0,0 +1,244 @@
+import os
+import zlib
+import hashlib
+import threading
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+
+from embed.config import DEDUP_NUM_PERM, DEDUP_BANDS, DEDUP_THRESHOLD, DEDUP_SHINGLE_SIZE, DEDUP_SEED
+from embed.lexical import tokenize
+
+# Mersenne prime modulus of the MinHash permutations; coefficients below it keep a*x + b within 64 bits
+MERSENNE_PRIME = (1 << 31) - 1
+
+class NearDuplicateIndex:
+    """
+    A MinHash LSH index that finds near-duplicate chunks of one vector store collection.
+
+    Every chunk is reduced to a MinHash signature over its word shingles,
+    whose agreement rate estimates the Jaccard similarity of two chunks. The
+    signature is cut into bands and chunks sharing any band land in the same
+    bucket, so candidates are found in constant time per chunk instead of by
+    comparing against every stored chunk. Candidates are confirmed by their
+    estimated similarity. Signatures are persisted next to the collection;
+    buckets are rebuilt when the index is opened.
+
+    Every chunk belongs to a scope, and chunks only duplicate chunks of the
+    same scope, so a chunk is never dropped in favour of one that a metadata
+    filter would not return in its place.
+    """
+
+    VERSION = 2
+
+    def __init__(self, path: str, num_perm: int = DEDUP_NUM_PERM, bands: int = DEDUP_BANDS,
+                 threshold: float = DEDUP_THRESHOLD, shingle_size: int = DEDUP_SHINGLE_SIZE, seed: int = DEDUP_SEED):
+        """
+        Initialize the NearDuplicateIndex with the given parameters.
+
+        Args:
+            path (str): The file the index is persisted to.
+            num_perm (int): The number of MinHash permutations, the length of a signature.
+            bands (int): The number of LSH bands the signature is cut into; must divide num_perm.
+            threshold (float): The estimated Jaccard similarity at or above which chunks are near-duplicates.
+            shingle_size (int): The number of consecutive words per shingle.
+            seed (int): The seed of the permutations; signatures are only comparable under the same seed.
+        """
+        if num_perm % bands:
+            raise ValueError(f"bands ({bands}) must divide num_perm ({num_perm}).")
+
+        self.path = path
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.seed = seed
+
+        random_state = np.random.RandomState(seed)
+        self._a = random_state.randint(1, MERSENNE_PRIME, size=num_perm).astype(np.uint64)
+        self._b = random_state.randint(0, MERSENNE_PRIME, size=num_perm).astype(np.uint64)
+
+        self._lock = threading.RLock()
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._scopes: Dict[str, str] = {}
+        self._buckets: List[Dict[bytes, List[str]]] = [{} for _ in range(bands)]
+        self.dirty = False
+        self.exists = self._load()
+
+    def _settings(self) -> list:
+        return [self.VERSION, self.num_perm, self.bands, self.shingle_size, self.seed]
+
+    def _load(self) -> bool:
+        """
+        Load the persisted signatures, if they were written with the same settings.
+
+        Returns:
+            bool: Whether an index was loaded.
+        """
+        if not os.path.exists(self.path):
+            return False
+
+        try:
+            with np.load(self.path, allow_pickle=False) as state:
+                if state["settings"].tolist() != self._settings():
+                    return False
+                ids, scopes, signatures = state["ids"].tolist(), state["scopes"].tolist(), state["signatures"]
+        except (IOError, ValueError, KeyError):
+            return False
+
+        for doc_id, scope, signature in zip(ids, scopes, signatures):
+            self._insert(doc_id, signature, scope)
+        return True
+
+    def save(self):
+        """
+        Atomically persist the signatures if they changed since the last save.
+        """
+        with self._lock:
+            if not self.dirty:
+                return
+
+            ids = list(self._signatures)
+            signatures = (np.stack([self._signatures[doc_id] for doc_id in ids]) if ids
+                          else np.zeros((0, self.num_perm), dtype=np.uint32))
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.tmp.npz"
+            np.savez(tmp_path, settings=np.asarray(self._settings()), ids=np.asarray(ids, dtype=str),
+                     scopes=np.asarray([self._scopes[doc_id] for doc_id in ids], dtype=str), signatures=signatures)
+            os.replace(tmp_path, self.path)
+            self.dirty = False
+            self.exists = True
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """
+        Compute the MinHash signature of a text.
+
+        Args:
+            text (str): The text.
+
+        Returns:
+            Optional[np.ndarray]: The signature, or None for a text without words.
+        """
+        tokens = tokenize(text)
+        if not tokens:
+            return None
+        size = min(self.shingle_size, len(tokens))
+        shingles = {" ".join(tokens[start:start + size]) for start in range(len(tokens) - size + 1)}
+        hashes = np.fromiter((zlib.crc32(shingle.encode("utf-8")) for shingle in shingles),
+                             dtype=np.uint64, count=len(shingles))
+        permuted = (np.outer(self._a, hashes) + self._b[:, None]) % np.uint64(MERSENNE_PRIME)
+        return permuted.min(axis=1).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray, scope: str) -> List[bytes]:
+        # Buckets are per scope, so chunks of other scopes are never candidates
+        prefix = hashlib.blake2b(scope.encode("utf-8"), digest_size=8).digest()
+        return [prefix + signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def _insert(self, doc_id: str, signature: np.ndarray, scope: str):
+        self._signatures[doc_id] = signature
+        self._scopes[doc_id] = scope
+        for buckets, key in zip(self._buckets, self._band_keys(signature, scope)):
+            buckets.setdefault(key, []).append(doc_id)
+
+    def find(self, signature: Optional[np.ndarray], scope: str = "") -> Optional[str]:
+        """
+        Find the indexed chunk of a scope most similar to a signature, if it is a near-duplicate.
+
+        Args:
+            signature (Optional[np.ndarray]): The signature of a chunk.
+            scope (str): The scope of the chunk.
+
+        Returns:
+            Optional[str]: The id of the representative chunk, or None.
+        """
+        if signature is None:
+            return None
+
+        with self._lock:
+            candidates = set()
+            for buckets, key in zip(self._buckets, self._band_keys(signature, scope)):
+                candidates.update(buckets.get(key, ()))
+
+            best_id, best_similarity = None, self.threshold
+            for doc_id in candidates:
+                stored = self._signatures.get(doc_id)
+                if stored is None or self._scopes.get(doc_id) != scope:
+                    continue
+                similarity = float(np.mean(stored == signature))
+                if similarity >= best_similarity:
+                    best_id, best_similarity = doc_id, similarity
+            return best_id
+
+    def claim(self, doc_id: str, text: str, scope: str = "") -> Optional[str]:
+        """
+        Index a chunk unless it is a near-duplicate of an indexed one of the same scope.
+
+        Args:
+            doc_id (str): The chunk id.
+            text (str): The chunk text.
+            scope (str): The scope of the chunk.
+
+        Returns:
+            Optional[str]: The id of the chunk it duplicates, or None if it was indexed as a representative.
+        """
+        with self._lock:
+            if doc_id in self._signatures:
+                return None
+            signature = self.signature(text)
+            duplicate_of = self.find(signature, scope)
+            if duplicate_of is None and signature is not None:
+                self._insert(doc_id, signature, scope)
+                self.dirty = True
+            return duplicate_of
+
+    def add(self, doc_ids: Iterable[str], texts: Iterable[str], scopes: Iterable[str] = None):
+        """
+        Index chunks as they are, whether or not they duplicate each other.
+
+        Args:
+            doc_ids (Iterable[str]): The chunk ids; ids already indexed are skipped.
+            texts (Iterable[str]): The chunk texts.
+            scopes (Iterable[str]): The scope of every chunk; all chunks share one scope if omitted.
+        """
+        doc_ids = list(doc_ids)
+        scopes = [""] * len(doc_ids) if scopes is None else scopes
+        with self._lock:
+            for doc_id, text, scope in zip(doc_ids, texts, scopes):
+                if doc_id in self._signatures:
+                    continue
+                signature = self.signature(text)
+                if signature is not None:
+                    self._insert(doc_id, signature, scope)
+                    self.dirty = True
+
+    def ids(self) -> Set[str]:
+        """
+        Get the ids of the indexed chunks.
+
+        Returns:
+            Set[str]: The chunk ids.
+        """
+        with self._lock:
+            return set(self._signatures)
+
+    def remove(self, doc_ids: Iterable[str]):
+        """
+        Remove chunks from the index.
+
+        Args:
+            doc_ids (Iterable[str]): The ids of the chunks to remove.
+        """
+        with self._lock:
+            for doc_id in doc_ids:
+                signature = self._signatures.pop(doc_id, None)
+                if signature is None:
+                    continue
+                scope = self._scopes.pop(doc_id)
+                for buckets, key in zip(self._buckets, self._band_keys(signature, scope)):
+                    bucket = buckets.get(key)
+                    if bucket is not None:
+                        bucket.remove(doc_id)
+                        if not bucket:
+                            del buckets[key]
+                self.dirty = True
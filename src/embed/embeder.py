@@ -1,107 +1,838 @@
+from __future__ import annotations
+
 import os
+import json
+import time
 import shutil
-from langchain.schema import Document
-from langchain_chroma import Chroma
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
+import logging
+import hashlib
+import threading
+import numpy as np
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
 from storage.storage import JSONDataManager
 from storage.config import SIXTEEN_PERSONALITIES_LOC, CLEANSED, CHATGPT_PERSONALITIES_LOC, CHATGPT_TOPIC_DETAILS_LOC
-from embed.config import VECTOR_DB_DIR
+from embed.config import (VECTOR_DB_DIR, VECTOR_STORE_BACKEND, EMBEDDING_MODEL, CHUNK_SIZE, CHUNK_OVERLAP,
+                          EMBED_BATCH_SIZE, EMBED_WORKERS, EMBEDDING_CACHE_ENABLED, QUERY_EMBEDDING_CACHE_SIZE,
+                          QUERY_RESULT_CACHE_SIZE, QUERY_CACHE_TTL, HYBRID_ALPHA, LEXICAL_CANDIDATE_FACTOR,
+                          SHARD_RRF_K, REBUILD_GRACE_PERIOD, DEDUP_ENABLED,
+                          DEDUP_SCOPE_FIELDS)
+from embed.cache import LRUCache
+from embed.dedup import NearDuplicateIndex
+from embed.chunker import TokenChunker
+from embed.lexical import InvertedIndex
+
+# LangChain, Chroma and the embedding model are imported on first use so that
+# importing this module and constructing the classes below stays cheap.
+if TYPE_CHECKING:
+    from langchain.schema import Document
+
+def build_filter(filter: dict = None, **fields) -> dict:
+    """
+    Combine a metadata filter with field conditions into one vector store filter.
+
+    Fields set to None are ignored, and list or tuple values match any of their items.
+    
+    Args:
+        filter (dict): An optional filter in Chroma's where syntax.
+        **fields: Metadata fields to match, such as source, ptype, topic or key.
+    
+    Returns:
+        dict: The combined filter, or None if there is no condition.
+    """
+    conditions = [filter] if filter else []
+    for field, value in fields.items():
+        if value is None:
+            continue
+        if isinstance(value, (list, tuple, set)):
+            conditions.append({field: {"$in": list(value)}})
+        else:
+            conditions.append({field: value})
+
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
 
 class VectorStore:
     """
     A class to manage vector store operations.
+
+    The index lives in a versioned subdirectory of `persist_directory`, named
+    by the CURRENT pointer file next to it. Rebuilds write a new version while
+    the current one keeps serving queries, then atomically repoint CURRENT and
+    remove the old version. Directories written before versioning are served
+    in place until their first rebuild.
     """
 
-    def __init__(self, persist_directory: str, collection_name: str = "documents", embedding_function = None):
+    POINTER_FILE = "CURRENT"
+    # Hybrid fused scores lie in [0, 1]; dense fill-ins are shifted below them by this offset
+    FILL_IN_OFFSET = 2
+
+    def __init__(self, persist_directory: Optional[str], collection_name: str = "documents", embedding_function = None,
+                 backend: str = VECTOR_STORE_BACKEND, version: str = None):
         """
         Initialize the VectorStore with the given parameters.
         
         Args:
-            persist_directory (str): The directory to persist the vector store.
+            persist_directory (Optional[str]): The directory to persist the vector store. It is owned by the store.
+                None leaves the store without an index, for subclasses that only embed for other stores.
             collection_name (str): The name of the collection in the vector store.
             embedding_function: The function to generate embeddings.
+            backend (str): The vector store backend: 'chroma' or 'numpy'.
+            version (str): The index version to open; defaults to the one named by the CURRENT pointer.
         """
+        if backend not in ("chroma", "numpy"):
+            raise ValueError(f"Invalid backend '{backend}'. Valid options are: ['chroma', 'numpy']")
+
         self.persist_directory = persist_directory
         self.collection_name = collection_name
-        self.embedding_function = embedding_function
+        self.backend = backend
+        self.version = version if version is not None else self._read_version()
+
+        # Repeated queries skip the model forward pass and, until the collection changes, the search itself
+        self.query_embedding_cache = LRUCache(QUERY_EMBEDDING_CACHE_SIZE, ttl=QUERY_CACHE_TTL)
+        self.query_result_cache = LRUCache(QUERY_RESULT_CACHE_SIZE, ttl=QUERY_CACHE_TTL)
+
+        # The embedding function, vector store, lexical index and near-duplicate index are created on first use
+        self._embedding_function = embedding_function
+        self._vectorstore = None
+        self._lexical_index = None
+        self._dedup_index = None
+        self._init_lock = threading.RLock()
+
+        # Rebuilds of this store run one at a time; versions being built are kept out of garbage collection
+        self._rebuild_executor = None
+        self._staging_versions = set()
+
+    @property
+    def directory(self) -> str:
+        """
+        The directory of the index version currently served.
+        """
+        return os.path.join(self.persist_directory, self.version) if self.version else self.persist_directory
+
+    def _read_version(self) -> str:
+        """
+        Read the version named by the CURRENT pointer file.
+        
+        Returns:
+            str: The current version, or None for an unversioned directory.
+        """
+        if self.persist_directory is None:
+            return None
+        try:
+            with open(os.path.join(self.persist_directory, self.POINTER_FILE), "r", encoding="utf-8") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    @property
+    def embedding_function(self):
+        """
+        The embedding function, created on first access.
+        """
+        if self._embedding_function is None:
+            with self._init_lock:
+                if self._embedding_function is None:
+                    self._embedding_function = self._create_embedding_function()
+        return self._embedding_function
+
+    @property
+    def vectorstore(self):
+        """
+        The backend vector store, opened on first access.
+        """
+        if self._vectorstore is None:
+            self._require_directory()
+            with self._init_lock:
+                if self._vectorstore is None:
+                    os.makedirs(self.directory, exist_ok=True)
+                    self._vectorstore = self._create_vectorstore()
+        return self._vectorstore
+
+    def _require_directory(self):
+        """
+        Raise if the store has no persist directory to hold an index.
+        """
+        if self.persist_directory is None:
+            raise ValueError(f"This {type(self).__name__} has no persist directory; pass the store to write to.")
+
+    @property
+    def lexical_index(self) -> InvertedIndex:
+        """
+        The BM25 index kept alongside the vector store, opened on first access.
+        """
+        if self._lexical_index is None:
+            with self._init_lock:
+                if self._lexical_index is None:
+                    self._lexical_index = self._create_lexical_index()
+        return self._lexical_index
+
+    @property
+    def dedup_index(self) -> NearDuplicateIndex:
+        """
+        The MinHash index of near-duplicate chunks kept alongside the vector store, opened on first access.
+        """
+        if self._dedup_index is None:
+            with self._init_lock:
+                if self._dedup_index is None:
+                    self._dedup_index = self._create_dedup_index()
+        return self._dedup_index
+
+    def warmup(self):
+        """
+        Load the embedding model, open the stores and run one query embedding,
+        so the first real query is served at full speed.
+        """
+        if self.embedding_function is not None:
+            self.embedding_function.embed_query("warmup")
+        _ = self.vectorstore
+        _ = self.lexical_index
+
+    def _create_embedding_function(self):
+        """
+        Create the embedding function when none was given.
+        
+        Returns:
+            The embedding function, or None to leave embedding to the backend.
+        """
+        return None
+
+    def _create_lexical_index(self) -> InvertedIndex:
+        """
+        Open the BM25 index of the collection, building it from the stored documents if it is missing or stale.
+        
+        Returns:
+            InvertedIndex: The lexical index.
+        """
+        lexical_index = InvertedIndex(os.path.join(self.directory, f"{self.collection_name}.bm25.pkl"))
+        stored = self._unindexed(lexical_index, include=["documents"])
+        if stored["ids"]:
+            lexical_index.add(stored["ids"], stored["documents"])
+        lexical_index.save()
+        return lexical_index
+
+    def _create_dedup_index(self) -> NearDuplicateIndex:
+        """
+        Open the near-duplicate index of the collection, building it from the stored documents if it is missing or stale.
+        
+        Returns:
+            NearDuplicateIndex: The near-duplicate index.
+        """
+        dedup_index = NearDuplicateIndex(os.path.join(self.directory, f"{self.collection_name}.minhash.npz"))
+        stored = self._unindexed(dedup_index, include=["documents", "metadatas"])
+        if stored["ids"]:
+            dedup_index.add(stored["ids"], stored["documents"],
+                            [self.dedup_scope(metadata) for metadata in stored["metadatas"]])
+        dedup_index.save()
+        return dedup_index
 
-        # Ensure the vector database directory exists
-        os.makedirs(self.persist_directory, exist_ok=True)
+    def _unindexed(self, index, include: List[str]) -> dict:
+        """
+        Drop ids the store no longer holds from a persisted index and fetch the stored documents it is missing,
+        such as those written by a process that stopped before saving the index.
+        
+        Args:
+            index: The InvertedIndex or NearDuplicateIndex opened from disk.
+            include (List[str]): The fields to fetch for the missing documents.
+        
+        Returns:
+            dict: The ids and requested fields of the stored documents missing from the index.
+        """
+        if not index.exists:
+            return self.vectorstore.get(include=include)
+
+        stored_ids = set(self.vectorstore.get(include=[])["ids"])
+        indexed_ids = index.ids()
+        index.remove(indexed_ids - stored_ids)
+        # Chunks too short for a MinHash signature are never indexed and are fetched again on every open
+        missing = sorted(stored_ids - indexed_ids)
+        if not missing:
+            return {"ids": []}
+        return self.vectorstore.get(ids=missing, include=include)
+
+    @staticmethod
+    def dedup_scope(metadata: Optional[dict]) -> str:
+        """
+        The scope within which a chunk may be a near-duplicate: the filterable metadata fields it was stored with.
+        
+        Args:
+            metadata (Optional[dict]): The chunk metadata.
+        
+        Returns:
+            str: The scope of the chunk.
+        """
+        metadata = metadata or {}
+        return json.dumps([metadata.get(field) for field in DEDUP_SCOPE_FIELDS])
 
-        # Initialize the vector store
-        self.vectorstore = Chroma(
+    def _create_vectorstore(self):
+        """
+        Create the backend vector store for the persist directory.
+        
+        Returns:
+            The Chroma or NumpyVectorStore instance.
+        """
+        if self.backend == "numpy":
+            from embed.numpy_store import NumpyVectorStore
+            return NumpyVectorStore(
+                persist_directory=self.directory,
+                collection_name=self.collection_name,
+                embedding_function=self.embedding_function
+            )
+
+        from langchain_chroma import Chroma
+        return Chroma(
             collection_name=self.collection_name,
-            persist_directory=self.persist_directory,
+            persist_directory=self.directory,
             embedding_function=self.embedding_function
         )
 
-    def add_documents(self, docs: list):
+    def add_documents(self, docs: list, ids: list = None, save: bool = True):
         """
         Add documents to the vector store.
         
         Args:
             docs (list): A list of documents to add.
+            ids (list): Optional ids for the documents. Existing ids are overwritten.
+            save (bool): Whether to persist the lexical and near-duplicate indexes; batch writers save once at the end.
+        """
+        if ids is None:
+            ids = self.vectorstore.add_documents(docs)
+        else:
+            self.vectorstore.add_documents(docs, ids=ids)
+        self.lexical_index.add(ids, [doc.page_content for doc in docs])
+        self.dedup_index.add(ids, [doc.page_content for doc in docs], [self.dedup_scope(doc.metadata) for doc in docs])
+        self.query_result_cache.clear()
+        if save:
+            self.save()
+
+    def add_embeddings(self, ids: list, docs: list, embeddings: List[List[float]], save: bool = True):
+        """
+        Upsert documents whose embeddings were computed by the caller.
+        
+        Args:
+            ids (list): The ids of the documents. Existing ids are overwritten.
+            docs (list): The documents to add.
+            embeddings (List[List[float]]): One embedding per document.
+            save (bool): Whether to persist the lexical and near-duplicate indexes; batch writers save once at the end.
+        """
+        texts = [doc.page_content for doc in docs]
+        metadatas = [doc.metadata for doc in docs]
+        if self.backend == "numpy":
+            self.vectorstore.add_embeddings(texts, embeddings, metadatas, ids=ids)
+        else:
+            self.vectorstore._collection.upsert(ids=ids, embeddings=embeddings, documents=texts,
+                                                metadatas=metadatas if any(metadatas) else None)
+        self.lexical_index.add(ids, texts)
+        self.dedup_index.add(ids, texts, [self.dedup_scope(metadata) for metadata in metadatas])
+        self.query_result_cache.clear()
+        if save:
+            self.save()
+
+    def get_ids(self, where: dict = None) -> set:
+        """
+        Get the ids of the documents stored in the vector store.
+        
+        Args:
+            where (dict): Optional metadata filter restricting the returned ids.
+        
+        Returns:
+            set: The matching document ids.
         """
-        self.vectorstore.add_documents(docs)
+        return set(self.vectorstore.get(where=where, include=[])["ids"])
+
+    def get_embeddings(self, ids: Iterable[str]) -> Dict[str, List[float]]:
+        """
+        Get the stored embeddings of documents.
+        
+        Args:
+            ids (Iterable[str]): The document ids; ids that are not stored are left out of the result.
+        
+        Returns:
+            Dict[str, List[float]]: The embedding of every stored document, by id.
+        """
+        ids = list(ids)
+        if not ids:
+            return {}
+        result = self.vectorstore.get(ids=ids, include=["embeddings"])
+        return dict(zip(result["ids"], result["embeddings"]))
+
+    def get_file_ids(self, where: dict = None) -> Dict[str, set]:
+        """
+        Get the ids of the documents stored in the vector store, grouped by the file they were chunked from.
+        
+        Args:
+            where (dict): Optional metadata filter restricting the returned ids.
+        
+        Returns:
+            Dict[str, set]: The matching document ids of every file.
+        """
+        result = self.vectorstore.get(where=where, include=["metadatas"])
+        files: Dict[str, set] = {}
+        for doc_id, metadata in zip(result["ids"], result["metadatas"]):
+            files.setdefault((metadata or {}).get("file"), set()).add(doc_id)
+        return files
+
+    def delete(self, ids: list, batch_size: int = EMBED_BATCH_SIZE, save: bool = True):
+        """
+        Delete documents from the vector store.
+        
+        Args:
+            ids (list): The ids of the documents to delete.
+            batch_size (int): The number of ids deleted per call.
+            save (bool): Whether to persist the lexical and near-duplicate indexes; batch writers save once at the end.
+        """
+        ids = list(ids)
+        for start in range(0, len(ids), batch_size):
+            self.vectorstore.delete(ids=ids[start:start + batch_size])
+        self.lexical_index.remove(ids)
+        self.dedup_index.remove(ids)
+        self.query_result_cache.clear()
+        if save:
+            self.save()
+
+    def save(self):
+        """
+        Persist index state that is not written on every change, such as the lexical and near-duplicate indexes.
+        """
+        self.lexical_index.save()
+        self.dedup_index.save()
 
     def reset(self):
         """
         Reset the vector database.
-        """
-        shutil.rmtree(self.persist_directory, ignore_errors=True)
-        os.makedirs(self.persist_directory, exist_ok=True)
 
-        # Reinitialize the vector store
-        self.vectorstore = Chroma(
-            collection_name=self.collection_name,
-            persist_directory=self.persist_directory,
-            embedding_function=self.embedding_function
-        )
+        An empty version is swapped in, so queries are answered throughout and
+        no open client is left on deleted files.
+        """
+        self.rebuild(background=False)
         print(f"Vector store at '{self.persist_directory}' has been reset.")
 
-    def query(self, query: str, top_k: int = 5):
+    def rebuild(self, build: Callable[[VectorStore], Any] = None, background: bool = True) -> Future:
+        """
+        Build a new version of the index and atomically swap it in.
+
+        The build function fills a staging store that writes to a fresh version
+        directory; the current version keeps serving queries until the swap.
+        The old version is closed and deleted after REBUILD_GRACE_PERIOD
+        seconds, once in-flight queries on it have finished.
+        
+        Args:
+            build (Callable[[VectorStore], Any]): A function that fills the staging store; None swaps in an
+                empty index.
+            background (bool): Whether to return immediately instead of waiting for the swap.
+        
+        Returns:
+            Future: Resolves to the new version once it is served.
+        """
+        self._require_directory()
+        with self._init_lock:
+            if self._rebuild_executor is None:
+                self._rebuild_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rebuild")
+            version = f"v{time.strftime('%Y%m%d%H%M%S')}-{os.urandom(3).hex()}"
+            self._staging_versions.add(version)
+
+        def run():
+            try:
+                staging = VectorStore(self.persist_directory, collection_name=self.collection_name,
+                                      embedding_function=self._embedding_function, backend=self.backend,
+                                      version=version)
+                if build is not None:
+                    build(staging)
+                # Open the staging index so the swap hands over a ready store
+                _ = staging.vectorstore
+                _ = staging.lexical_index
+                _ = staging.dedup_index
+                staging.save()
+                self._swap(staging)
+                return version
+            finally:
+                with self._init_lock:
+                    self._staging_versions.discard(version)
+
+        future = self._rebuild_executor.submit(run)
+        if not background:
+            future.result()
+        return future
+
+    def _swap(self, staging: VectorStore):
+        """
+        Atomically point CURRENT at a fully built staging store and start serving it.
+        """
+        pointer = os.path.join(self.persist_directory, self.POINTER_FILE)
+        with open(f"{pointer}.tmp", "w", encoding="utf-8") as f:
+            f.write(staging.version)
+            f.flush()
+            os.fsync(f.fileno())
+
+        with self._init_lock:
+            os.replace(f"{pointer}.tmp", pointer)
+            old_store = self._vectorstore
+            self.version = staging.version
+            self._vectorstore, self._lexical_index = staging._vectorstore, staging._lexical_index
+            self._dedup_index = staging._dedup_index
+            self.query_result_cache.clear()
+
+        collector = threading.Timer(REBUILD_GRACE_PERIOD, self._collect_garbage, args=(old_store,))
+        collector.daemon = True
+        collector.start()
+
+    def _collect_garbage(self, old_store=None):
+        """
+        Close a replaced backend store and delete every version that is neither served nor being built.
+        
+        Args:
+            old_store: The replaced backend store to close, if any.
+        """
+        # Chroma keeps the database of a path open until its client is closed
+        close = getattr(getattr(old_store, "_client", None), "close", None)
+        if close is not None:
+            try:
+                close()
+            except Exception as e:
+                logging.error(f"Error closing the replaced vector store: {e}")
+
+        with self._init_lock:
+            keep = {self.version, self.POINTER_FILE, f"{self.POINTER_FILE}.tmp"} | self._staging_versions
+            for name in os.listdir(self.persist_directory):
+                if name in keep:
+                    continue
+                path = os.path.join(self.persist_directory, name)
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    os.remove(path)
+
+    def embed_query(self, query: str) -> List[float]:
+        """
+        Embed a query string, reusing the embedding of a recently seen identical query.
+        
+        Args:
+            query (str): The query string.
+        
+        Returns:
+            List[float]: The query embedding.
+        """
+        embedding = self.query_embedding_cache.get(query)
+        if embedding is None:
+            embedding = self.embedding_function.embed_query(query)
+            self.query_embedding_cache.put(query, embedding)
+        return embedding
+
+    def query(self, query: str, top_k: int = 5, filter: dict = None, mode: str = "dense"):
         """
         Query the vector store.
+
+        Results are cached per (query, top_k, filter, mode) until the collection
+        is changed through add_documents, delete or reset.
         
         Args:
             query (str): The query string.
             top_k (int): The number of top results to return.
+            filter (dict): Optional metadata filter applied by the vector store.
+            mode (str): 'dense' for vector search only, or 'hybrid' to fuse BM25 and vector scores.
         
         Returns:
             list: The top_k results from the vector store.
         """
-        return self.vectorstore.similarity_search(query, k=top_k)
+        return [doc for doc, _ in self.search(query, top_k=top_k, filter=filter, mode=mode)]
+
+    def search(self, query: str, embedding: List[float] = None, top_k: int = 5, filter: dict = None,
+               mode: str = "dense") -> List[Tuple[Document, float]]:
+        """
+        Search the vector store and return scored results.
+
+        Dense scores grow with similarity and are comparable between stores of
+        the same backend and embedding model. Hybrid scores only order the
+        results of one store. Results share the cache used by query.
+        
+        Args:
+            query (str): The query string.
+            embedding (List[float]): The query embedding, if the caller already computed it.
+            top_k (int): The number of top results to return.
+            filter (dict): Optional metadata filter applied by the vector store.
+            mode (str): 'dense' for vector search only, or 'hybrid' to fuse BM25 and vector scores.
+        
+        Returns:
+            List[Tuple[Document, float]]: (document, score) pairs, best first.
+        """
+        if mode not in ("dense", "hybrid"):
+            raise ValueError(f"Invalid mode '{mode}'. Valid options are: ['dense', 'hybrid']")
+
+        cache_key = (query, top_k, json.dumps(filter, sort_keys=True), mode)
+        results = self.query_result_cache.get(cache_key)
+        if results is None:
+            if embedding is None:
+                embedding = self.embed_query(query)
+            if mode == "hybrid":
+                results = self._hybrid_search(query, embedding, top_k, filter)
+            else:
+                results = self._search_many([embedding], top_k, filter)[0]
+            self.query_result_cache.put(cache_key, results)
+        return list(results)
+
+    def _hybrid_search(self, query: str, embedding: List[float], top_k: int,
+                       filter: dict = None) -> List[Tuple[Document, float]]:
+        """
+        Rank documents by a weighted fusion of BM25 and cosine scores.
+
+        BM25 picks a small candidate set from the lexical index, and only those
+        candidates are scored against the query embedding. If the lexical index
+        yields fewer than top_k candidates, dense search fills the remainder.
+        
+        Args:
+            query (str): The query string.
+            embedding (List[float]): The query embedding.
+            top_k (int): The number of top results to return.
+            filter (dict): Optional metadata filter applied to the candidates.
+        
+        Returns:
+            List[Tuple[Document, float]]: The top_k (document, score) pairs, best first.
+        """
+        from langchain.schema import Document
+        # With a filter, BM25 only ranks the matching documents so that its candidates are not all filtered out
+        allowed = self.get_ids(where=filter) if filter else None
+        lexical_hits = dict(self.lexical_index.search(query, k=top_k * LEXICAL_CANDIDATE_FACTOR, allowed=allowed))
+        results = []
+
+        if lexical_hits:
+            candidates = self.vectorstore.get(
+                ids=list(lexical_hits),
+                where=filter,
+                include=["embeddings", "documents", "metadatas"]
+            )
+
+            if candidates["ids"]:
+                vectors = np.asarray(candidates["embeddings"], dtype=np.float32)
+                query_vector = np.asarray(embedding, dtype=np.float32)
+                norms = np.linalg.norm(vectors, axis=1) * (np.linalg.norm(query_vector) or 1)
+                dense = vectors @ query_vector / np.where(norms == 0, 1, norms)
+                lexical = np.asarray([lexical_hits[doc_id] for doc_id in candidates["ids"]], dtype=np.float32)
+
+                # Min-max normalize both score sets over the candidates before weighting them
+                def normalize(scores):
+                    spread = scores.max() - scores.min()
+                    return (scores - scores.min()) / spread if spread > 0 else np.ones_like(scores)
+
+                fused = HYBRID_ALPHA * normalize(dense) + (1 - HYBRID_ALPHA) * normalize(lexical)
+                for index in np.argsort(-fused)[:top_k]:
+                    results.append((Document(
+                        id=candidates["ids"][index],
+                        page_content=candidates["documents"][index],
+                        metadata=candidates["metadatas"][index] or {}
+                    ), float(fused[index])))
+
+        if len(results) < top_k:
+            # Dense fill-ins rank below every fused candidate
+            seen = {doc.id for doc, _ in results}
+            for doc, score in self._search_many([embedding], top_k * 2, filter)[0]:
+                if len(results) >= top_k:
+                    break
+                if doc.id not in seen:
+                    results.append((doc, score - self.FILL_IN_OFFSET))
+        return results
+
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """
+        Embed several query strings, running the model once on all uncached queries.
+        
+        Args:
+            queries (List[str]): The query strings.
+        
+        Returns:
+            List[List[float]]: One embedding per query, in input order.
+        """
+        embeddings = {query: self.query_embedding_cache.get(query) for query in queries}
+        missing = [query for query, embedding in embeddings.items() if embedding is None]
+
+        if missing:
+            embed_batch = getattr(self.embedding_function, "embed_queries", self.embedding_function.embed_documents)
+            for query, embedding in zip(missing, embed_batch(missing)):
+                self.query_embedding_cache.put(query, embedding)
+                embeddings[query] = embedding
+        return [embeddings[query] for query in queries]
+
+    def _search_many(self, embeddings: List[List[float]], top_k: int,
+                     filter: dict = None) -> List[List[Tuple[Document, float]]]:
+        """
+        Search the vector store for several query embeddings in one backend call.
+        
+        Args:
+            embeddings (List[List[float]]): The query embeddings.
+            top_k (int): The number of top results per query.
+            filter (dict): Optional metadata filter applied by the vector store.
+        
+        Returns:
+            List[List[Tuple[Document, float]]]: The top_k (document, score) pairs of each query, in input order.
+        """
+        if self.backend == "numpy":
+            return self.vectorstore.similarity_search_by_vectors_with_scores(embeddings, k=top_k, filter=filter)
+
+        # Chroma answers a batch of query embeddings in a single collection query
+        from langchain.schema import Document
+        response = self.vectorstore._collection.query(
+            query_embeddings=embeddings,
+            n_results=top_k,
+            where=filter,
+            include=["documents", "metadatas", "distances"]
+        )
+        return [
+            [
+                (Document(id=doc_id, page_content=text, metadata=metadata or {}), -distance)
+                for doc_id, text, metadata, distance in zip(ids, texts, metadatas, distances)
+            ]
+            for ids, texts, metadatas, distances in zip(response["ids"], response["documents"],
+                                                        response["metadatas"], response["distances"])
+        ]
+
+    def query_many(self, queries: List[str], top_k: int = 5, filter: dict = None) -> List[list]:
+        """
+        Query the vector store with several query strings at once.
+
+        Uncached queries are embedded in one model batch and searched in one
+        backend call. Results share the cache used by query.
+        
+        Args:
+            queries (List[str]): The query strings.
+            top_k (int): The number of top results per query.
+            filter (dict): Optional metadata filter applied by the vector store.
+        
+        Returns:
+            List[list]: The top_k results of each query, in input order.
+        """
+        return [[doc for doc, _ in hits] for hits in self.search_many(queries, top_k=top_k, filter=filter)]
+
+    def search_many(self, queries: List[str], embeddings: List[List[float]] = None, top_k: int = 5,
+                    filter: dict = None) -> List[List[Tuple[Document, float]]]:
+        """
+        Search the vector store with several query strings at once and return scored results.
+        
+        Args:
+            queries (List[str]): The query strings.
+            embeddings (List[List[float]]): The query embeddings, if the caller already computed them.
+            top_k (int): The number of top results per query.
+            filter (dict): Optional metadata filter applied by the vector store.
+        
+        Returns:
+            List[List[Tuple[Document, float]]]: The (document, score) pairs of each query, best first.
+        """
+        filter_key = json.dumps(filter, sort_keys=True)
+        results = {query: self.query_result_cache.get((query, top_k, filter_key, "dense")) for query in queries}
+        missing = [query for query, hits in results.items() if hits is None]
+
+        if missing:
+            if embeddings is None:
+                missing_embeddings = self.embed_queries(missing)
+            else:
+                given = dict(zip(queries, embeddings))
+                missing_embeddings = [given[query] for query in missing]
+            for query, hits in zip(missing, self._search_many(missing_embeddings, top_k, filter)):
+                self.query_result_cache.put((query, top_k, filter_key, "dense"), hits)
+                results[query] = hits
+        return [list(results[query]) for query in queries]
 
 class Embedder(VectorStore):
     """
     A class to handle embedding and storing text.
     """
 
-    def __init__(self, model_name: str, chunk_size: int, chunk_overlap: int, persist_directory: str):
+    def __init__(self, model_name: str, chunk_size: int, chunk_overlap: int, persist_directory: str = None,
+                 use_cache: bool = EMBEDDING_CACHE_ENABLED, backend: str = VECTOR_STORE_BACKEND,
+                 workers: int = EMBED_WORKERS):
         """
         Initialize the Embedder with the given parameters.
         
         Args:
             model_name (str): The name of the embedding model.
-            chunk_size (int): The size of each text chunk.
-            chunk_overlap (int): The overlap between text chunks.
-            persist_directory (str): The directory to persist the vector store.
+            chunk_size (int): The maximum number of model tokens per chunk.
+            chunk_overlap (int): The number of tokens repeated between consecutive chunks.
+            persist_directory (str): The directory to persist the vector store, or None for an embedder that
+                only chunks and embeds for the stores passed to sync_documents.
+            use_cache (bool): Whether to serve previously computed embeddings from the on-disk cache.
+            backend (str): The vector store backend: 'chroma' or 'numpy'.
+            workers (int): The number of processes embedding chunks during ingest, or 0 to use every core.
         """
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
         self.model_name = model_name
+        self.use_cache = use_cache
+        self.workers = workers
+        self._chunker = None
+        self._embedding_cache = None
+        self._parallel_embeddings = None
+        self._ingest_embedding_function = None
 
-        # Initialize the embedding function
-        self.embedding_function = HuggingFaceEmbeddings(model_name=self.model_name)
+        # The embedding model is loaded on first use by _create_embedding_function
+        super().__init__(persist_directory, backend=backend)
 
-        # Pass the embedding function and other params to the base class
-        super().__init__(persist_directory, embedding_function=self.embedding_function)
+    def _create_embedding_function(self):
+        """
+        Load the embedding model, optionally behind the persistent cache.
+        
+        Returns:
+            The embedding function.
+        """
+        from langchain_huggingface import HuggingFaceEmbeddings
+        return self._with_cache(HuggingFaceEmbeddings(model_name=self.model_name))
+
+    def _with_cache(self, embedding_function):
+        """
+        Put an embedding function behind the persistent cache shared by this embedder, if enabled.
+        
+        Args:
+            embedding_function: The embedding function to wrap.
+        
+        Returns:
+            The cached embedding function, or `embedding_function` when caching is disabled.
+        """
+        if not self.use_cache:
+            return embedding_function
+
+        from embed.cache import EmbeddingCache, CachedEmbeddings
+        with self._init_lock:
+            if self._embedding_cache is None:
+                self._embedding_cache = EmbeddingCache.open(self.model_name)
+        return CachedEmbeddings(embedding_function, self._embedding_cache)
+
+    @property
+    def ingest_embedding_function(self):
+        """
+        The embedding function used to embed chunks during ingest.
+
+        With more than one worker, chunks are sharded across a process pool
+        that is started on first use; otherwise this is the query embedding function.
+        """
+        if self.workers == 1:
+            return self.embedding_function
+
+        if self._ingest_embedding_function is None:
+            from embed.parallel import ParallelEmbeddings
+            self._parallel_embeddings = ParallelEmbeddings(self.model_name, workers=self.workers)
+            self._ingest_embedding_function = self._with_cache(self._parallel_embeddings)
+        return self._ingest_embedding_function
+
+    def close(self):
+        """
+        Shut down the ingest worker pool, if one was started.
+        """
+        if self._parallel_embeddings is not None:
+            self._parallel_embeddings.close()
+            self._parallel_embeddings = None
+            self._ingest_embedding_function = None
+
+    @property
+    def chunker(self) -> TokenChunker:
+        """
+        The chunker, built once on first use and reused for every text.
+        """
+        if self._chunker is None:
+            self._chunker = TokenChunker(self.model_name, chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap)
+        return self._chunker
 
     def chunk_text(self, text: str) -> list:
         """
-        Chunk the text into smaller pieces using LangChain's character splitter.
+        Chunk the text into pieces that fit the embedding model's token window.
         
         Args:
             text (str): The text to chunk.
@@ -109,100 +840,569 @@ class Embedder(VectorStore):
         Returns:
             list: A list of text chunks.
         """
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=self.chunk_size,
-            chunk_overlap=self.chunk_overlap,
-            length_function=len
-        )
-        return text_splitter.split_text(text)
+        return self.chunker.split_text(text)
 
-    def embed_and_store(self, text: str):
+    def embed_and_store(self, text: str, metadata: dict = None):
         """
         Chunk, embed, and store text.
         
         Args:
             text (str): The text to embed and store.
+            metadata (dict): Optional metadata attached to every chunk.
         """
+        from langchain.schema import Document
         chunks = self.chunk_text(text)
-        docs = [Document(page_content=chunk, metadata={}) for chunk in chunks]
+        docs = [Document(page_content=chunk, metadata=dict(metadata or {})) for chunk in chunks]
         self.add_documents(docs)
 
+    @staticmethod
+    def make_chunk_id(location: str, file: str, key: str, chunk: str, metadata: dict = None) -> str:
+        """
+        Build a stable id for a chunk from its source, metadata and content.
+
+        The same chunk text under the same file, key and metadata always maps
+        to the same id, so re-ingesting unchanged data is a no-op, while a
+        metadata change replaces the stored chunk.
+        
+        Args:
+            location (str): The data subpath the chunk was read from.
+            file (str): The source file name.
+            key (str): The JSON key the chunk was read from.
+            chunk (str): The chunk text.
+            metadata (dict): Optional record metadata stored with the chunk.
+        
+        Returns:
+            str: The chunk id.
+        """
+        content_hash = hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+        source = f"{location}\x1f{file}\x1f{key}\x1f{content_hash}"
+        if metadata:
+            source += f"\x1f{json.dumps(metadata, sort_keys=True)}"
+        return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+    def iter_documents(self, location: str, records: Iterable[tuple]) -> Iterator[Tuple[str, Document]]:
+        """
+        Lazily chunk a stream of records into documents with deterministic ids.
+
+        Each document carries the location, file and key of its record, any
+        record metadata, and the character span of its chunk in the record
+        text as start_index and end_index.
+        
+        Args:
+            location (str): The data subpath the records were read from.
+            records (Iterable[tuple]): (file, key, text) or (file, key, text, metadata) records to
+                chunk. The text may be given as an iterable of pieces to stream a long source.
+        
+        Yields:
+            Tuple[str, Document]: The chunk id and its document, in input order.
+        """
+        from langchain.schema import Document
+        for file, key, text, *extra in records:
+            record_metadata = extra[0] if extra else None
+            for index, chunk in enumerate(self.chunker.iter_chunks(text)):
+                chunk_id = self.make_chunk_id(location, file, key, chunk.text, record_metadata)
+                metadata = {**(record_metadata or {}), "location": location, "file": file, "key": key,
+                            "chunk_index": index, "start_index": chunk.start, "end_index": chunk.end}
+                yield chunk_id, Document(page_content=chunk.text, metadata=metadata)
+
+    def sync_documents(self, location: str, records: Iterable[tuple], batch_size: int = EMBED_BATCH_SIZE,
+                       store: VectorStore = None, existing_files: Dict[str, set] = None,
+                       kept_files: set = None, dedup: bool = DEDUP_ENABLED,
+                       duplicate_files: set = None) -> Dict[str, int]:
+        """
+        Incrementally bring the vector store in line with the records of a location.
+
+        Only chunks whose id is not already stored are embedded, in fixed-size
+        batches. A single writer thread upserts each batch in order while the
+        next one is embedded. Stored chunks of the location that no longer
+        appear in the records (changed or removed sources) are deleted, except
+        those of kept files, which the caller left out of the records on purpose.
+
+        With dedup on, a new chunk that is a near-duplicate of a chunk already
+        in the store, or of one ingested earlier in the same pass, is skipped,
+        so every cluster of near-duplicates keeps a single representative.
+        Only chunks with the same filterable metadata (see dedup_scope) count
+        as duplicates, so scoped queries still find every text. A
+        chunk whose representative is a stored chunk not yet seen in the pass,
+        such as the previous version of an edited chunk, is held back until
+        stale chunks are deleted, then claimed again.
+        
+        Args:
+            location (str): The data subpath the records were read from.
+            records (Iterable[tuple]): (file, key, text) or (file, key, text, metadata) records to ingest.
+            batch_size (int): The number of chunks to embed and write at once.
+            store (VectorStore): The store to write to; defaults to this embedder's own store.
+            existing_files (Dict[str, set]): The stored ids of the location by file, if already fetched.
+            kept_files (set): Files whose stored chunks are kept as is. It is read once the records
+                are consumed, so the records iterator may fill it.
+            dedup (bool): Whether to skip near-duplicate chunks.
+            duplicate_files (set): Filled with the files that had chunks skipped as near-duplicates.
+        
+        Returns:
+            Dict[str, int]: Counts of added, deleted, unchanged and near-duplicate chunks.
+        """
+        store = store or self
+        if existing_files is None:
+            existing_files = store.get_file_ids(where={"location": location})
+        existing_ids = set().union(*existing_files.values())
+        seen_ids = set()
+        added = 0
+        duplicates = 0
+        deferred: List[Tuple[str, Document, str]] = []
+        batch_ids: List[str] = []
+        batch_docs: List[Document] = []
+        if duplicate_files is None:
+            duplicate_files = set()
+
+        with ThreadPoolExecutor(max_workers=1) as writer:
+            pending = None
+
+            def flush():
+                nonlocal pending, added, batch_ids, batch_docs
+                embeddings = self.ingest_embedding_function.embed_documents([doc.page_content for doc in batch_docs])
+                # Wait for the previous write so at most one embedded batch is held in memory
+                if pending is not None:
+                    pending.result()
+                pending = writer.submit(store.add_embeddings, batch_ids, batch_docs, embeddings, save=False)
+                added += len(batch_docs)
+                batch_ids, batch_docs = [], []
+
+            for chunk_id, doc in self.iter_documents(location, records):
+                if chunk_id in seen_ids:
+                    continue
+                seen_ids.add(chunk_id)
+                if chunk_id in existing_ids:
+                    continue
+                if dedup:
+                    representative = store.dedup_index.claim(chunk_id, doc.page_content,
+                                                              store.dedup_scope(doc.metadata))
+                    if representative is not None:
+                        # A stored chunk not seen yet may turn out stale, so decide once the pass is over
+                        if representative in existing_ids and representative not in seen_ids:
+                            deferred.append((chunk_id, doc, representative))
+                        else:
+                            duplicates += 1
+                            duplicate_files.add(doc.metadata["file"])
+                        continue
+
+                batch_ids.append(chunk_id)
+                batch_docs.append(doc)
+                if len(batch_docs) >= batch_size:
+                    flush()
+
+            for file in kept_files or ():
+                seen_ids |= existing_files.get(file, set())
+            stale_ids = existing_ids - seen_ids
+            if pending is not None:
+                pending.result()
+                pending = None
+            if stale_ids:
+                store.delete(stale_ids, batch_size=batch_size, save=False)
+
+            # Chunks held back against a representative that was just deleted are claimed again
+            for chunk_id, doc, representative in deferred:
+                if (representative not in stale_ids
+                        or store.dedup_index.claim(chunk_id, doc.page_content, store.dedup_scope(doc.metadata)) is not None):
+                    duplicates += 1
+                    duplicate_files.add(doc.metadata["file"])
+                    continue
+                batch_ids.append(chunk_id)
+                batch_docs.append(doc)
+                if len(batch_docs) >= batch_size:
+                    flush()
+
+            if batch_docs:
+                flush()
+            if pending is not None:
+                pending.result()
+
+        store.save()
+
+        return {
+            "added": added,
+            "deleted": len(stale_ids),
+            "unchanged": len(seen_ids) - added - duplicates,
+            "duplicates": duplicates,
+        }
+
 class VectorStoreManager:
     """
     A class to manage vector store operations for different datasets.
+
+    Every source dataset is kept in its own shard, a separate collection under
+    `<vector_db_dir>/<source>/`, so sources are ingested and reset
+    independently. Queries are embedded once, fanned out to the relevant
+    shards on a thread pool and merged into one top-k list. A collection left
+    at the root of `vector_db_dir` from before sharding is not read; all
+    sources have to be ingested again into their shards.
     """
 
-    def __init__(self, chunk_size: int = 500, chunk_overlap: int = 50,
-                 vector_db_dir: str = VECTOR_DB_DIR, embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2"):
+    # Source name -> (cleansed location, metadata field holding the file name)
+    SOURCES = {
+        "16personalities": (SIXTEEN_PERSONALITIES_LOC, "ptype"),
+        "chatgpt_personalities": (CHATGPT_PERSONALITIES_LOC, "ptype"),
+        "chatgpt_topics": (CHATGPT_TOPIC_DETAILS_LOC, "topic"),
+    }
+    # Source name -> options of _iter_location_records
+    SYNC_OPTIONS = {
+        "16personalities": {"skip_keys": ("ptype",)},
+        "chatgpt_personalities": {},
+        "chatgpt_topics": {"prefix_key": True},
+    }
+    # Bump when the records of a source are chunked differently, so every file is embedded again
+    STAGE_VERSION = 1
+
+    def __init__(self, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP,
+                 vector_db_dir: str = VECTOR_DB_DIR, embedding_model: str = EMBEDDING_MODEL,
+                 batch_size: int = EMBED_BATCH_SIZE, backend: str = VECTOR_STORE_BACKEND,
+                 workers: int = EMBED_WORKERS):
         """
         Initialize the VectorStoreManager with the given parameters.
         
         Args:
-            chunk_size (int): The size of each text chunk.
-            chunk_overlap (int): The overlap between text chunks.
+            chunk_size (int): The maximum number of model tokens per chunk.
+            chunk_overlap (int): The number of tokens repeated between consecutive chunks.
             vector_db_dir (str): The directory to persist the vector store.
             embedding_model (str): The name of the embedding model.
+            batch_size (int): The number of chunks embedded and stored per batch during ingest.
+            backend (str): The vector store backend: 'chroma' or 'numpy'.
+            workers (int): The number of processes embedding chunks during ingest, or 0 to use every core.
         """
+        self.batch_size = batch_size
         self.embedder = Embedder(
             model_name=embedding_model,
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap,
-            persist_directory=vector_db_dir
+            backend=backend,
+            workers=workers
         )
+        # Shards only store and search; the embedder chunks and embeds for all of them and stores nothing itself
+        self.shards = {
+            source: VectorStore(os.path.join(vector_db_dir, source), collection_name=source, backend=backend)
+            for source in self.SOURCES
+        }
+        self._executor = None
+        self._warn_unsharded(vector_db_dir)
 
-    def reset_vectorstore(self):
+    @staticmethod
+    def _warn_unsharded(vector_db_dir: str):
         """
-        Reset the vector database.
+        Warn about a collection left at the root of the vector database directory.
+
+        Before sources were sharded, every chunk was stored in one collection at
+        the root of `vector_db_dir`; queries now only search the shards under
+        `<vector_db_dir>/<source>/`, so the old collection is no longer read.
+        """
+        legacy = [name for name in ("chroma.sqlite3", "meta.json", "records.jsonl")
+                  if os.path.exists(os.path.join(vector_db_dir, name))]
+        if legacy:
+            logging.warning(f"Found a vector store written before sources were sharded at '{vector_db_dir}' "
+                            f"({', '.join(legacy)}). It is no longer queried: re-ingest all three sources, "
+                            f"then delete those files.")
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
         """
-        self.embedder.reset()
+        The thread pool queries are fanned out on, started on first use.
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=len(self.shards), thread_name_prefix="shard-query")
+        return self._executor
+
+    def reset_vectorstore(self, source: str = None):
+        """
+        Reset the vector database, or only the shard of one source.
+        
+        Args:
+            source (str): Optional source whose shard is reset; all shards are reset if None.
+        """
+        if source is None:
+            for shard in self.shards.values():
+                shard.reset()
+        else:
+            self._shard(source).reset()
 
-    def query_vectorstore(self, query: str, top_k: int = 5):
+    def rebuild_vectorstore(self, source: str = None, background: bool = True) -> Dict[str, Future]:
+        """
+        Re-embed sources into fresh index versions while the current ones keep serving queries.
+
+        Each shard is swapped to its new version as soon as its build finishes.
+        
+        Args:
+            source (str): Optional source to rebuild; all sources are rebuilt if None.
+            background (bool): Whether to return immediately instead of waiting for the swaps.
+        
+        Returns:
+            Dict[str, Future]: Per source, a future resolving to the new index version.
+        """
+        sources = list(self.shards) if source is None else [source]
+        futures = {
+            name: self._shard(name).rebuild(
+                lambda staging, name=name: self._sync_location(name, store=staging, **self.SYNC_OPTIONS[name]),
+                background=background
+            )
+            for name in sources
+        }
+        return futures
+
+    def _shard(self, source: str) -> VectorStore:
+        """
+        Get the shard of a source.
+        """
+        if source not in self.shards:
+            raise ValueError(f"Invalid source '{source}'. Valid options are: {list(self.shards)}")
+        return self.shards[source]
+
+    def _select_shards(self, source=None, ptype=None, topic=None) -> List[VectorStore]:
+        """
+        Pick the shards a query has to search.
+
+        Shards are skipped when they cannot match the requested sources or
+        when a ptype or topic is requested that their chunks do not carry.
+        """
+        sources = [source] if isinstance(source, str) else list(source or self.shards)
+        selected = []
+        for name in sources:
+            shard = self._shard(name)
+            file_field = self.SOURCES[name][1]
+            if (ptype is not None and file_field != "ptype") or (topic is not None and file_field != "topic"):
+                continue
+            selected.append(shard)
+        return selected
+
+    def _fan_out(self, search, shards: List[VectorStore]) -> list:
+        """
+        Run a search function on several shards concurrently.
+        """
+        if len(shards) == 1:
+            return [search(shards[0])]
+        return list(self.executor.map(search, shards))
+
+    @staticmethod
+    def _merge(results: List[list], top_k: int, mode: str) -> list:
+        """
+        Merge the scored results of several shards into one top_k list.
+
+        Dense scores are comparable between shards and are merged directly.
+        Hybrid scores are normalized per shard, so fused hybrid results are
+        merged by reciprocal rank instead. Dense fill-ins of hybrid results,
+        which had no lexical match, rank below every fused result of any shard,
+        by their dense score.
+        """
+        if mode == "hybrid":
+            fill_in_limit = 1 - VectorStore.FILL_IN_OFFSET
+            ranked = [
+                ((0, score) if score <= fill_in_limit else (1, 1 / (SHARD_RRF_K + rank)), doc)
+                for hits in results for rank, (doc, score) in enumerate(hits)
+            ]
+        else:
+            ranked = [(score, doc) for hits in results for doc, score in hits]
+        ranked.sort(key=lambda item: item[0], reverse=True)
+        return [doc for _, doc in ranked[:top_k]]
+
+    def query_vectorstore(self, query: str, top_k: int = 5, filter: dict = None, mode: str = "dense",
+                          source: str = None, ptype: str = None, topic: str = None, key: str = None):
         """
         Query the vector database.
+
+        The source, ptype, topic and key arguments restrict the search to
+        matching shards and chunks before ranking; a list matches any of its values.
         
         Args:
             query (str): The query string.
             top_k (int): The number of top results to return.
+            filter (dict): Optional metadata filter applied by the vector store.
+            mode (str): 'dense' for vector search only, or 'hybrid' to fuse BM25 and vector scores.
+            source (str): Optional source dataset: '16personalities', 'chatgpt_personalities' or 'chatgpt_topics'.
+            ptype (str): Optional personality type.
+            topic (str): Optional ChatGPT topic.
+            key (str): Optional section key, such as 'career_paths' or 'friendships'.
         
         Returns:
             list: The top_k results from the vector store.
         """
-        return self.embedder.query(query, top_k=top_k)
+        shards = self._select_shards(source, ptype=ptype, topic=topic)
+        if not shards:
+            return []
 
-    def sixteen_personality_embed(self):
+        filter = build_filter(filter, ptype=ptype, topic=topic, key=key)
+        embedding = self.embedder.embed_query(query)
+        results = self._fan_out(
+            lambda shard: shard.search(query, embedding, top_k=top_k, filter=filter, mode=mode), shards
+        )
+        return self._merge(results, top_k, mode)
+
+    def embed_query(self, query: str) -> List[float]:
         """
-        Embed and store sixteen personality data.
+        Embed a query string, reusing the embedding of a recently queried identical string.
+        
+        Args:
+            query (str): The query string.
+        
+        Returns:
+            List[float]: The query embedding.
+        """
+        return self.embedder.embed_query(query)
+
+    def get_embeddings(self, ids: Iterable[str]) -> Dict[str, List[float]]:
+        """
+        Get the stored embeddings of documents from whichever shards hold them.
+        
+        Args:
+            ids (Iterable[str]): The document ids.
+        
+        Returns:
+            Dict[str, List[float]]: The embedding of every stored document, by id.
         """
-        storage_manager = JSONDataManager(CLEANSED, SIXTEEN_PERSONALITIES_LOC)
-        files = storage_manager.get_files()
+        remaining = set(ids)
+        embeddings = {}
+        for shard in self.shards.values():
+            if not remaining:
+                break
+            found = shard.get_embeddings(remaining)
+            embeddings.update(found)
+            remaining -= set(found)
+        return embeddings
 
-        for file in files:
-            data = storage_manager.load_json(file)
+    def warmup(self):
+        """
+        Load the embedding model and open the shards ahead of the first query.
+        """
+        self.embedder.embed_query("warmup")
+        for shard in self.shards.values():
+            shard.warmup()
+
+    def close(self):
+        """
+        Shut down the ingest worker pool and the query thread pool, if they were started.
+        """
+        self.embedder.close()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def query_vectorstore_many(self, queries: List[str], top_k: int = 5, filter: dict = None, source: str = None,
+                               ptype: str = None, topic: str = None, key: str = None) -> List[list]:
+        """
+        Query the vector database with several query strings at once.
+        
+        Args:
+            queries (List[str]): The query strings.
+            top_k (int): The number of top results per query.
+            filter (dict): Optional metadata filter applied by the vector store.
+            source (str): Optional source dataset to restrict the search to.
+            ptype (str): Optional personality type to restrict the search to.
+            topic (str): Optional ChatGPT topic to restrict the search to.
+            key (str): Optional section key to restrict the search to.
+        
+        Returns:
+            List[list]: The top_k results of each query, in input order.
+        """
+        shards = self._select_shards(source, ptype=ptype, topic=topic)
+        if not shards:
+            return [[] for _ in queries]
+
+        filter = build_filter(filter, ptype=ptype, topic=topic, key=key)
+        embeddings = self.embedder.embed_queries(queries)
+        results = self._fan_out(
+            lambda shard: shard.search_many(queries, embeddings, top_k=top_k, filter=filter), shards
+        )
+        return [self._merge([hits[index] for hits in results], top_k, "dense") for index in range(len(queries))]
+
+    def _iter_location_records(self, files: Iterable[Tuple[str, dict]], source: str, file_field: str,
+                               skip_keys: tuple = (), prefix_key: bool = False) -> Iterator[Tuple[str, str, str, dict]]:
+        """
+        Stream the text values of cleansed JSON files.
+        
+        Args:
+            files (Iterable[Tuple[str, dict]]): (file name, data) pairs read from a cleansed location.
+            source (str): The source dataset name stored with every chunk.
+            file_field (str): The metadata field the file name is stored under, such as 'ptype' or 'topic'.
+            skip_keys (tuple): Keys whose values should not be embedded.
+            prefix_key (bool): Whether to prefix each value with its key.
+        
+        Yields:
+            Tuple[str, str, str, dict]: The source file name, key, text to embed and chunk metadata.
+        """
+        for name, data in files:
             for key, value in data.items():
-                if key == 'ptype':
+                if key in skip_keys:
+                    continue
+                yield name, key, f"{key}: {value}" if prefix_key else value, {"source": source, file_field: name}
+
+    def _sync_location(self, source: str, store: VectorStore = None, **kwargs) -> Dict[str, int]:
+        """
+        Incrementally embed the cleansed location of one source into its shard and report what changed.
+
+        A manifest kept with the cleansed data records the hash of every file
+        embedded into the store, so files that are unchanged since the last
+        run, and still stored, are not even chunked again. Files with chunks
+        dropped as near-duplicates are never recorded, so they are checked
+        again, without being embedded, in case their representative is deleted.
+        
+        Args:
+            source (str): The source to embed.
+            store (VectorStore): The store to write to; defaults to the shard of the source.
+            **kwargs: Options forwarded to _iter_location_records.
+        
+        Returns:
+            Dict[str, int]: Counts of added, deleted and unchanged chunks, and of skipped files.
+        """
+        location, file_field = self.SOURCES[source]
+        store = store or self._shard(source)
+        storage_manager = JSONDataManager(CLEANSED, location)
+        manifest = storage_manager.manifest(f"embed-{source}", self._stage_version(**kwargs))
+        existing_files = store.get_file_ids(where={"location": location})
+        kept_files = set()
+        duplicate_files = set()
+        processed = {}
+
+        def changed_files():
+            for name, data in storage_manager.iter_records():
+                input_hash = manifest.hash(data)
+                # Only skip files whose chunks are still stored, which a reset or rebuild empties
+                if name in existing_files and manifest.is_current(name, input_hash):
+                    kept_files.add(name)
                     continue
-                self.embedder.embed_and_store(value)
+                processed[name] = input_hash
+                yield name, data
+
+        records = self._iter_location_records(changed_files(), source, file_field, **kwargs)
+        stats = self.embedder.sync_documents(location, records, batch_size=self.batch_size, store=store,
+                                             existing_files=existing_files, kept_files=kept_files,
+                                             duplicate_files=duplicate_files)
+        for name, input_hash in processed.items():
+            if name not in duplicate_files:
+                manifest.update(name, input_hash)
+        manifest.save()
+
+        stats["skipped"] = manifest.skipped
+        print(f"Embedded '{location}': {stats['added']} added, {stats['deleted']} deleted, "
+              f"{stats['unchanged']} unchanged, {stats['duplicates']} near-duplicates dropped, "
+              f"{stats['skipped']} files skipped.")
+        return stats
+
+    def _stage_version(self, **kwargs) -> str:
+        """
+        The version of the embed stage, which changes with the model, the chunking or the sync options.
+        """
+        return json.dumps([self.STAGE_VERSION, self.embedder.model_name, self.embedder.chunk_size,
+                           self.embedder.chunk_overlap, kwargs], sort_keys=True)
+
+    def sixteen_personality_embed(self):
+        """
+        Embed and store sixteen personality data.
+        """
+        return self._sync_location("16personalities", **self.SYNC_OPTIONS["16personalities"])
 
     def chatGPT_personality_embed(self):
         """
         Embed and store ChatGPT personality data.
         """
-        storage_manager = JSONDataManager(CLEANSED, CHATGPT_PERSONALITIES_LOC)
-        files = storage_manager.get_files()
-
-        for file in files:
-            data = storage_manager.load_json(file)
-            for key, value in data.items():
-                self.embedder.embed_and_store(value)
+        return self._sync_location("chatgpt_personalities", **self.SYNC_OPTIONS["chatgpt_personalities"])
 
     def chatGPT_topic_embed(self):
         """
         Embed and store ChatGPT topic data.
         """
-        storage_manager = JSONDataManager(CLEANSED, CHATGPT_TOPIC_DETAILS_LOC)
-        files = storage_manager.get_files()
-
-        for file in files:
-            data = storage_manager.load_json(file)
-            for key, value in data.items():
-                self.embedder.embed_and_store(f"{key}: {value}")
+        return self._sync_location("chatgpt_topics", **self.SYNC_OPTIONS["chatgpt_topics"])
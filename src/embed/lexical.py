@@ -0,0 +1,258 @@
+import os
+import re
+import math
+import pickle
+import threading
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from embed.config import BM25_K1, BM25_B
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into lowercase word tokens.
+
+    Args:
+        text (str): The text to tokenize.
+
+    Returns:
+        List[str]: The tokens.
+    """
+    return TOKEN_PATTERN.findall(text.lower())
+
+class InvertedIndex:
+    """
+    A BM25 inverted index over the chunks of one vector store collection.
+
+    Each term maps to two compact unsigned-int arrays: the internal numbers of
+    the documents containing it and the term frequency in each. Deleted
+    documents are tombstoned and their postings are dropped once they make up
+    a quarter of the index.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: str, k1: float = BM25_K1, b: float = BM25_B):
+        """
+        Initialize the InvertedIndex with the given parameters.
+
+        Args:
+            path (str): The file the index is persisted to.
+            k1 (float): The BM25 term frequency saturation parameter.
+            b (float): The BM25 document length normalization parameter.
+        """
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._clear()
+        self.exists = self._load()
+
+    def _clear(self):
+        """
+        Empty the in-memory index.
+        """
+        self._doc_ids: List[Optional[str]] = []
+        self._numbers: Dict[str, int] = {}
+        self._lengths = array("I")
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._total_length = 0
+        self._deleted = 0
+        self.dirty = False
+
+    def _load(self) -> bool:
+        """
+        Load the persisted index, if one exists.
+
+        Returns:
+            bool: Whether an index was loaded.
+        """
+        if not os.path.exists(self.path):
+            return False
+
+        try:
+            with open(self.path, "rb") as f:
+                state = pickle.load(f)
+        except (IOError, pickle.UnpicklingError, EOFError):
+            return False
+        if state.get("version") != self.VERSION:
+            return False
+
+        self._doc_ids = state["doc_ids"]
+        self._numbers = {doc_id: number for number, doc_id in enumerate(self._doc_ids) if doc_id is not None}
+        self._lengths = array("I", state["lengths"])
+        self._postings = {term: (array("I", docs), array("I", tfs)) for term, (docs, tfs) in state["postings"].items()}
+        self._total_length = state["total_length"]
+        self._deleted = len(self._doc_ids) - len(self._numbers)
+        return True
+
+    def save(self):
+        """
+        Atomically persist the index if it changed since the last save.
+        """
+        with self._lock:
+            if not self.dirty:
+                return
+
+            state = {
+                "version": self.VERSION,
+                "doc_ids": self._doc_ids,
+                "lengths": self._lengths.tobytes(),
+                "postings": {term: (docs.tobytes(), tfs.tobytes()) for term, (docs, tfs) in self._postings.items()},
+                "total_length": self._total_length,
+            }
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+            self.dirty = False
+            self.exists = True
+
+    def add(self, doc_ids: Iterable[str], texts: Iterable[str]):
+        """
+        Index documents, replacing any indexed documents with the same ids.
+
+        Args:
+            doc_ids (Iterable[str]): The document ids.
+            texts (Iterable[str]): The document texts.
+        """
+        with self._lock:
+            doc_ids = list(doc_ids)
+            self.remove([doc_id for doc_id in doc_ids if doc_id in self._numbers])
+
+            for doc_id, text in zip(doc_ids, texts):
+                number = len(self._doc_ids)
+                terms = Counter(tokenize(text))
+                length = sum(terms.values())
+
+                self._doc_ids.append(doc_id)
+                self._numbers[doc_id] = number
+                self._lengths.append(length)
+                self._total_length += length
+
+                for term, tf in terms.items():
+                    postings = self._postings.get(term)
+                    if postings is None:
+                        postings = self._postings[term] = (array("I"), array("I"))
+                    postings[0].append(number)
+                    postings[1].append(tf)
+            self.dirty = True
+
+    def remove(self, doc_ids: Iterable[str]):
+        """
+        Remove documents from the index.
+
+        Args:
+            doc_ids (Iterable[str]): The ids of the documents to remove.
+        """
+        with self._lock:
+            for doc_id in doc_ids:
+                number = self._numbers.pop(doc_id, None)
+                if number is None:
+                    continue
+                self._doc_ids[number] = None
+                self._total_length -= self._lengths[number]
+                self._deleted += 1
+                self.dirty = True
+
+            if self._deleted * 4 > len(self._doc_ids):
+                self._compact()
+
+    def _compact(self):
+        """
+        Renumber live documents and drop the postings of deleted ones.
+        """
+        remap = np.full(len(self._doc_ids), -1, dtype=np.int64)
+        live = [number for number, doc_id in enumerate(self._doc_ids) if doc_id is not None]
+        remap[live] = np.arange(len(live))
+
+        postings = {}
+        for term, (docs, tfs) in self._postings.items():
+            numbers = remap[np.frombuffer(docs, dtype=np.uint32)]
+            keep = numbers >= 0
+            if keep.any():
+                postings[term] = (array("I", numbers[keep].astype(np.uint32).tobytes()),
+                                  array("I", np.frombuffer(tfs, dtype=np.uint32)[keep].tobytes()))
+
+        self._postings = postings
+        self._doc_ids = [self._doc_ids[number] for number in live]
+        self._numbers = {doc_id: number for number, doc_id in enumerate(self._doc_ids)}
+        self._lengths = array("I", (self._lengths[number] for number in live))
+        self._deleted = 0
+        self.dirty = True
+
+    def search(self, query: str, k: int = 10, allowed: Optional[Iterable[str]] = None) -> List[Tuple[str, float]]:
+        """
+        Rank indexed documents against a query with BM25.
+
+        Args:
+            query (str): The query string.
+            k (int): The maximum number of results.
+            allowed (Iterable[str]): Optional ids of the only documents that may be returned.
+
+        Returns:
+            List[Tuple[str, float]]: (document id, BM25 score) pairs, best first.
+        """
+        with self._lock:
+            live = len(self._numbers)
+            if not live:
+                return []
+
+            average_length = self._total_length / live or 1
+            lengths = np.frombuffer(self._lengths, dtype=np.uint32).astype(np.float32)
+            norms = self.k1 * (1 - self.b + self.b * lengths / average_length)
+            scores = np.zeros(len(self._doc_ids), dtype=np.float32)
+
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if postings is None:
+                    continue
+                docs = np.frombuffer(postings[0], dtype=np.uint32)
+                tfs = np.frombuffer(postings[1], dtype=np.uint32).astype(np.float32)
+                df = min(len(docs), live)
+                idf = math.log(1 + (live - df + 0.5) / (df + 0.5))
+                scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norms[docs])
+
+            if allowed is not None:
+                mask = np.zeros(len(self._doc_ids), dtype=bool)
+                mask[[self._numbers[doc_id] for doc_id in allowed if doc_id in self._numbers]] = True
+                scores[~mask] = 0
+
+            matched = np.flatnonzero(scores > 0)
+            matched = matched[[self._doc_ids[number] is not None for number in matched]] if self._deleted else matched
+            if not len(matched):
+                return []
+
+            if len(matched) > k:
+                matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+            matched = matched[np.argsort(-scores[matched])]
+            return [(self._doc_ids[number], float(scores[number])) for number in matched]
+
+    def reset(self):
+        """
+        Empty the index and remove its file.
+        """
+        with self._lock:
+            self._clear()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self.exists = False
+
+    def ids(self) -> Set[str]:
+        """
+        Get the ids of the indexed documents.
+
+        Returns:
+            Set[str]: The document ids.
+        """
+        with self._lock:
+            return set(self._numbers)
+
+    def __len__(self) -> int:
+        return len(self._numbers)
@@ -0,0 +1,473 @@
+from __future__ import annotations
+
+import os
+import json
+import threading
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from embed.config import NUMPY_STORE_DTYPE
+
+if TYPE_CHECKING:
+    from langchain.schema import Document
+
+class NumpyVectorStore:
+    """
+    An exact, flat vector store kept in memory-mapped NumPy files.
+
+    It implements the subset of the LangChain Chroma API that VectorStore uses,
+    so it can be swapped in as a backend. Vectors are L2-normalized on insert
+    and stored as float32, float16 or int8 with a per-vector scale; a query is
+    one matrix-vector product followed by argpartition, which gives exact
+    cosine ranking.
+
+    Files in the collection directory:
+        meta.json      dimension, dtype and committed row count
+        vectors.bin    appended vector rows in the storage dtype
+        scales.bin     per-row float32 scales (int8 only)
+        texts.bin      appended UTF-8 document texts
+        records.jsonl  one line per row (id, metadata, text offsets) plus delete markers
+    """
+
+    DTYPES = ("float32", "float16", "int8")
+    SCORE_BLOCK_ROWS = 2048
+
+    def __init__(self, persist_directory: str, collection_name: str = "documents", embedding_function=None,
+                 dtype: str = NUMPY_STORE_DTYPE):
+        """
+        Initialize the NumpyVectorStore with the given parameters.
+
+        Args:
+            persist_directory (str): The directory to persist the vector store.
+            collection_name (str): The name of the collection in the vector store.
+            embedding_function: The function to generate embeddings.
+            dtype (str): The storage dtype of the vectors: 'float32', 'float16' or 'int8'.
+        """
+        if dtype not in self.DTYPES:
+            raise ValueError(f"Invalid dtype '{dtype}'. Valid options are: {list(self.DTYPES)}")
+
+        self.directory = os.path.join(persist_directory, collection_name)
+        self.embedding_function = embedding_function
+        self.dtype = dtype
+        self._lock = threading.RLock()
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._meta_path = os.path.join(self.directory, "meta.json")
+        self._vectors_path = os.path.join(self.directory, "vectors.bin")
+        self._scales_path = os.path.join(self.directory, "scales.bin")
+        self._texts_path = os.path.join(self.directory, "texts.bin")
+        self._records_path = os.path.join(self.directory, "records.jsonl")
+
+        self.dim = None
+        self._ids: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self._spans: List[Tuple[int, int]] = []
+        self._rows: Dict[str, int] = {}
+        self._alive = np.zeros(0, dtype=bool)
+        self._vectors = None
+        self._scales = None
+        self._texts = None
+        self._columns: Dict[str, np.ndarray] = {}
+        self._load()
+
+    def _load(self):
+        """
+        Open the persisted collection, if one exists.
+        """
+        if not os.path.exists(self._meta_path):
+            return
+
+        with open(self._meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta["dtype"] != self.dtype:
+            raise ValueError(f"Collection at '{self.directory}' is stored as {meta['dtype']}, not {self.dtype}.")
+
+        self.dim = meta["dim"]
+        committed = meta["rows"]
+        with open(self._records_path, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+
+        # Parse every line in one call; fall back to line by line if the tail of the log is torn
+        try:
+            records = json.loads("[" + ",".join(lines) + "]")
+            uncommitted = False
+        except json.JSONDecodeError:
+            records = []
+            for line in lines:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break
+            uncommitted = True
+
+        alive = []
+        for record in records:
+            if "deleted" in record:
+                row = self._rows.pop(record["deleted"], None)
+                if row is not None:
+                    alive[row] = False
+            elif len(self._ids) < committed:
+                self._append_record(record["id"], record["metadata"], (record["offset"], record["length"]))
+                alive.append(True)
+            else:
+                uncommitted = True
+
+        self._alive = np.asarray(alive, dtype=bool)
+        self._open_maps()
+
+        # An interrupted write leaves rows past the committed count; drop them before appending again
+        row_bytes = self.dim * np.dtype(self.dtype).itemsize if self.dim else 0
+        if uncommitted or os.path.getsize(self._vectors_path) != committed * row_bytes:
+            self._compact()
+
+    def _append_record(self, doc_id: str, metadata: Dict[str, Any], span: Tuple[int, int]):
+        """
+        Register a row in the in-memory record tables.
+        """
+        self._rows[doc_id] = len(self._ids)
+        self._ids.append(doc_id)
+        self._metadatas.append(metadata)
+        self._spans.append(span)
+
+    def _open_maps(self):
+        """
+        Memory-map the vector, scale and text files for the committed rows.
+        """
+        rows = len(self._ids)
+        self._columns = {}
+        if rows == 0:
+            self._vectors = self._scales = self._texts = None
+            return
+
+        self._vectors = np.memmap(self._vectors_path, dtype=self.dtype, mode="r", shape=(rows, self.dim))
+        if self.dtype == "int8":
+            self._scales = np.memmap(self._scales_path, dtype=np.float32, mode="r", shape=(rows,))
+        size = os.path.getsize(self._texts_path)
+        self._texts = np.memmap(self._texts_path, dtype=np.uint8, mode="r", shape=(size,)) if size else None
+
+    def _encode(self, embeddings: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """
+        Normalize embeddings and convert them to the storage dtype.
+        """
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        embeddings = embeddings / np.where(norms == 0, 1, norms)
+        if self.dtype != "int8":
+            return embeddings.astype(self.dtype), None
+
+        scales = np.abs(embeddings).max(axis=1) / 127
+        scales[scales == 0] = 1
+        quantized = np.rint(embeddings / scales[:, None]).astype(np.int8)
+        return quantized, scales.astype(np.float32)
+
+    def add_documents(self, documents: List[Document], ids: List[str] = None) -> List[str]:
+        """
+        Embed and add documents, replacing any stored documents with the same ids.
+
+        Args:
+            documents (List[Document]): The documents to add.
+            ids (List[str]): Optional ids for the documents.
+
+        Returns:
+            List[str]: The ids of the added documents.
+        """
+        texts = [doc.page_content for doc in documents]
+        embeddings = self.embedding_function.embed_documents(texts)
+        return self.add_embeddings(texts, embeddings, [doc.metadata for doc in documents], ids)
+
+    def add_embeddings(self, texts: List[str], embeddings: List[List[float]], metadatas: List[dict] = None,
+                       ids: List[str] = None) -> List[str]:
+        """
+        Add precomputed embeddings, replacing any stored documents with the same ids.
+
+        Args:
+            texts (List[str]): The document texts.
+            embeddings (List[List[float]]): One embedding per text.
+            metadatas (List[dict]): Optional metadata per text.
+            ids (List[str]): Optional ids for the documents.
+
+        Returns:
+            List[str]: The ids of the added documents.
+        """
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        if ids is None:
+            ids = [os.urandom(16).hex() for _ in texts]
+
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if self.dim is None:
+            self.dim = matrix.shape[1]
+        elif matrix.shape[1] != self.dim:
+            raise ValueError(f"Expected embeddings of dimension {self.dim}, got {matrix.shape[1]}.")
+        vectors, scales = self._encode(matrix)
+
+        with self._lock:
+            self.delete([doc_id for doc_id in ids if doc_id in self._rows])
+
+            offset = os.path.getsize(self._texts_path) if os.path.exists(self._texts_path) else 0
+            encoded = [text.encode("utf-8") for text in texts]
+            lines = []
+            for doc_id, metadata, data in zip(ids, metadatas, encoded):
+                self._append_record(doc_id, dict(metadata or {}), (offset, len(data)))
+                lines.append(json.dumps({"id": doc_id, "metadata": metadata or {}, "offset": offset,
+                                         "length": len(data)}, ensure_ascii=False))
+                offset += len(data)
+
+            with open(self._texts_path, "ab") as f:
+                f.write(b"".join(encoded))
+            with open(self._vectors_path, "ab") as f:
+                f.write(vectors.tobytes())
+            if scales is not None:
+                with open(self._scales_path, "ab") as f:
+                    f.write(scales.tobytes())
+            with open(self._records_path, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+
+            self._alive = np.concatenate([self._alive, np.ones(len(ids), dtype=bool)])
+            self._save_meta()
+            self._open_maps()
+        return list(ids)
+
+    def delete(self, ids: List[str] = None):
+        """
+        Delete documents by id.
+
+        Args:
+            ids (List[str]): The ids of the documents to delete.
+        """
+        with self._lock:
+            rows = [self._rows.pop(doc_id) for doc_id in ids or [] if doc_id in self._rows]
+            if not rows:
+                return
+
+            self._alive[rows] = False
+            with open(self._records_path, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps({"deleted": self._ids[row]}) + "\n" for row in rows))
+
+            # Rewrite the files once deleted rows make up a quarter of the collection
+            if (~self._alive).sum() * 4 > len(self._alive):
+                self._compact()
+
+    def _compact(self):
+        """
+        Rewrite the collection files without deleted rows.
+        """
+        keep = np.flatnonzero(self._alive)
+        vectors = np.array(self._vectors[keep]) if len(keep) else np.zeros((0, self.dim or 0), dtype=self.dtype)
+        scales = np.array(self._scales[keep]) if self._scales is not None else None
+        texts = [self._read_text(row).encode("utf-8") for row in keep]
+        records = [(self._ids[row], self._metadatas[row]) for row in keep]
+
+        self._ids, self._metadatas, self._spans, self._rows = [], [], [], {}
+        self._vectors = self._scales = self._texts = None
+
+        lines = []
+        offset = 0
+        for (doc_id, metadata), data in zip(records, texts):
+            self._append_record(doc_id, metadata, (offset, len(data)))
+            lines.append(json.dumps({"id": doc_id, "metadata": metadata, "offset": offset, "length": len(data)},
+                                    ensure_ascii=False) + "\n")
+            offset += len(data)
+
+        self._write_atomic(self._texts_path, b"".join(texts))
+        self._write_atomic(self._vectors_path, vectors.tobytes())
+        if scales is not None:
+            self._write_atomic(self._scales_path, scales.tobytes())
+        self._write_atomic(self._records_path, "".join(lines).encode("utf-8"))
+
+        self._alive = np.ones(len(self._ids), dtype=bool)
+        self._save_meta()
+        self._open_maps()
+
+    @staticmethod
+    def _write_atomic(path: str, data: bytes):
+        """
+        Replace a file with new contents in one rename.
+        """
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _save_meta(self):
+        """
+        Commit the current row count; rows past it are ignored on load.
+        """
+        meta = {"dim": self.dim, "dtype": self.dtype, "rows": len(self._ids)}
+        self._write_atomic(self._meta_path, json.dumps(meta, indent=2).encode("utf-8"))
+
+    def _read_text(self, row: int) -> str:
+        """
+        Read the text of a row from the memory-mapped text file.
+        """
+        offset, length = self._spans[row]
+        if not length:
+            return ""
+        return self._texts[offset:offset + length].tobytes().decode("utf-8")
+
+    def _column(self, key: str) -> np.ndarray:
+        """
+        Get the values of one metadata key across all rows.
+        """
+        column = self._columns.get(key)
+        if column is None:
+            column = np.empty(len(self._metadatas), dtype=object)
+            column[:] = [metadata.get(key) for metadata in self._metadatas]
+            self._columns[key] = column
+        return column
+
+    def _filter_mask(self, where: Optional[dict]) -> np.ndarray:
+        """
+        Evaluate a Chroma-style metadata filter over all rows.
+
+        Supports equality, $eq, $ne, $in, $nin, $and and $or.
+        """
+        mask = self._alive.copy()
+        if not where:
+            return mask
+
+        for key, condition in where.items():
+            if key == "$and":
+                for clause in condition:
+                    mask &= self._filter_mask(clause)
+            elif key == "$or":
+                either = np.zeros_like(mask)
+                for clause in condition:
+                    either |= self._filter_mask(clause)
+                mask &= either
+            else:
+                column = self._column(key)
+                if not isinstance(condition, dict):
+                    condition = {"$eq": condition}
+                for op, value in condition.items():
+                    if op == "$eq":
+                        mask &= column == value
+                    elif op == "$ne":
+                        mask &= column != value
+                    elif op == "$in":
+                        mask &= np.isin(column, list(value))
+                    elif op == "$nin":
+                        mask &= ~np.isin(column, list(value))
+                    else:
+                        raise ValueError(f"Unsupported filter operator '{op}'.")
+        return mask
+
+    def _scores(self, queries: np.ndarray) -> np.ndarray:
+        """
+        Compute cosine scores of normalized queries against every stored row.
+        """
+        rows = len(self._ids)
+        scores = np.empty((len(queries), rows), dtype=np.float32)
+        if self.dtype == "float32":
+            scores[:] = queries @ self._vectors.T
+            return scores
+
+        # Upcast block by block so float16/int8 storage never needs a full float32 copy
+        for start in range(0, rows, self.SCORE_BLOCK_ROWS):
+            block = np.asarray(self._vectors[start:start + self.SCORE_BLOCK_ROWS], dtype=np.float32)
+            block_scores = queries @ block.T
+            if self._scales is not None:
+                block_scores *= self._scales[start:start + self.SCORE_BLOCK_ROWS]
+            scores[:, start:start + len(block)] = block_scores
+        return scores
+
+    def similarity_search_by_vectors_with_scores(self, embeddings: List[List[float]], k: int = 4,
+                                                 filter: dict = None) -> List[List[Tuple[Document, float]]]:
+        """
+        Find the top k documents for several query embeddings in one matrix product.
+
+        Args:
+            embeddings (List[List[float]]): The query embeddings.
+            k (int): The number of results per query.
+            filter (dict): Optional metadata filter applied before ranking.
+
+        Returns:
+            List[List[Tuple[Document, float]]]: Per query, (document, cosine similarity) pairs, best first.
+        """
+        with self._lock:
+            if not self._ids or not len(embeddings):
+                return [[] for _ in embeddings]
+
+            queries = np.asarray(embeddings, dtype=np.float32)
+            norms = np.linalg.norm(queries, axis=1, keepdims=True)
+            queries = queries / np.where(norms == 0, 1, norms)
+
+            mask = self._filter_mask(filter)
+            candidates = np.flatnonzero(mask)
+            if not len(candidates):
+                return [[] for _ in embeddings]
+
+            scores = self._scores(queries)
+            if len(candidates) < len(mask):
+                scores[:, ~mask] = -np.inf
+
+            k = min(k, len(candidates))
+            results = []
+            for row_scores in scores:
+                top = np.argpartition(-row_scores, k - 1)[:k]
+                top = top[np.argsort(-row_scores[top])]
+                results.append([(self._document(row), float(row_scores[row])) for row in top])
+            return results
+
+    def _document(self, row: int) -> Document:
+        """
+        Build the Document stored in a row.
+        """
+        from langchain.schema import Document
+        return Document(id=self._ids[row], page_content=self._read_text(row), metadata=dict(self._metadatas[row]))
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding: List[float], k: int = 4,
+                                                          filter: dict = None) -> List[Tuple[Document, float]]:
+        """
+        Find the top k documents for a query embedding, with their cosine similarity.
+        """
+        return self.similarity_search_by_vectors_with_scores([embedding], k=k, filter=filter)[0]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, filter: dict = None) -> List[Document]:
+        """
+        Find the top k documents for a query embedding.
+        """
+        return [doc for doc, _ in self.similarity_search_by_vector_with_relevance_scores(embedding, k, filter)]
+
+    def similarity_search(self, query: str, k: int = 4, filter: dict = None) -> List[Document]:
+        """
+        Find the top k documents for a query string.
+        """
+        return self.similarity_search_by_vector(self.embedding_function.embed_query(query), k=k, filter=filter)
+
+    def get(self, ids: List[str] = None, where: dict = None, include: List[str] = ("metadatas", "documents"),
+            **kwargs) -> Dict[str, list]:
+        """
+        Get stored documents by id and/or metadata filter.
+
+        Args:
+            ids (List[str]): Optional ids to restrict the result to.
+            where (dict): Optional metadata filter.
+            include (List[str]): Fields to return besides ids: 'metadatas', 'documents', 'embeddings'.
+
+        Returns:
+            Dict[str, list]: The requested fields, aligned with 'ids'.
+        """
+        with self._lock:
+            mask = self._filter_mask(where)
+            if ids is not None:
+                selected = np.zeros_like(mask)
+                selected[[self._rows[doc_id] for doc_id in ids if doc_id in self._rows]] = True
+                mask &= selected
+            rows = np.flatnonzero(mask)
+
+            result = {"ids": [self._ids[row] for row in rows]}
+            if "metadatas" in include:
+                result["metadatas"] = [dict(self._metadatas[row]) for row in rows]
+            if "documents" in include:
+                result["documents"] = [self._read_text(row) for row in rows]
+            if "embeddings" in include:
+                vectors = np.asarray(self._vectors[rows], dtype=np.float32) if len(rows) else np.zeros((0, self.dim or 0))
+                if self._scales is not None and len(rows):
+                    vectors *= self._scales[rows][:, None]
+                result["embeddings"] = vectors
+            return result
+
+    def __len__(self) -> int:
+        return len(self._rows)
@@ -0,0 +1,127 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+import numpy as np
+
+from embed.config import EMBED_WORKERS, EMBED_THREADS_PER_WORKER, EMBED_SHARD_SIZE
+
+# The embedding model of a worker process, loaded once by _init_worker
+_worker_model = None
+
+def _init_worker(model_name: str, threads: int):
+    """
+    Load the embedding model in a worker process with a bounded number of threads.
+
+    Args:
+        model_name (str): The name of the embedding model.
+        threads (int): The number of intra-op threads the worker may use.
+    """
+    global _worker_model
+
+    # Thread pools are sized when torch and the tokenizers are first imported
+    for variable in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[variable] = str(threads)
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+    from langchain_huggingface import HuggingFaceEmbeddings
+    _worker_model = HuggingFaceEmbeddings(model_name=model_name)
+
+def _embed_shard(texts: List[str]) -> np.ndarray:
+    """
+    Embed one shard of texts in a worker process.
+
+    Args:
+        texts (List[str]): The texts to embed.
+
+    Returns:
+        np.ndarray: One float32 row per text, which pickles far smaller than nested lists.
+    """
+    return np.asarray(_worker_model.embed_documents(texts), dtype=np.float32)
+
+class ParallelEmbeddings:
+    """
+    An embedding function that shards documents across a pool of worker
+    processes, each holding its own copy of the model.
+
+    Shards are returned in input order, so callers see the same result as a
+    single-process embed_documents call. The pool is started on first use and
+    kept until close() so the model is loaded once per worker.
+    """
+
+    def __init__(self, model_name: str, workers: int = EMBED_WORKERS,
+                 threads_per_worker: int = EMBED_THREADS_PER_WORKER, shard_size: int = EMBED_SHARD_SIZE):
+        """
+        Initialize the ParallelEmbeddings with the given parameters.
+
+        Args:
+            model_name (str): The name of the embedding model.
+            workers (int): The number of worker processes, or 0 to use every core.
+            threads_per_worker (int): The number of threads each worker may use.
+            shard_size (int): The number of texts sent to a worker at once.
+        """
+        self.model_name = model_name
+        self.workers = workers or os.cpu_count() or 1
+        self.threads_per_worker = threads_per_worker
+        self.shard_size = shard_size
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        """
+        The worker pool, started on first access.
+        """
+        if self._executor is None:
+            # Workers are spawned rather than forked so they never inherit a parent's torch thread pool
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.model_name, self.threads_per_worker)
+            )
+        return self._executor
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed documents across the worker pool.
+
+        Args:
+            texts (List[str]): The texts to embed.
+
+        Returns:
+            List[List[float]]: One embedding per text, in input order.
+        """
+        if not texts:
+            return []
+
+        # Split evenly so every worker gets a share of small batches too
+        shard_size = min(self.shard_size, -(-len(texts) // self.workers))
+        shards = [texts[start:start + shard_size] for start in range(0, len(texts), shard_size)]
+        return np.concatenate(list(self.executor.map(_embed_shard, shards))).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Embed a query in one of the workers.
+
+        Args:
+            text (str): The query to embed.
+
+        Returns:
+            List[float]: The query embedding.
+        """
+        return self.embed_documents([text])[0]
+
+    def close(self):
+        """
+        Shut down the worker pool and release the model copies.
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
@@ -0,0 +1,5 @@
+CONTEXT_TOKENIZER = "unsloth/Llama-3.2-1B-Instruct"  # ungated copy of the tokenizer behind Ollama's llama3.2
+CONTEXT_MAX_TOKENS = 1024  # token budget for retrieved context in the RAG prompt
+CONTEXT_MMR_LAMBDA = 0.7  # relevance vs. diversity trade-off when ordering chunks
+CONTEXT_DEDUP_THRESHOLD = 0.92  # chunks at least this similar to an already selected one are dropped
+CONTEXT_SEPARATOR = "\n\n"
@@ -0,0 +1,313 @@
+from __future__ import annotations
+
+import re
+import logging
+from typing import TYPE_CHECKING, Callable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from llm.config import (CONTEXT_TOKENIZER, CONTEXT_MAX_TOKENS, CONTEXT_MMR_LAMBDA, CONTEXT_DEDUP_THRESHOLD,
+                        CONTEXT_SEPARATOR)
+
+if TYPE_CHECKING:
+    from langchain.schema import Document
+
+WORD_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+class ContextBuilder:
+    """
+    A class to assemble retrieved chunks into a compact, token-budgeted RAG context.
+
+    Chunks that were split from the same source with overlap are stitched back
+    together, near-duplicates are dropped with maximal marginal relevance
+    (MMR), and the survivors are packed in relevance order until the token
+    budget of the target model is spent.
+    """
+
+    def __init__(self, embedding_function=None, tokenizer: Union[str, Callable[[List[str]], List[int]]] = CONTEXT_TOKENIZER,
+                 max_tokens: int = CONTEXT_MAX_TOKENS, mmr_lambda: float = CONTEXT_MMR_LAMBDA,
+                 dedup_threshold: float = CONTEXT_DEDUP_THRESHOLD, separator: str = CONTEXT_SEPARATOR,
+                 vector_store=None):
+        """
+        Initialize the ContextBuilder with the given parameters.
+
+        Args:
+            embedding_function: The embedding function of the vector store, used for MMR on chunks
+                whose stored embeddings are not available. If None, word overlap is used as the
+                similarity measure instead.
+            tokenizer (Union[str, Callable]): A Hugging Face tokenizer name, or a function returning
+                the token count of each text in a list.
+            max_tokens (int): The token budget of the assembled context.
+            mmr_lambda (float): The weight of query relevance against redundancy in MMR.
+            dedup_threshold (float): The similarity at or above which a chunk counts as a duplicate.
+            separator (str): The text placed between chunks.
+            vector_store: The VectorStore or VectorStoreManager the chunks were retrieved from. If set,
+                MMR compares the embeddings stored for the chunks and the cached query embedding
+                instead of embedding the chunks again.
+        """
+        self.embedding_function = embedding_function
+        self.vector_store = vector_store
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.mmr_lambda = mmr_lambda
+        self.dedup_threshold = dedup_threshold
+        self.separator = separator
+        self._count_tokens = None
+
+    @staticmethod
+    def _stitch(left: str, right: str, overlap: Optional[int] = None) -> str:
+        """
+        Join two texts, dropping the longest suffix of `left` that is a prefix of `right`.
+        If the character overlap of the two texts is known, it is dropped from `right` directly.
+        """
+        if overlap is not None:
+            return left + right[overlap:] if overlap >= 0 else f"{left} {right}"
+        for size in range(min(len(left), len(right)), 0, -1):
+            if left.endswith(right[:size]):
+                return left + right[size:]
+        return f"{left} {right}"
+
+    def merge_adjacent(self, docs: List[Document]) -> List[Document]:
+        """
+        Merge chunks that are consecutive pieces of the same source text.
+
+        Chunks are matched on their location, file and key metadata and their
+        chunk_index; the overlap the chunker repeated between them is removed,
+        using the start_index and end_index offsets of the chunks when present.
+        The merged chunk takes the rank of its best-ranked piece and lists the
+        ids of its pieces in its chunk_ids metadata.
+
+        Args:
+            docs (List[Document]): The retrieved chunks, best first.
+
+        Returns:
+            List[Document]: The merged chunks, best first.
+        """
+        from langchain.schema import Document
+        groups = {}
+        order = []
+        for rank, doc in enumerate(docs):
+            metadata = doc.metadata or {}
+            if "chunk_index" not in metadata:
+                order.append((rank, doc))
+                continue
+            source = (metadata.get("location"), metadata.get("file"), metadata.get("key"))
+            groups.setdefault(source, []).append((rank, doc))
+
+        for pieces in groups.values():
+            pieces.sort(key=lambda piece: piece[1].metadata["chunk_index"])
+            rank, current = pieces[0]
+            last_index = current.metadata["chunk_index"]
+            for next_rank, doc in pieces[1:]:
+                if doc.metadata["chunk_index"] == last_index + 1:
+                    overlap = None
+                    if "end_index" in current.metadata and "start_index" in doc.metadata:
+                        overlap = current.metadata["end_index"] - doc.metadata["start_index"]
+                    metadata = dict(current.metadata)
+                    metadata["chunk_ids"] = self._chunk_ids(current) + self._chunk_ids(doc)
+                    if "end_index" in doc.metadata:
+                        metadata["end_index"] = doc.metadata["end_index"]
+                    current = Document(page_content=self._stitch(current.page_content, doc.page_content, overlap),
+                                       metadata=metadata)
+                    rank = min(rank, next_rank)
+                else:
+                    order.append((rank, current))
+                    rank, current = next_rank, doc
+                last_index = doc.metadata["chunk_index"]
+            order.append((rank, current))
+
+        order.sort(key=lambda item: item[0])
+        return [doc for _, doc in order]
+
+    @staticmethod
+    def _chunk_ids(doc: Document) -> List[str]:
+        """
+        The ids of the stored chunks a document was retrieved or merged from.
+        """
+        chunk_ids = (doc.metadata or {}).get("chunk_ids")
+        if chunk_ids:
+            return list(chunk_ids)
+        return [doc.id] if getattr(doc, "id", None) else []
+
+    def _embed(self, query: str, docs: List[Document]) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Get the normalized embeddings of the query and the chunks.
+
+        Stored chunk embeddings are looked up in the vector store; a merged chunk
+        is represented by the mean of its pieces. Only chunks without stored
+        embeddings are embedded with the embedding function.
+
+        Returns:
+            Optional[Tuple[np.ndarray, np.ndarray]]: The query vector and one vector per chunk, or None
+                if some vectors are not available.
+        """
+        vectors: List[Optional[np.ndarray]] = [None] * len(docs)
+        if self.vector_store is not None:
+            chunk_ids = [self._chunk_ids(doc) for doc in docs]
+            stored = self.vector_store.get_embeddings([chunk_id for ids in chunk_ids for chunk_id in ids])
+            for index, ids in enumerate(chunk_ids):
+                pieces = [np.asarray(stored[chunk_id], dtype=np.float32) for chunk_id in ids if chunk_id in stored]
+                if pieces:
+                    pieces = [piece / max(np.linalg.norm(piece), 1e-12) for piece in pieces]
+                    vectors[index] = np.mean(pieces, axis=0)
+            query_vector = self.vector_store.embed_query(query)
+        elif self.embedding_function is not None:
+            query_vector = self.embedding_function.embed_query(query)
+        else:
+            return None
+
+        missing = [index for index, vector in enumerate(vectors) if vector is None]
+        if missing:
+            if self.embedding_function is None:
+                return None
+            embedded = self.embedding_function.embed_documents([docs[index].page_content for index in missing])
+            for index, vector in zip(missing, embedded):
+                vectors[index] = np.asarray(vector, dtype=np.float32)
+
+        vectors = np.stack(vectors).astype(np.float32)
+        query_vector = np.asarray(query_vector, dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        query_vector /= max(np.linalg.norm(query_vector), 1e-12)
+        return query_vector, vectors
+
+    def _similarities(self, query: str, docs: List[Document]):
+        """
+        Compute query-to-chunk and chunk-to-chunk similarities.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The query relevance vector and the pairwise similarity matrix.
+        """
+        embedded = self._embed(query, docs)
+        if embedded is not None:
+            query_vector, vectors = embedded
+            return vectors @ query_vector, vectors @ vectors.T
+
+        texts = [doc.page_content for doc in docs]
+
+        # Without embeddings, fall back to word set overlap; containment catches chunks repeated inside merged ones
+        words = [set(WORD_PATTERN.findall(text.lower())) for text in texts]
+        query_words = set(WORD_PATTERN.findall(query.lower()))
+
+        def overlap(a, b):
+            return len(a & b) / min(len(a), len(b)) if a and b else 0.0
+
+        relevance = np.asarray([overlap(query_words, w) for w in words], dtype=np.float32)
+        pairwise = np.asarray([[overlap(a, b) for b in words] for a in words], dtype=np.float32)
+        return relevance, pairwise
+
+    def select(self, query: str, docs: List[Document]) -> List[Document]:
+        """
+        Order chunks by maximal marginal relevance and drop near-duplicates.
+
+        Args:
+            query (str): The user query.
+            docs (List[Document]): The candidate chunks.
+
+        Returns:
+            List[Document]: The selected chunks in MMR order.
+        """
+        if len(docs) < 2:
+            return list(docs)
+
+        relevance, pairwise = self._similarities(query, docs)
+        remaining = list(range(len(docs)))
+        selected = []
+
+        while remaining:
+            if selected:
+                redundancy = pairwise[np.ix_(remaining, selected)].max(axis=1)
+            else:
+                redundancy = np.zeros(len(remaining), dtype=np.float32)
+
+            # Near-duplicates of something already selected add nothing to the prompt
+            keep = redundancy < self.dedup_threshold
+            remaining = [index for index, kept in zip(remaining, keep) if kept]
+            if not remaining:
+                break
+            redundancy = redundancy[keep]
+
+            scores = self.mmr_lambda * relevance[remaining] - (1 - self.mmr_lambda) * redundancy
+            best = remaining[int(np.argmax(scores))]
+            selected.append(best)
+            remaining.remove(best)
+
+        return [docs[index] for index in selected]
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        """
+        Count the tokens of several texts with the target model's tokenizer, in one batch.
+
+        Falls back to a word and punctuation count if the tokenizer cannot be loaded.
+
+        Args:
+            texts (List[str]): The texts to measure.
+
+        Returns:
+            List[int]: The token count of each text.
+        """
+        if self._count_tokens is None:
+            self._count_tokens = self._load_token_counter()
+        return self._count_tokens(texts)
+
+    def _load_token_counter(self) -> Callable[[List[str]], List[int]]:
+        """
+        Build the token counting function for the configured tokenizer.
+        """
+        if callable(self.tokenizer):
+            return self.tokenizer
+
+        try:
+            from transformers import AutoTokenizer
+            tokenizer = AutoTokenizer.from_pretrained(self.tokenizer)
+        except Exception as e:
+            logging.warning(f"Could not load tokenizer '{self.tokenizer}', estimating token counts instead: {e}")
+            return lambda texts: [len(WORD_PATTERN.findall(text)) for text in texts]
+
+        return lambda texts: [len(ids) for ids in tokenizer(texts, add_special_tokens=False)["input_ids"]]
+
+    def pack(self, docs: List[Document], max_tokens: Optional[int] = None) -> List[Document]:
+        """
+        Keep chunks in order while they fit in the token budget.
+
+        Chunks that would overflow the budget are skipped so that smaller,
+        lower-ranked chunks can still use the remaining space.
+
+        Args:
+            docs (List[Document]): The chunks to pack, best first.
+            max_tokens (int): Optional override of the token budget.
+
+        Returns:
+            List[Document]: The chunks that fit.
+        """
+        if not docs:
+            return []
+        max_tokens = self.max_tokens if max_tokens is None else max_tokens
+
+        counts = self.count_tokens([doc.page_content for doc in docs])
+        separator_tokens = self.count_tokens([self.separator])[0] if self.separator.strip() else 0
+        packed = []
+        used = 0
+        for doc, count in zip(docs, counts):
+            cost = count + (separator_tokens if packed else 0)
+            if used + cost > max_tokens:
+                continue
+            packed.append(doc)
+            used += cost
+        return packed
+
+    def build(self, query: str, docs: List[Document], max_tokens: Optional[int] = None) -> str:
+        """
+        Assemble the context string for a query from retrieved chunks.
+
+        Args:
+            query (str): The user query.
+            docs (List[Document]): The retrieved chunks, best first.
+            max_tokens (int): Optional override of the token budget.
+
+        Returns:
+            str: The context to place in the prompt.
+        """
+        docs = self.merge_adjacent(docs)
+        docs = self.select(query, docs)
+        docs = self.pack(docs, max_tokens=max_tokens)
+        return self.separator.join(doc.page_content for doc in docs)
@@ -1,16 +1,29 @@
-from transformers import LlamaTokenizer, LlamaForCausalLM, pipeline
-
 class RAGQuery:
     def __init__(self, model_name: str = "meta-llama/Llama-2-7b-chat-hf", device: int = 0):
         """
         Initialize the LLaMA model for RAG.
+        The model is loaded on the first query or on warmup().
         Args:
             model_name (str): The Hugging Face model name.
             device (int): Device ID for running the model (e.g., 0 for GPU, -1 for CPU).
         """
-        self.tokenizer = LlamaTokenizer.from_pretrained(model_name)
-        self.model = LlamaForCausalLM.from_pretrained(model_name, device_map="auto" if device >= 0 else None)
-        self.pipeline = pipeline("text-generation", model=self.model, tokenizer=self.tokenizer, device=device)
+        self.model_name = model_name
+        self.device = device
+        self.tokenizer = None
+        self.model = None
+        self.pipeline = None
+
+    def warmup(self):
+        """
+        Load the tokenizer, model and generation pipeline if they are not loaded yet.
+        """
+        if self.pipeline is not None:
+            return
+
+        from transformers import LlamaTokenizer, LlamaForCausalLM, pipeline
+        self.tokenizer = LlamaTokenizer.from_pretrained(self.model_name)
+        self.model = LlamaForCausalLM.from_pretrained(self.model_name, device_map="auto" if self.device >= 0 else None)
+        self.pipeline = pipeline("text-generation", model=self.model, tokenizer=self.tokenizer, device=self.device)
 
     def query(self, context: str, question: str, max_length: int = 512) -> str:
         """
@@ -22,6 +35,7 @@ class RAGQuery:
         Returns:
             str: The generated response from the model.
         """
+        self.warmup()
         prompt = f"""You are a knowledgeable assistant. Use the context below to answer the question thoughtfully:
         Context: {context}
         Question: {question}
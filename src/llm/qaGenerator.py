@@ -1,5 +1,3 @@
-from transformers import pipeline
-import os
 from typing import Dict, List
 from storage.config import CLEANSED, SIXTEEN_PERSONALITIES_LOC, CHATGPT_PERSONALITIES_LOC, QA_PERSONALITIES_LOC
 from storage.storage import JSONDataManager
@@ -8,14 +6,33 @@ class QAGenerator:
     def __init__(self, model_name="google/flan-t5-small", device:int = 0, max_questions:int = 3, max_answers:int = 3):
         """
         Initialize the QA generator with a local Hugging Face model.
+        The model is loaded on first use or on warmup().
         Args:
             model_name (str): The name of the Hugging Face model.
         """
-        self.qa_generator = pipeline("text2text-generation", model=model_name, device=device)
+        self.model_name = model_name
+        self.device = device
+        self._qa_generator = None
         self.max_questions = max_questions
         self.max_answers = max_answers
         self.output_manager = JSONDataManager(CLEANSED, QA_PERSONALITIES_LOC)
 
+    @property
+    def qa_generator(self):
+        """
+        The text2text-generation pipeline, loaded on first access.
+        """
+        if self._qa_generator is None:
+            from transformers import pipeline
+            self._qa_generator = pipeline("text2text-generation", model=self.model_name, device=self.device)
+        return self._qa_generator
+
+    def warmup(self):
+        """
+        Load the model ahead of the first generation.
+        """
+        _ = self.qa_generator
+
     def generate_questions_answers(self, chunks:List) -> Dict[str, str]:
         """
         Generate question-answer pairs for given data.
@@ -77,17 +94,12 @@ class QAGenerator:
             data_manager (JSONDataManager): Instance managing data files.
             max_questions (int): Number of questions to generate per chunk.
         """
-        # Get list of files in the raw data location
-        raw_files = storage_manager.get_files()
-
-        for file in raw_files:
-            data = storage_manager.load_json(file)
-
+        # Stream the records of the data location
+        for filename, data in storage_manager.iter_records():
             # Generate QA dict for the loaded data
             qa_dict = self.generate_questions_answers(list(data.values()))
 
             # Save the generated QA dict in the cleansed storage
-            filename = os.path.splitext(os.path.basename(file))[0]  # Extract filename without extension
             self.output_manager.save_json(filename, qa_dict)
 
     def reset_storage(self):
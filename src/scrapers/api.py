@@ -130,11 +130,10 @@ class TopicExtraction(ChatGPT):
         Returns:
             list: A list of extracted topics.
         """
-        filenames = self.topics_storage_manager.get_files()
         extracted_topics = []
 
-        for file in filenames:
-            extracted_topics.extend(list(self.topics_storage_manager.load_json(file).keys()))
+        for _, data in self.topics_storage_manager.iter_records():
+            extracted_topics.extend(list(data.keys()))
 
         return extracted_topics
     
@@ -145,12 +144,9 @@ class TopicExtraction(ChatGPT):
         Returns:
             dict: Aggregated data from all extracted topics.
         """
-        filenames = self.topics_storage_manager.get_files()
         aggregated_data = {}
 
-        for file in filenames:
-            data = self.topics_storage_manager.load_json(file)
-            
+        for _, data in self.topics_storage_manager.iter_records():
             if isinstance(data, dict):
                 aggregated_data.update(data)
 
@@ -1,15 +1,79 @@
+import os
 import re
+import time
+import itertools
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
 from spellchecker import SpellChecker
 
 from storage.storage import JSONDataManager
 from storage.config import SIXTEEN_PERSONALITIES_LOC, CLEANSED, RAW, CHATGPT_PERSONALITIES_LOC, CHATGPT_TOPIC_DETAILS_LOC
+from scrapers.config import CLEAN_WORKERS, CLEAN_BATCH_SIZE, SPELL_CORRECTION, PERSONALITIES
+from scrapers.spelling import SpellingCorrector
+
+# Characters removed by clean_text: anything but word characters, whitespace and basic punctuation
+NON_TEXT_PATTERN = re.compile(r"[^\w\s.,!?]")
+# The ASCII characters NON_TEXT_PATTERN removes, for the bytes.translate fast path
+ASCII_NON_TEXT = bytes(c for c in range(128) if NON_TEXT_PATTERN.match(chr(c)))
+
+def clean_text(raw_text: str) -> str:
+    """
+    Remove non-text characters, lowercase and normalize whitespace.
+    
+    Args:
+        raw_text (str): The input text to clean.
+    
+    Returns:
+        str: The cleaned and normalized text.
+    """
+    if raw_text.isascii():
+        cleaned_text = raw_text.encode("ascii").translate(None, ASCII_NON_TEXT).decode("ascii")
+    else:
+        cleaned_text = NON_TEXT_PATTERN.sub("", raw_text)
+    # str.split() splits on exactly the characters \s matches, so this collapses and strips whitespace
+    return " ".join(cleaned_text.lower().split())
+
+def _iter_strings(value: Any) -> Iterator[str]:
+    """
+    Yield the strings of a JSON value, at any depth.
+    """
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from _iter_strings(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _iter_strings(item)
+
+def _clean_batch(clean_record: Callable, batch: List[tuple]) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Clean one batch of (name, input hash, data) records, in a worker process or inline.
+    """
+    return [clean_record(name, data) for name, _, data in batch]
 
 class DataCleaner:
     """
     A class to clean and normalize data.
+
+    Cleaning runs incrementally: a manifest kept with the cleansed data
+    records the hash of every raw record it has cleaned, and unchanged records
+    are skipped on the next run. Changed records are cleaned in batches,
+    spread across a pool of worker processes when there is more than one.
+    With spell correction on, the text values of each cleaned batch are
+    corrected together on the batch vocabulary, leaving alone the acronyms
+    found in the raw batch, which cleaning lowercases.
     """
 
-    def __init__(self, raw_loc: str, cleansed_loc: str, subpath: str):
+    # Bump when the cleaning of a source changes, so every raw record is cleaned again
+    STAGE_VERSION = 1
+    # Keys of cleansed records whose values are never spell corrected
+    SPELLING_SKIP_KEYS: Tuple[str, ...] = ()
+
+    def __init__(self, raw_loc: str, cleansed_loc: str, subpath: str, workers: int = CLEAN_WORKERS,
+                 batch_size: int = CLEAN_BATCH_SIZE, spell_correction: bool = SPELL_CORRECTION):
         """
         Initialize the DataCleaner with storage locations and subpath.
         
@@ -17,10 +81,40 @@ class DataCleaner:
             raw_loc (str): The location of raw data.
             cleansed_loc (str): The location of cleansed data.
             subpath (str): The subpath for data storage.
+            workers (int): The number of worker processes, or 0 to use every core.
+            batch_size (int): The number of records cleaned per batch.
+            spell_correction (bool): Whether to correct the spelling of cleansed text.
         """
-        self.spellchecker = SpellChecker()
+        self._corrector = None
+        self.spell_correction = spell_correction
         self.raw_storage_manager = JSONDataManager(raw_loc, subpath)
         self.cleansed_storage_manager = JSONDataManager(cleansed_loc, subpath)
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+
+    def __getstate__(self) -> dict:
+        # Cleaners are sent to worker processes with every batch; spell correction stays in this process
+        state = self.__dict__.copy()
+        state["_corrector"] = None
+        return state
+
+    @property
+    def corrector(self) -> SpellingCorrector:
+        """
+        The spelling corrector, loaded on first use.
+        """
+        if self._corrector is None:
+            # Personality type codes and names are domain words, not misspellings
+            known_words = list(PERSONALITIES) + list(PERSONALITIES.values())
+            self._corrector = SpellingCorrector(known_words=known_words)
+        return self._corrector
+
+    @property
+    def spellchecker(self) -> SpellChecker:
+        """
+        The spell checker behind the spelling corrector.
+        """
+        return self.corrector.checker
 
     def remove_content_level(self, data: dict) -> dict:
         """
@@ -50,10 +144,7 @@ class DataCleaner:
         Returns:
             str: The cleaned and normalized text.
         """
-        cleaned_text = re.sub(r"[^\w\s.,!?]", "", raw_text)  # Remove non-alphanumeric and non-punctuation characters
-        cleaned_text = cleaned_text.lower()  # Convert to lowercase
-        cleaned_text = re.sub(r"\s+", " ", cleaned_text).strip()  # Normalize whitespace
-        return cleaned_text
+        return clean_text(raw_text)
 
     def correct_spelling(self, text: str) -> str:
         """
@@ -65,11 +156,32 @@ class DataCleaner:
         Returns:
             str: The text with corrected spelling.
         """
-        words = text.split()
-        corrected_words = [
-            self.spellchecker.correction(word) if self.spellchecker.correction(word) else word for word in words
+        return self.corrector.correct(text)
+
+    def correct_records(self, records: List[Tuple[str, Dict[str, Any]]],
+                        protected: Iterable[str] = ()) -> List[Tuple[str, Dict[str, Any]]]:
+        """
+        Correct the spelling of the text values of cleansed records, on their combined vocabulary.
+        
+        Args:
+            records (List[Tuple[str, Dict[str, Any]]]): (file name, cleansed data) pairs.
+            protected (Iterable[str]): Words to leave as is, such as the acronyms of the raw records.
+        
+        Returns:
+            List[Tuple[str, Dict[str, Any]]]: The records with corrected text values.
+        """
+        fields = [
+            (index, key)
+            for index, (_, data) in enumerate(records)
+            for key, value in data.items()
+            if isinstance(value, str) and key not in self.SPELLING_SKIP_KEYS
         ]
-        return " ".join(corrected_words)
+        corrected = self.corrector.correct_texts([records[index][1][key] for index, key in fields], protected)
+
+        records = [(filename, dict(data)) for filename, data in records]
+        for (index, key), value in zip(fields, corrected):
+            records[index][1][key] = value
+        return records
     
     def get_raw_storage_manager(self) -> JSONDataManager:
         """
@@ -89,6 +201,85 @@ class DataCleaner:
         """
         return self.cleansed_storage_manager
     
+    def process_records(self, clean_record: Callable[[str, Any], Tuple[str, Dict[str, Any]]]) -> Dict[str, int]:
+        """
+        Clean the raw records that are new or changed since the last run and save them.
+        
+        Args:
+            clean_record (Callable): Turns a raw record name and data into the cleansed file name and data.
+        
+        Returns:
+            Dict[str, int]: Counts of processed and skipped records, and the records cleaned per second.
+        """
+        start = time.perf_counter()
+        spelling_version = SpellingCorrector.VERSION if self.spell_correction else False
+        manifest = self.cleansed_storage_manager.manifest("clean", [self.STAGE_VERSION, spelling_version])
+
+        def changed_records():
+            for name, data in self.raw_storage_manager.iter_records():
+                input_hash = manifest.hash(data)
+                if not manifest.is_current(name, input_hash):
+                    yield name, input_hash, data
+
+        batches = self._batched(changed_records())
+        for batch, cleansed in self._clean_batches(clean_record, batches):
+            if self.spell_correction:
+                # Cleaning lowercases text, so acronyms are only recognizable in the raw records
+                acronyms = self.corrector.acronyms(_iter_strings([data for _, _, data in batch]))
+                cleansed = self.correct_records(cleansed, acronyms)
+            self.cleansed_storage_manager.save_many(cleansed)
+            for (name, input_hash, _), (_, output) in zip(batch, cleansed):
+                manifest.update(name, input_hash, output)
+
+        manifest.save()
+        if self.spell_correction:
+            self.corrector.save()
+        elapsed = time.perf_counter() - start
+        throughput = manifest.processed / elapsed if elapsed > 0 else 0.0
+        print(f"Cleansed '{self.raw_storage_manager.subpath}': {manifest.summary()}, "
+              f"{throughput:.0f} records/s.")
+        return {"processed": manifest.processed, "skipped": manifest.skipped, "records_per_second": throughput}
+
+    def _batched(self, records: Iterable[tuple]) -> Iterator[List[tuple]]:
+        """
+        Group records into lists of batch_size.
+        """
+        records = iter(records)
+        while True:
+            batch = list(itertools.islice(records, self.batch_size))
+            if not batch:
+                return
+            yield batch
+
+    def _clean_batches(self, clean_record: Callable, batches: Iterator[List[tuple]]) -> Iterator[Tuple[list, list]]:
+        """
+        Clean batches of (name, input hash, data) records in order, across a process pool
+        when there is more than one batch.
+
+        Yields:
+            Tuple[list, list]: Each batch with its (cleansed file name, cleansed data) pairs.
+        """
+        first = next(batches, None)
+        second = next(batches, None)
+        batches = itertools.chain([batch for batch in (first, second) if batch is not None], batches)
+        if self.workers == 1 or second is None:
+            for batch in batches:
+                yield batch, _clean_batch(clean_record, batch)
+            return
+
+        # Workers are spawned rather than forked, like the embedding workers
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            # Keep a bounded number of batches in flight so memory does not grow with the input
+            pending = deque()
+            for batch in batches:
+                pending.append((batch, executor.submit(_clean_batch, clean_record, batch)))
+                if len(pending) >= 2 * self.workers:
+                    batch, future = pending.popleft()
+                    yield batch, future.result()
+            while pending:
+                batch, future = pending.popleft()
+                yield batch, future.result()
+
     def reset_cleansed_storage(self) -> None:
         """
         Reset the cleansed storage.
@@ -100,83 +291,97 @@ class SixteenPersonalityDataCleaner(DataCleaner):
     A class to clean and normalize data for sixteen personalities.
     """
 
-    def __init__(self):
+    SPELLING_SKIP_KEYS = ('ptype',)
+
+    def __init__(self, workers: int = CLEAN_WORKERS, spell_correction: bool = SPELL_CORRECTION):
         """
         Initialize the SixteenPersonalityDataCleaner with specific storage locations.
+        
+        Args:
+            workers (int): The number of worker processes, or 0 to use every core.
+            spell_correction (bool): Whether to correct the spelling of cleansed text.
         """
-        super().__init__(RAW, CLEANSED, SIXTEEN_PERSONALITIES_LOC)
+        super().__init__(RAW, CLEANSED, SIXTEEN_PERSONALITIES_LOC, workers=workers, spell_correction=spell_correction)
 
-    def process_personality_data(self) -> None:
+    def process_personality_data(self) -> Dict[str, int]:
         """
         Process and clean personality data.
         """
-        files = self.raw_storage_manager.get_files()
-        for file in files:
-            data = self.raw_storage_manager.load_json(file)
-            data = self.remove_content_level(data)
+        return self.process_records(self.clean_record)
+
+    def clean_record(self, name: str, data: dict) -> Tuple[str, dict]:
+        """
+        Clean one raw personality record.
+        """
+        data = self.remove_content_level(data)
 
-            for key, value in data.items():
-                if key == 'ptype':
-                    continue
-                value = self.clean_text(value)
-                # Uncomment the following line if you want to include spell correction
-                # value = self.correct_spelling(value)
-                data[key] = value
+        for key, value in data.items():
+            if key == 'ptype':
+                continue
+            data[key] = self.clean_text(value)
 
-            self.cleansed_storage_manager.save_json(data['ptype'], data)
+        return data['ptype'], data
 
 class ChatGPTPersonalityDataCleaner(DataCleaner):
     """
     A class to clean and normalize data for ChatGPT personalities.
     """
 
-    def __init__(self):
+    def __init__(self, workers: int = CLEAN_WORKERS, spell_correction: bool = SPELL_CORRECTION):
         """
         Initialize the ChatGPTPersonalityDataCleaner with specific storage locations.
+        
+        Args:
+            workers (int): The number of worker processes, or 0 to use every core.
+            spell_correction (bool): Whether to correct the spelling of cleansed text.
         """
-        super().__init__(RAW, CLEANSED, CHATGPT_PERSONALITIES_LOC)
+        super().__init__(RAW, CLEANSED, CHATGPT_PERSONALITIES_LOC, workers=workers, spell_correction=spell_correction)
 
-    def process_personality_data(self) -> None:
+    def process_personality_data(self) -> Dict[str, int]:
         """
         Process and clean personality data.
         """
-        files = self.raw_storage_manager.get_files()
-        for file in files:
-            data = self.raw_storage_manager.load_json(file)
+        return self.process_records(self.clean_record)
 
-            for key, value in data.items():
-                value = self.clean_text(value)
-                # Uncomment the following line if you want to include spell correction
-                # value = self.correct_spelling(value)
-                data[key] = value
+    def clean_record(self, ptype: str, data: dict) -> Tuple[str, dict]:
+        """
+        Clean one raw personality record.
+        """
+        for key, value in data.items():
+            data[key] = self.clean_text(value)
 
-            ptype = file.split('/')[-1].split('.')[0]
-            self.cleansed_storage_manager.save_json(ptype, data)
+        return ptype, data
 
 class ChatGPTTopicDataCleaner(DataCleaner):
     """
     A class to clean and normalize data for ChatGPT topics.
     """
 
-    def __init__(self):
+    def __init__(self, workers: int = CLEAN_WORKERS, spell_correction: bool = SPELL_CORRECTION):
         """
         Initialize the ChatGPTTopicDataCleaner with specific storage locations.
+        
+        Args:
+            workers (int): The number of worker processes, or 0 to use every core.
+            spell_correction (bool): Whether to correct the spelling of cleansed text.
         """
-        super().__init__(RAW, CLEANSED, CHATGPT_TOPIC_DETAILS_LOC)
+        super().__init__(RAW, CLEANSED, CHATGPT_TOPIC_DETAILS_LOC, workers=workers, spell_correction=spell_correction)
 
-    def process_topic_details_data(self) -> None:
+    def process_topic_details_data(self) -> Dict[str, int]:
         """
         Process and clean topic details data.
         """
-        files = self.raw_storage_manager.get_files()
-        for file in files:
-            data = self.raw_storage_manager.load_json(file)
+        return self.process_records(self.clean_record)
 
-            topic = data.get("topic", "")
-            description = data.get("description", "")
-            explanation = data.get("explanation", "")
+    def clean_record(self, name: str, data: dict) -> Tuple[str, dict]:
+        """
+        Clean one raw topic details record.
+        """
+        topic = data.get("topic", "")
+        description = data.get("description", "")
+        explanation = data.get("explanation", "")
 
-            description = self.clean_text(description)
-            explanation = self.clean_text(explanation)
+        description = self.clean_text(description)
+        explanation = self.clean_text(explanation)
 
-            self.cleansed_storage_manager.save_json(topic, {topic: explanation})
+        return topic, {topic: explanation}
@@ -31,5 +31,26 @@ PERSONALITIES_ENDPOINTS = {
     "conclusion": "-conclusion"
 }
 
+# scraping parameters
+SCRAPER_ASYNC = True  # fetch pages concurrently instead of one by one with a random pause before each
+SCRAPER_CONCURRENCY = 8  # requests in flight at once across all hosts
+SCRAPER_RATE_PER_HOST = 1.0  # requests per second allowed to each host
+SCRAPER_BURST = 1  # requests a host may receive at once after being idle
+SCRAPER_JITTER = 1.0  # maximum random delay in seconds added before each request
+SCRAPER_TIMEOUT = 10  # seconds before a request is abandoned
+HTTP_CACHE = True  # revalidate cached pages with conditional requests instead of downloading them again
+HTTP_CACHE_DIR = '../data/http_cache'
+HTTP_CACHE_OFFLINE = False  # serve pages from the cache only, without any network access
+HTML_PARSER = 'lxml'  # 'lxml' or 'html.parser'; lxml falls back to html.parser if it is not installed
+HTML_PARSE_ONLY = 'article'  # tag whose subtrees alone are parsed, None to parse whole pages
+
 #chatGPT parameters
 TOPIC_COMMUNICATION = 'communication'
+
+# cleansing parameters
+CLEAN_WORKERS = 0  # worker processes that clean record batches, 0 for every core
+CLEAN_BATCH_SIZE = 256  # raw records cleaned per batch
+SPELL_CORRECTION = False  # correct the spelling of cleansed text
+SPELLING_CACHE_PATH = '../data/spelling_cache.json'  # corrections cached across runs
+SPELLING_LANGUAGE = 'en'
+SPELLING_MAX_WORD_LENGTH = 20  # longer words are left as is; their correction is slow and rarely right
@@ -0,0 +1,152 @@
+import os
+import json
+import hashlib
+import logging
+import tempfile
+from typing import Dict, Optional
+
+from scrapers.config import HTTP_CACHE_DIR
+
+class CachedResponse:
+    """
+    A response body stored in the HTTP cache, with the validators it was served with.
+    """
+
+    def __init__(self, url: str, body: bytes, encoding: Optional[str] = None, etag: Optional[str] = None,
+                 last_modified: Optional[str] = None):
+        """
+        Initialize the CachedResponse with the given parameters.
+
+        Args:
+            url (str): The URL the body was fetched from.
+            body (bytes): The raw response body.
+            encoding (Optional[str]): The character encoding of the body, if known.
+            etag (Optional[str]): The ETag header of the response.
+            last_modified (Optional[str]): The Last-Modified header of the response.
+        """
+        self.url = url
+        self.body = body
+        self.encoding = encoding
+        self.etag = etag
+        self.last_modified = last_modified
+
+    @property
+    def text(self) -> str:
+        """
+        The body decoded with its encoding, UTF-8 if unknown.
+        """
+        return self.body.decode(self.encoding or "utf-8", errors="replace")
+
+class HTTPCache:
+    """
+    An on-disk cache of HTTP responses keyed by URL, revalidated with conditional requests.
+
+    Every successful response is stored with its ETag and Last-Modified
+    headers. The next request for the URL sends them back as If-None-Match
+    and If-Modified-Since, so an unchanged page costs a 304 round-trip
+    without a body, and the cached body is served. In offline mode, pages are
+    served from the cache only and the network is never used, which lets
+    scrapes be replayed in tests and benchmarks.
+    """
+
+    def __init__(self, directory: str = HTTP_CACHE_DIR, offline: bool = False):
+        """
+        Initialize the HTTPCache with the given parameters.
+
+        Args:
+            directory (str): The directory responses are stored in.
+            offline (bool): Whether to serve pages from the cache only, never from the network.
+        """
+        self.directory = directory
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+
+    def _paths(self, url: str):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        base = os.path.join(self.directory, key[:2], key)
+        return f"{base}.json", f"{base}.body"
+
+    def get(self, url: str) -> Optional[CachedResponse]:
+        """
+        Look up the cached response of a URL.
+
+        Args:
+            url (str): The URL.
+
+        Returns:
+            Optional[CachedResponse]: The cached response, or None if the URL is not cached.
+        """
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(body_path, "rb") as f:
+                body = f.read()
+        except FileNotFoundError:
+            return None
+        except (IOError, ValueError) as e:
+            logging.error(f"Ignoring unreadable cache entry for '{url}': {e}")
+            return None
+
+        # The body is written before its metadata; a mismatch means an interrupted overwrite
+        if meta.get("sha256") != hashlib.sha256(body).hexdigest():
+            return None
+        return CachedResponse(url, body, meta.get("encoding"), meta.get("etag"), meta.get("last_modified"))
+
+    @staticmethod
+    def conditional_headers(cached: Optional[CachedResponse]) -> Dict[str, str]:
+        """
+        Build the headers that revalidate a cached response.
+
+        Args:
+            cached (Optional[CachedResponse]): The cached response, if any.
+
+        Returns:
+            Dict[str, str]: The If-None-Match and If-Modified-Since headers its validators allow.
+        """
+        headers = {}
+        if cached is not None:
+            if cached.etag:
+                headers["If-None-Match"] = cached.etag
+            if cached.last_modified:
+                headers["If-Modified-Since"] = cached.last_modified
+        return headers
+
+    def store(self, url: str, body: bytes, headers, encoding: Optional[str] = None) -> CachedResponse:
+        """
+        Store a successful response.
+
+        Args:
+            url (str): The URL the response was fetched from.
+            body (bytes): The raw response body.
+            headers: The response headers, a case-insensitive mapping.
+            encoding (Optional[str]): The character encoding of the body, if known.
+
+        Returns:
+            CachedResponse: The stored response.
+        """
+        cached = CachedResponse(url, body, encoding, headers.get("ETag"), headers.get("Last-Modified"))
+        meta = {
+            "url": url,
+            "encoding": encoding,
+            "etag": cached.etag,
+            "last_modified": cached.last_modified,
+            "sha256": hashlib.sha256(body).hexdigest(),
+        }
+
+        meta_path, body_path = self._paths(url)
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        for path, data in ((body_path, body), (meta_path, json.dumps(meta).encode("utf-8"))):
+            # Write to a unique temporary file so concurrent writers of the same URL never clash
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return cached
+
+    def summary(self) -> str:
+        """
+        Describe how many pages were served from the cache.
+        """
+        return f"{self.hits} served from cache, {self.misses} downloaded"
@@ -0,0 +1,73 @@
+import time
+import asyncio
+from typing import Dict
+
+from scrapers.config import SCRAPER_RATE_PER_HOST, SCRAPER_BURST
+
+class TokenBucket:
+    """
+    An asyncio token bucket allowing `rate` acquisitions per second on average,
+    with bursts of up to `capacity`.
+    """
+
+    def __init__(self, rate: float = SCRAPER_RATE_PER_HOST, capacity: float = SCRAPER_BURST):
+        """
+        Initialize the TokenBucket with the given parameters.
+
+        Args:
+            rate (float): The number of tokens added per second.
+            capacity (float): The maximum number of tokens held, the largest possible burst.
+        """
+        if rate <= 0:
+            raise ValueError(f"rate ({rate}) must be positive.")
+
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """
+        Wait until a token is available and take it. Waiters are served in arrival order.
+        """
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+class HostRateLimiter:
+    """
+    One token bucket per host, created on first use.
+    """
+
+    def __init__(self, rate: float = SCRAPER_RATE_PER_HOST, burst: float = SCRAPER_BURST):
+        """
+        Initialize the HostRateLimiter with the given parameters.
+
+        Args:
+            rate (float): The requests per second allowed to each host.
+            burst (float): The number of requests a host may receive at once after being idle.
+        """
+        self.rate = rate
+        self.burst = burst
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    async def acquire(self, host: str):
+        """
+        Wait for the rate limit of a host.
+
+        Args:
+            host (str): The host about to be requested.
+        """
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            bucket = self._buckets[host] = TokenBucket(self.rate, self.burst)
+        await bucket.acquire()
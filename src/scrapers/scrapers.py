@@ -1,26 +1,148 @@
 import random
 import time
+import asyncio
 import requests
-from bs4 import BeautifulSoup
-from typing import Dict
+from bs4 import BeautifulSoup, SoupStrainer
+from bs4.dammit import EncodingDetector
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
 
-from scrapers.config import PERSONALITIES, PERSONALITIES_ENDPOINTS, PERSONALITIES_URL
+from scrapers.config import (PERSONALITIES, PERSONALITIES_ENDPOINTS, PERSONALITIES_URL, SCRAPER_ASYNC,
+                             SCRAPER_CONCURRENCY, SCRAPER_RATE_PER_HOST, SCRAPER_BURST, SCRAPER_JITTER,
+                             SCRAPER_TIMEOUT, HTTP_CACHE, HTTP_CACHE_DIR, HTTP_CACHE_OFFLINE, HTML_PARSER,
+                             HTML_PARSE_ONLY)
+from scrapers.http_cache import HTTPCache, CachedResponse
+from scrapers.ratelimit import HostRateLimiter
 from storage.config import SIXTEEN_PERSONALITIES_LOC, RAW
 from storage.storage import JSONDataManager
 
+try:
+    import lxml.html
+    from lxml import etree
+except ImportError:
+    lxml = None
+
 class BaseScraper:
     """
     A base class for web scrapers.
+
+    Besides fetching single pages, it fetches batches of pages concurrently
+    over one pooled HTTP session. Requests are bounded by a global
+    concurrency limit and a token-bucket rate limit per host, and each is
+    delayed by a random jitter, so a batch takes about as long as the
+    politeness budget rather than the sum of every request and pause.
+
+    Responses are kept in an HTTP cache and revalidated with conditional
+    requests, so pages that have not changed since the last scrape are not
+    downloaded again. In offline mode, pages are served from the cache only.
+
+    Pages are parsed from their raw bytes. With lxml, the page is parsed in C
+    and only the subtrees of the tag text is extracted from are handed to
+    BeautifulSoup, instead of building a tree of the whole page with the
+    pure-Python parser. Without lxml, html.parser builds only those subtrees.
     """
 
-    def __init__(self, base_url: str):
+    def __init__(self, base_url: str, concurrency: int = SCRAPER_CONCURRENCY,
+                 rate_per_host: float = SCRAPER_RATE_PER_HOST, burst: float = SCRAPER_BURST,
+                 jitter: float = SCRAPER_JITTER, cache: bool = HTTP_CACHE, offline: bool = HTTP_CACHE_OFFLINE,
+                 parser: str = HTML_PARSER, parse_only: Optional[str] = HTML_PARSE_ONLY):
         """
         Initialize the BaseScraper with a base URL.
         
         Args:
             base_url (str): The base URL for the scraper.
+            concurrency (int): The number of requests in flight at once.
+            rate_per_host (float): The requests per second allowed to each host.
+            burst (float): The number of requests a host may receive at once after being idle.
+            jitter (float): The maximum random delay in seconds added before each request.
+            cache (bool): Whether to cache responses and revalidate them instead of downloading them again.
+            offline (bool): Whether to serve pages from the cache only, without any network access.
+            parser (str): 'lxml' or 'html.parser'; lxml falls back to html.parser if it is not installed.
+            parse_only (Optional[str]): The tag whose subtrees alone are parsed, or None to parse whole pages.
         """
+        if parser not in ('lxml', 'html.parser'):
+            raise ValueError(f"Invalid parser '{parser}'. Valid options are: ['lxml', 'html.parser']")
+
         self.base_url = base_url
+        self.concurrency = concurrency
+        self.rate_per_host = rate_per_host
+        self.burst = burst
+        self.jitter = jitter
+        self.http_cache = HTTPCache(HTTP_CACHE_DIR, offline) if cache or offline else None
+        self.parser = parser if lxml is not None else 'html.parser'
+        self.parse_only = parse_only
+
+    @property
+    def offline(self) -> bool:
+        """
+        Whether pages are served from the cache only.
+        """
+        return self.http_cache is not None and self.http_cache.offline
+
+    def _cached_response(self, url: str) -> Optional[CachedResponse]:
+        return self.http_cache.get(url) if self.http_cache is not None else None
+
+    def _replay(self, url: str, cached: Optional[CachedResponse]) -> Optional[BeautifulSoup]:
+        """
+        Serve a page from the cache in offline mode.
+        """
+        if cached is None:
+            print(f"Error fetching {url}: not in the offline cache")
+            return None
+        self.http_cache.hits += 1
+        return self.parse_page(cached.body, cached.encoding)
+
+    def _resolve_response(self, url: str, cached: Optional[CachedResponse], status: int, body: bytes, headers,
+                          encoding: Optional[str]) -> CachedResponse:
+        """
+        Serve the cached body on 304 Not Modified and cache new bodies.
+        """
+        if status == 304 and cached is not None:
+            self.http_cache.hits += 1
+            return cached
+        if self.http_cache is None:
+            return CachedResponse(url, body, encoding)
+        self.http_cache.misses += 1
+        return self.http_cache.store(url, body, headers, encoding)
+
+    def parse_page(self, content: bytes, encoding: Optional[str] = None) -> BeautifulSoup:
+        """
+        Parse the raw content of a web page.
+        
+        Args:
+            content (bytes): The raw HTML content.
+            encoding (Optional[str]): The character encoding declared by the server; detected from the content if None.
+        
+        Returns:
+            BeautifulSoup: The parsed content, limited to the parse_only subtrees if set.
+        """
+        if self.parse_only and self.parser == 'lxml':
+            subtrees = self._extract_subtrees(content, encoding)
+            if subtrees is not None:
+                return BeautifulSoup(subtrees, 'lxml', from_encoding='utf-8')
+
+        parse_only = SoupStrainer(self.parse_only) if self.parse_only else None
+        return BeautifulSoup(content, self.parser, parse_only=parse_only, from_encoding=encoding)
+
+    def _extract_subtrees(self, content: bytes, encoding: Optional[str]) -> Optional[bytes]:
+        """
+        Cut the outermost parse_only elements out of a page with lxml.
+        
+        Returns:
+            Optional[bytes]: The UTF-8 serialized elements, or None if lxml cannot parse the page.
+        """
+        # Like BeautifulSoup, honour a <meta> charset before assuming UTF-8
+        encoding = encoding or EncodingDetector.find_declared_encoding(content, is_html=True) or 'utf-8'
+        try:
+            parser = lxml.html.HTMLParser(encoding=encoding)
+            tree = lxml.html.document_fromstring(content, parser=parser)
+        except (etree.ParserError, LookupError, ValueError):
+            return None
+
+        elements = tree.xpath(f"//{self.parse_only}[not(ancestor::{self.parse_only})]")
+        return b"".join(etree.tostring(element, encoding='utf-8', method='html', with_tail=False)
+                        for element in elements)
 
     def fetch_page(self, url: str) -> BeautifulSoup:
         """
@@ -32,14 +154,80 @@ class BaseScraper:
         Returns:
             BeautifulSoup: The parsed content of the web page.
         """
+        cached = self._cached_response(url)
+        if self.offline:
+            return self._replay(url, cached)
+
         try:
-            response = requests.get(url, timeout=10)
+            response = requests.get(url, headers=HTTPCache.conditional_headers(cached), timeout=SCRAPER_TIMEOUT)
             response.raise_for_status()
-            return BeautifulSoup(response.text, 'html.parser')
+            # Only a declared charset is passed on; otherwise the parser detects it from the content
+            encoding = response.encoding if 'charset' in response.headers.get('Content-Type', '').lower() else None
+            page = self._resolve_response(url, cached, response.status_code, response.content, response.headers,
+                                          encoding)
+            return self.parse_page(page.body, page.encoding)
         except requests.RequestException as e:
             print(f"Error fetching {url}: {e}")
             return None
 
+    def fetch_pages(self, urls: List[str]) -> Dict[str, Optional[BeautifulSoup]]:
+        """
+        Fetch web pages concurrently and return their parsed content.
+        
+        Args:
+            urls (List[str]): The URLs of the web pages to fetch.
+        
+        Returns:
+            Dict[str, Optional[BeautifulSoup]]: The parsed content of each page, None for pages that failed.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self._fetch_pages(urls))
+
+        # An event loop is already running, as in a notebook, so run the batch on a thread with its own loop
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run, self._fetch_pages(urls)).result()
+
+    async def _fetch_pages(self, urls: List[str]) -> Dict[str, Optional[BeautifulSoup]]:
+        """
+        Fetch web pages over one pooled session.
+        """
+        import aiohttp
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        limiter = HostRateLimiter(self.rate_per_host, self.burst)
+        timeout = aiohttp.ClientTimeout(total=SCRAPER_TIMEOUT)
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            pages = await asyncio.gather(*(self._fetch_page(session, semaphore, limiter, url) for url in urls))
+        return dict(zip(urls, pages))
+
+    async def _fetch_page(self, session, semaphore: asyncio.Semaphore, limiter: HostRateLimiter,
+                          url: str) -> Optional[BeautifulSoup]:
+        """
+        Fetch one web page once the concurrency limit, the rate limit of its host and the jitter allow it.
+        """
+        import aiohttp
+
+        cached = self._cached_response(url)
+        if self.offline:
+            return self._replay(url, cached)
+
+        async with semaphore:
+            await limiter.acquire(urlparse(url).netloc)
+            await asyncio.sleep(random.uniform(0, self.jitter))
+            try:
+                async with session.get(url, headers=HTTPCache.conditional_headers(cached)) as response:
+                    response.raise_for_status()
+                    body = await response.read()
+                    page = self._resolve_response(url, cached, response.status, body, response.headers,
+                                                  response.charset)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"Error fetching {url}: {e}")
+                return None
+        return self.parse_page(page.body, page.encoding)
+
     def extract_article_text(self, soup: BeautifulSoup) -> str:
         """
         Extract text content from an article element in the parsed HTML.
@@ -62,11 +250,16 @@ class PersonalitiesScraper(BaseScraper):
     A scraper for extracting personality information from a website.
     """
 
-    def __init__(self):
+    def __init__(self, concurrent: bool = SCRAPER_ASYNC, offline: bool = HTTP_CACHE_OFFLINE):
         """
         Initialize the PersonalitiesScraper with the required configuration.
+        
+        Args:
+            concurrent (bool): Whether to fetch pages concurrently rather than one by one.
+            offline (bool): Whether to replay pages from the HTTP cache without any network access.
         """
-        super().__init__(PERSONALITIES_URL)
+        super().__init__(PERSONALITIES_URL, offline=offline)
+        self.concurrent = concurrent
         self.datatype = RAW
         self.subpath = SIXTEEN_PERSONALITIES_LOC
         self.personalities_endpoints = PERSONALITIES_ENDPOINTS
@@ -83,15 +276,41 @@ class PersonalitiesScraper(BaseScraper):
         Returns:
             Dict[str, Dict[str, str]]: The scraped data.
         """
+        if self.concurrent:
+            return self.scrape_personalities([ptype])[ptype]
+
         data = {}
         for section_name, endpoint in self.personalities_endpoints.items():
-            time.sleep(random.uniform(1, 5))  # Add randomness to scraping
+            if not self.offline:
+                time.sleep(random.uniform(1, 5))  # Add randomness to scraping
             url = f"{self.base_url}{ptype}{endpoint}"
             soup = self.fetch_page(url)
             content = self.extract_article_text(soup)
             data[section_name] = {"content": content}
         return data
 
+    def scrape_personalities(self, ptypes: List[str]) -> Dict[str, Dict[str, Dict[str, str]]]:
+        """
+        Scrape information for several personality types, fetching every page concurrently.
+        
+        Args:
+            ptypes (List[str]): The personality types to scrape.
+        
+        Returns:
+            Dict[str, Dict[str, Dict[str, str]]]: The scraped data of each personality type.
+        """
+        urls = {
+            (ptype, section_name): f"{self.base_url}{ptype}{endpoint}"
+            for ptype in ptypes
+            for section_name, endpoint in self.personalities_endpoints.items()
+        }
+        pages = self.fetch_pages(list(urls.values()))
+
+        data = {ptype: {} for ptype in ptypes}
+        for (ptype, section_name), url in urls.items():
+            data[ptype][section_name] = {"content": self.extract_article_text(pages[url])}
+        return data
+
     def reset_storage(self):
         """
         Reset the storage for scraped data.
@@ -102,7 +321,14 @@ class PersonalitiesScraper(BaseScraper):
         """
         Main method to scrape all personalities and save the data.
         """
-        for ptype in self.personalities:
-            data = self.scrape_personality(ptype)
+        if self.concurrent:
+            scraped = self.scrape_personalities(list(self.personalities))
+        else:
+            scraped = {ptype: self.scrape_personality(ptype) for ptype in self.personalities}
+
+        for ptype, data in scraped.items():
             data['ptype'] = ptype
             self.json_manager.save_json(ptype, data)
+
+        if self.http_cache is not None:
+            print(f"Scraped pages: {self.http_cache.summary()}")
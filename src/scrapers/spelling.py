@@ -0,0 +1,206 @@
+import os
+import re
+import json
+import logging
+from collections import Counter
+from typing import Dict, Iterable, List, Set
+
+from spellchecker import SpellChecker
+
+from scrapers.config import SPELLING_CACHE_PATH, SPELLING_LANGUAGE, SPELLING_MAX_WORD_LENGTH
+
+# URLs are left untouched; words are runs of letters not joined to digits or underscores
+TOKEN_PATTERN = re.compile(r"(?P<url>(?:https?://|www\.)\S+)|\b(?P<word>[^\W\d_]+)\b")
+
+class SpellingCorrector:
+    """
+    A spelling corrector that works on the vocabulary of a batch of texts
+    rather than on every word occurrence.
+
+    The unique words of a batch are looked up in the dictionary at once, and
+    only the unknown ones go through the costly edit-distance correction,
+    each a single time. Corrections are memoized in a cache persisted across
+    runs, and the resulting word mapping is applied to every text in a single
+    regex pass. Numbers, words containing digits, URLs, acronyms, single
+    letters, overly long words and known domain words are never corrected.
+    Acronyms are recognized by their capitals, so text that is lowercased
+    before correction has to pass them in as protected words.
+    """
+
+    # Bump when corrections change for the same input, so corrected data is produced again
+    VERSION = 2
+
+    def __init__(self, cache_path: str = SPELLING_CACHE_PATH, language: str = SPELLING_LANGUAGE,
+                 max_word_length: int = SPELLING_MAX_WORD_LENGTH, known_words: Iterable[str] = ()):
+        """
+        Initialize the SpellingCorrector with the given parameters.
+
+        Args:
+            cache_path (str): The JSON file corrections are cached in, or None to keep them in memory only.
+            language (str): The dictionary language.
+            max_word_length (int): The length above which words are left as is.
+            known_words (Iterable[str]): Domain words to leave as is, on top of the dictionary.
+        """
+        self.cache_path = cache_path
+        self.language = language
+        self.max_word_length = max_word_length
+        self.known_words = {word.lower() for word in known_words}
+        self._checker = None
+        self._corrections: Dict[str, str] = self._load_cache()
+        self._dirty = False
+
+    @property
+    def checker(self) -> SpellChecker:
+        """
+        The spell checker, loaded on first use.
+        """
+        if self._checker is None:
+            self._checker = SpellChecker(language=self.language)
+        return self._checker
+
+    def _load_cache(self) -> Dict[str, str]:
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                cache = json.load(f)
+        except (IOError, ValueError) as e:
+            logging.error(f"Ignoring unreadable spelling cache '{self.cache_path}': {e}")
+            return {}
+        # Corrections depend on the dictionary they were made with
+        if cache.get("language") != self.language:
+            return {}
+        return cache.get("corrections", {})
+
+    def save(self):
+        """
+        Persist the corrections made since the cache was loaded.
+        """
+        if not self.cache_path or not self._dirty:
+            return
+        os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+        with open(f"{self.cache_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump({"language": self.language, "corrections": self._corrections}, f, ensure_ascii=False)
+        os.replace(f"{self.cache_path}.tmp", self.cache_path)
+        self._dirty = False
+
+    @staticmethod
+    def vocabulary(texts: Iterable[str]) -> Counter:
+        """
+        Count the lowercase words of texts, leaving out URLs and words containing digits.
+
+        Args:
+            texts (Iterable[str]): The texts.
+
+        Returns:
+            Counter: The number of occurrences of every word.
+        """
+        return Counter(
+            match.group("word").lower()
+            for text in texts
+            for match in TOKEN_PATTERN.finditer(text)
+            if match.group("word")
+        )
+
+    @staticmethod
+    def acronyms(texts: Iterable[str]) -> Set[str]:
+        """
+        Collect the words written in capitals, such as ESSC or MBTI.
+
+        Args:
+            texts (Iterable[str]): The texts, with their original capitalization.
+
+        Returns:
+            Set[str]: The lowercase forms of the acronyms.
+        """
+        return {
+            word.lower()
+            for text in texts
+            for word in (match.group("word") for match in TOKEN_PATTERN.finditer(text))
+            if word and len(word) > 1 and word.isupper()
+        }
+
+    def build_mapping(self, vocabulary: Dict[str, int], protected: Iterable[str] = ()) -> Dict[str, str]:
+        """
+        Correct a vocabulary, each unknown word once.
+
+        Args:
+            vocabulary (Dict[str, int]): Lowercase words and their number of occurrences.
+            protected (Iterable[str]): Lowercase words to leave as is, on top of the known words.
+
+        Returns:
+            Dict[str, str]: The corrections of the words that change.
+        """
+        protected = self.known_words.union(protected)
+        words = {
+            word for word in vocabulary
+            if 1 < len(word) <= self.max_word_length and word not in protected
+        }
+        misses = {word for word in words if word not in self._corrections}
+        if misses:
+            for word in self.checker.unknown(misses):
+                self._corrections[word] = self.checker.correction(word) or word
+                self._dirty = True
+
+        mapping = {}
+        for word in words:
+            correction = self._corrections.get(word, word)
+            if correction != word:
+                mapping[word] = correction
+        return mapping
+
+    @staticmethod
+    def apply(text: str, mapping: Dict[str, str]) -> str:
+        """
+        Replace the words of a text in a single pass, keeping their capitalization.
+
+        Args:
+            text (str): The text.
+            mapping (Dict[str, str]): Lowercase words and their corrections.
+
+        Returns:
+            str: The corrected text.
+        """
+        if not mapping:
+            return text
+
+        def replace(match: re.Match) -> str:
+            word = match.group("word")
+            if not word:
+                return match.group()
+            correction = mapping.get(word.lower())
+            # Acronyms are left as is
+            if correction is None or (word.isupper() and len(word) > 1):
+                return word
+            if word[0].isupper():
+                return correction.capitalize()
+            return correction
+
+        return TOKEN_PATTERN.sub(replace, text)
+
+    def correct_texts(self, texts: List[str], protected: Iterable[str] = ()) -> List[str]:
+        """
+        Correct the spelling of a batch of texts.
+
+        Args:
+            texts (List[str]): The texts.
+            protected (Iterable[str]): Words to leave as is, such as the acronyms of the texts before lowercasing.
+
+        Returns:
+            List[str]: The corrected texts, in order.
+        """
+        protected = self.acronyms(texts).union(word.lower() for word in protected)
+        mapping = self.build_mapping(self.vocabulary(texts), protected)
+        return [self.apply(text, mapping) for text in texts]
+
+    def correct(self, text: str) -> str:
+        """
+        Correct the spelling of one text.
+
+        Args:
+            text (str): The text.
+
+        Returns:
+            str: The corrected text.
+        """
+        return self.correct_texts([text])[0]
@@ -0,0 +1,146 @@
+import os
+import zlib
+import hashlib
+import tempfile
+from typing import Any
+
+from storage.config import BLOB_MIN_CHARS, BLOB_COMPRESSION, BLOB_COMPRESSION_LEVEL
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Frames written by zstd start with this magic number; anything else is zlib
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+# Errors raised by a blob that cannot be decompressed or decoded
+DECODE_ERRORS = (zlib.error, UnicodeDecodeError) + ((zstandard.ZstdError,) if zstandard is not None else ())
+
+class BlobStore:
+    """
+    A content-addressed store of compressed strings.
+
+    Strings of at least `min_chars` characters are written once, compressed,
+    to a file named by their SHA-256 hash, and replaced in records by a
+    `{"$blob": <hash>}` reference. Storing the same string again only writes
+    the reference. Blobs are compressed with zstd when the zstandard package
+    is installed and with zlib otherwise; both are read back either way.
+    """
+
+    BLOB_DIR = "_blobs"
+    REFERENCE_KEY = "$blob"
+
+    def __init__(self, directory: str, min_chars: int = BLOB_MIN_CHARS, compression: str = BLOB_COMPRESSION,
+                 level: int = BLOB_COMPRESSION_LEVEL):
+        """
+        Initialize the BlobStore with the given parameters.
+
+        Args:
+            directory (str): The data directory; blobs are kept in its _blobs subdirectory.
+            min_chars (int): The length from which strings are moved to blobs.
+            compression (str): 'zstd' or 'zlib'; zstd falls back to zlib if zstandard is not installed.
+            level (int): The compression level.
+        """
+        if compression not in ('zstd', 'zlib'):
+            raise ValueError(f"Invalid compression '{compression}'. Valid options are: ['zstd', 'zlib']")
+
+        self.blob_dir = os.path.join(directory, self.BLOB_DIR)
+        self.min_chars = min_chars
+        self.level = level
+        self._zstd = compression == 'zstd' and zstandard is not None
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    def _compress(self, data: bytes) -> bytes:
+        if self._zstd:
+            return zstandard.ZstdCompressor(level=self.level).compress(data)
+        return zlib.compress(data, min(self.level, 9))
+
+    @staticmethod
+    def _decompress(data: bytes) -> bytes:
+        if data.startswith(ZSTD_MAGIC):
+            if zstandard is None:
+                raise IOError("Blob is zstd-compressed but the zstandard package is not installed")
+            return zstandard.ZstdDecompressor().decompress(data)
+        return zlib.decompress(data)
+
+    def put(self, text: str) -> str:
+        """
+        Store a string unless it is already stored.
+
+        Args:
+            text (str): The string to store.
+
+        Returns:
+            str: The hash the string is stored under.
+        """
+        data = text.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a unique temporary file so concurrent writers of the same blob never clash
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "wb") as f:
+                f.write(self._compress(data))
+            os.replace(tmp_path, path)
+        return digest
+
+    def get(self, digest: str) -> str:
+        """
+        Read a stored string.
+
+        Args:
+            digest (str): The hash the string is stored under.
+
+        Returns:
+            str: The string.
+
+        Raises:
+            IOError: If the blob is missing or cannot be decompressed.
+        """
+        with open(self._path(digest), "rb") as f:
+            data = f.read()
+        try:
+            return self._decompress(data).decode("utf-8")
+        except DECODE_ERRORS as e:
+            raise IOError(f"Corrupt blob '{digest}': {e}") from e
+
+    def pack(self, value: Any) -> Any:
+        """
+        Replace the long strings of a JSON value by blob references, storing them.
+
+        Args:
+            value (Any): A JSON value.
+
+        Returns:
+            Any: The value with every long string, at any depth, replaced by a reference.
+        """
+        if isinstance(value, str):
+            if len(value) >= self.min_chars:
+                return {self.REFERENCE_KEY: self.put(value)}
+            return value
+        if isinstance(value, dict):
+            return {key: self.pack(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self.pack(item) for item in value]
+        return value
+
+    def unpack(self, value: Any) -> Any:
+        """
+        Resolve the blob references of a JSON value.
+
+        Args:
+            value (Any): A JSON value, as returned by pack.
+
+        Returns:
+            Any: The value with every reference replaced by its string.
+        """
+        if isinstance(value, dict):
+            if len(value) == 1 and isinstance(value.get(self.REFERENCE_KEY), str):
+                return self.get(value[self.REFERENCE_KEY])
+            return {key: self.unpack(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self.unpack(item) for item in value]
+        return value
@@ -0,0 +1,58 @@
+import json
+from typing import Any, Union
+
+# The fastest available JSON library: orjson, then msgspec, then the standard library
+try:
+    import orjson
+    JSON_LIBRARY = 'orjson'
+except ImportError:
+    orjson = None
+    try:
+        import msgspec
+        JSON_LIBRARY = 'msgspec'
+    except ImportError:
+        msgspec = None
+        JSON_LIBRARY = 'json'
+
+def loads(data: Union[bytes, str]) -> Any:
+    """
+    Parse a JSON document.
+
+    Args:
+        data (Union[bytes, str]): The document, as UTF-8 bytes or text.
+
+    Returns:
+        Any: The parsed value.
+
+    Raises:
+        ValueError: If the document is not valid JSON.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    if msgspec is not None:
+        try:
+            return msgspec.json.decode(data)
+        except msgspec.DecodeError as e:
+            raise ValueError(str(e)) from e
+    return json.loads(data)
+
+def dumps(value: Any, indent: bool = False) -> bytes:
+    """
+    Serialize a value to UTF-8 encoded JSON, with non-ASCII characters kept as is.
+
+    Args:
+        value (Any): The value to serialize.
+        indent (bool): Whether to indent by two spaces like json.dump(indent=2), or write compact JSON.
+
+    Returns:
+        bytes: The JSON document.
+    """
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(value, option=option)
+    if msgspec is not None:
+        encoded = msgspec.json.encode(value)
+        return msgspec.json.format(encoded, indent=2) if indent else encoded
+    if indent:
+        return json.dumps(value, indent=2, ensure_ascii=False).encode('utf-8')
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
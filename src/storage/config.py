@@ -3,6 +3,20 @@ CLEANSED = 'cleansed'
 RAW_DATA_LOC = '../data/raw/'
 CLEANSED_DATA_LOC = '../data/cleansed/'
 
+STORAGE_BACKEND = 'segments'  # 'json' for one JSON file per record, 'segments' for append-only JSONL segments, 'sqlite' for one SQLite database
+SEGMENT_MAX_BYTES = 64 * 1024 * 1024  # size at which a new segment file is started
+SEGMENT_COMPACT_MIN_RECORDS = 1000  # stores with fewer records are never compacted
+SEGMENT_INDEX_SAVE_BYTES = 1024 * 1024  # bytes appended between saves of the key index
+SQLITE_PATH = '../data/storage.sqlite3'  # database of the 'sqlite' backend, shared by every datatype and subpath
+SQLITE_FETCH_SIZE = 512  # rows fetched at once when streaming records
+STORAGE_COMPACT_JSON = False  # write compact JSON files with the 'json' backend instead of indenting them
+STORAGE_PREFETCH_RECORDS = 64  # records read ahead on a background thread by JSONDataManager.iter_records
+RAW_BLOB_STORAGE = False  # store long strings of raw records once, compressed, in a content-addressed blob store;
+                          # references are resolved on read either way, so it can be switched at any time
+BLOB_MIN_CHARS = 1024  # strings at least this long are moved to blobs
+BLOB_COMPRESSION = 'zstd'  # 'zstd' (falls back to zlib without the zstandard package) or 'zlib'
+BLOB_COMPRESSION_LEVEL = 3
+
 SIXTEEN_PERSONALITIES_LOC = '16personalities/'
 CHATGPT_PERSONALITIES_LOC = 'chatgptPersonalities/'
 QA_PERSONALITIES_LOC = 'qaPersonalities/'
@@ -0,0 +1,110 @@
+import os
+import json
+import time
+import hashlib
+import logging
+from typing import Any, Dict
+
+from storage import codec
+
+class StageManifest:
+    """
+    A record of which inputs a pipeline stage has already processed.
+
+    Every processed input is stored with the hash of its content, the hash of
+    the output it produced, the stage version and a timestamp. A stage skips
+    inputs whose content hash and stage version are unchanged, so a rerun only
+    touches new and modified inputs. Bumping the stage version reprocesses
+    everything.
+    """
+
+    MANIFEST_DIR = "_manifests"
+
+    def __init__(self, directory: str, stage: str, version: Any):
+        """
+        Initialize the StageManifest with the given parameters.
+
+        Args:
+            directory (str): The data directory the manifest is kept in; it is removed with the directory.
+            stage (str): The name of the stage.
+            version (Any): The stage version, any JSON value; entries of another version are stale.
+        """
+        self.stage = stage
+        self.version = version
+        self.path = os.path.join(directory, self.MANIFEST_DIR, f"{stage}.json")
+        self.processed = 0
+        self.skipped = 0
+        self._entries: Dict[str, Dict[str, Any]] = self._load()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.path, "rb") as f:
+                return codec.loads(f.read())["entries"]
+        except FileNotFoundError:
+            return {}
+        except (IOError, ValueError, KeyError, TypeError) as e:
+            logging.error(f"Ignoring unreadable manifest '{self.path}': {e}")
+            return {}
+
+    @staticmethod
+    def hash(data: Any) -> str:
+        """
+        Hash the content of an input or output.
+
+        Args:
+            data (Any): A JSON value.
+
+        Returns:
+            str: The hex digest of its serialized form.
+        """
+        return hashlib.sha256(codec.dumps(data)).hexdigest()
+
+    def is_current(self, name: str, input_hash: str) -> bool:
+        """
+        Check whether an input was processed in its current form by the current stage version.
+        Current inputs are counted as skipped.
+
+        Args:
+            name (str): The input name.
+            input_hash (str): The hash of the input content.
+
+        Returns:
+            bool: True if the input can be skipped.
+        """
+        entry = self._entries.get(name)
+        current = entry is not None and entry.get("input") == input_hash and entry.get("version") == self.version
+        if current:
+            self.skipped += 1
+        return current
+
+    def update(self, name: str, input_hash: str, output: Any = None):
+        """
+        Record that an input has been processed.
+
+        Args:
+            name (str): The input name.
+            input_hash (str): The hash of the input content.
+            output (Any): The output produced from the input, if any.
+        """
+        self._entries[name] = {
+            "input": input_hash,
+            "output": self.hash(output) if output is not None else None,
+            "version": self.version,
+            "timestamp": time.time(),
+        }
+        self.processed += 1
+
+    def save(self):
+        """
+        Atomically persist the manifest.
+        """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(f"{self.path}.tmp", "w", encoding="utf-8") as f:
+            json.dump({"stage": self.stage, "entries": self._entries}, f, indent=2, ensure_ascii=False)
+        os.replace(f"{self.path}.tmp", self.path)
+
+    def summary(self) -> str:
+        """
+        Describe what the current run processed and skipped.
+        """
+        return f"{self.processed} processed, {self.skipped} unchanged and skipped"
@@ -0,0 +1,444 @@
+import os
+import json
+import uuid
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from storage import codec
+from storage.config import SEGMENT_MAX_BYTES, SEGMENT_COMPACT_MIN_RECORDS, SEGMENT_INDEX_SAVE_BYTES
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+class SegmentStore:
+    """
+    An append-only record store made of JSONL segment files.
+
+    Every save appends one line holding the file name and its data, so a
+    write costs the size of the record rather than of the whole file. A small
+    key index maps each file name to the byte ranges of its records. Loading
+    a file replays its records in order: dict records are merged into the
+    current data like JSONDataManager.save_json, anything else replaces it.
+    Once most records are superseded, compaction rewrites one merged record
+    per file.
+
+    Several stores, in this or other processes, may share a directory. Every
+    operation first checks the segments on disk and indexes what other
+    stores appended, or everything again after a compaction or reset, which
+    write a new generation id. Where fcntl is available, writes take an
+    exclusive file lock and reads a shared one; elsewhere only one process
+    may write.
+    """
+
+    SEGMENT_DIR = "_segments"
+    INDEX_FILE = "index.json"
+    GENERATION_FILE = "GENERATION"
+    LOCK_FILE = "LOCK"
+
+    # One store per directory and process, so every manager of a directory sees the same index
+    _stores: Dict[str, "SegmentStore"] = {}
+    _stores_lock = threading.Lock()
+
+    @classmethod
+    def open(cls, directory: str) -> "SegmentStore":
+        """
+        Get the store of a directory, opening it on first use.
+
+        Args:
+            directory (str): The data directory.
+
+        Returns:
+            SegmentStore: The shared store of the directory.
+        """
+        key = os.path.abspath(directory)
+        with cls._stores_lock:
+            store = cls._stores.get(key)
+            if store is None:
+                store = cls._stores[key] = cls(directory)
+            return store
+
+    def __init__(self, directory: str, segment_max_bytes: int = SEGMENT_MAX_BYTES,
+                 compact_min_records: int = SEGMENT_COMPACT_MIN_RECORDS):
+        """
+        Initialize the SegmentStore with the given parameters.
+
+        Args:
+            directory (str): The data directory; segments are kept in its _segments subdirectory.
+            segment_max_bytes (int): The size at which a new segment is started.
+            compact_min_records (int): The number of records below which compaction never runs.
+        """
+        self.directory = directory
+        self.segment_dir = os.path.join(directory, self.SEGMENT_DIR)
+        self.segment_max_bytes = segment_max_bytes
+        self.compact_min_records = compact_min_records
+        self._lock = threading.RLock()
+
+        os.makedirs(self.segment_dir, exist_ok=True)
+        self._index: Dict[str, List[Tuple[int, int, int]]] = {}
+        self._sizes: Dict[int, int] = {}
+        self._records = 0
+        self._unsaved_bytes = 0
+        # The generation the index was built for; False until the index is first loaded
+        self._generation: Any = False
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.segment_dir, f"{segment:08d}.jsonl")
+
+    def _list_segments(self) -> List[int]:
+        """
+        List the ids of the segment files on disk, oldest first.
+        """
+        return sorted(int(name[:-6]) for name in os.listdir(self.segment_dir)
+                      if name.endswith(".jsonl") and name[:-6].isdigit())
+
+    @contextmanager
+    def _locked(self, exclusive: bool = False) -> Iterator[None]:
+        """
+        Hold the thread lock and the file lock of the directory, with the index brought up to date.
+        """
+        with self._lock:
+            if fcntl is None:
+                self._refresh(truncate=exclusive)
+                yield
+                return
+
+            os.makedirs(self.segment_dir, exist_ok=True)
+            with open(os.path.join(self.segment_dir, self.LOCK_FILE), "a+b") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+                try:
+                    self._refresh(truncate=exclusive)
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_generation(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.segment_dir, self.GENERATION_FILE), "r", encoding="utf-8") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _new_generation(self):
+        """
+        Record that the segments were rewritten, so other stores index them again.
+        """
+        self._generation = uuid.uuid4().hex
+        path = os.path.join(self.segment_dir, self.GENERATION_FILE)
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            f.write(self._generation)
+        os.replace(f"{path}.tmp", path)
+
+    def _refresh(self, truncate: bool = False):
+        """
+        Bring the index in line with the segments on disk, which other stores may have written.
+        """
+        os.makedirs(self.segment_dir, exist_ok=True)
+        sizes = {segment: os.path.getsize(self._segment_path(segment)) for segment in self._list_segments()}
+        if (self._read_generation() != self._generation
+                or any(sizes.get(segment, -1) < size for segment, size in self._sizes.items())):
+            self._load_index(truncate)
+            return
+
+        for segment, size in sorted(sizes.items()):
+            if size > self._sizes.get(segment, 0):
+                self._scan(segment, self._sizes.get(segment, 0), truncate)
+
+    def _load_index(self, truncate: bool = False):
+        """
+        Load the persisted key index and index any records appended after it was written.
+        """
+        self._generation = self._read_generation()
+        try:
+            with open(os.path.join(self.segment_dir, self.INDEX_FILE), "r", encoding="utf-8") as f:
+                state = json.load(f)
+            if state.get("generation") != self._generation:
+                raise ValueError("the index belongs to rewritten segments")
+            self._index = {name: [tuple(entry) for entry in entries] for name, entries in state["index"].items()}
+            self._sizes = {int(segment): size for segment, size in state["sizes"].items()}
+        except (IOError, ValueError, KeyError):
+            self._index, self._sizes = {}, {}
+        self._records = sum(len(entries) for entries in self._index.values())
+
+        segments = self._list_segments()
+        if any(segment not in segments or os.path.getsize(self._segment_path(segment)) < size
+               for segment, size in self._sizes.items()):
+            # A segment the index knows about is gone or shorter, so the index cannot be trusted
+            self._index, self._sizes, self._records = {}, {}, 0
+
+        for segment in segments:
+            self._scan(segment, self._sizes.get(segment, 0), truncate)
+
+    def _scan(self, segment: int, start: int, truncate: bool = False):
+        """
+        Index the records of a segment from a byte offset on, stopping at a torn last line.
+        Only writers drop it, as a reader may see a line another process is still writing.
+        """
+        path = self._segment_path(segment)
+        offset = start
+        with open(path, "rb") as f:
+            f.seek(start)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    name = codec.loads(line)["f"]
+                except (ValueError, KeyError, TypeError):
+                    break
+                self._index.setdefault(name, []).append((segment, offset, len(line)))
+                self._records += 1
+                offset += len(line)
+
+        if truncate and offset < os.path.getsize(path):
+            logging.error(f"Dropping a torn record at the end of segment '{path}'")
+            with open(path, "r+b") as f:
+                f.truncate(offset)
+        self._sizes[segment] = offset
+
+    def _save_index(self):
+        """
+        Atomically persist the key index, so the next open only scans records appended after it.
+        """
+        state = {
+            "generation": self._generation,
+            "index": self._index,
+            "sizes": {str(segment): size for segment, size in self._sizes.items()},
+        }
+        path = os.path.join(self.segment_dir, self.INDEX_FILE)
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(state, f, separators=(",", ":"))
+        os.replace(f"{path}.tmp", path)
+        self._unsaved_bytes = 0
+
+    def _append(self, lines: List[Tuple[str, bytes]]):
+        """
+        Append encoded records to the active segment, starting a new segment when it is full.
+        """
+        segment = max(self._sizes) if self._sizes else 1
+        if self._sizes.get(segment, 0) >= self.segment_max_bytes:
+            segment += 1
+        offset = self._sizes.get(segment, 0)
+
+        with open(self._segment_path(segment), "ab") as f:
+            f.write(b"".join(line for _, line in lines))
+        for name, line in lines:
+            self._index.setdefault(name, []).append((segment, offset, len(line)))
+            offset += len(line)
+        self._records += len(lines)
+        self._unsaved_bytes += offset - self._sizes.get(segment, 0)
+        self._sizes[segment] = offset
+
+    @staticmethod
+    def _encode(name: str, data: Any, replace: bool = False) -> bytes:
+        record = {"f": name, "d": data}
+        if replace:
+            record["r"] = True
+        return codec.dumps(record) + b"\n"
+
+    def save(self, name: str, data: Any):
+        """
+        Append a record for a file.
+
+        Args:
+            name (str): The file name, without extension.
+            data (Any): The data to merge into the file, or to replace it with if it is not a dict.
+        """
+        self.save_many([(name, data)])
+
+    def save_many(self, items: Iterable[Tuple[str, Any]]):
+        """
+        Append records for several files in one write.
+
+        Args:
+            items (Iterable[Tuple[str, Any]]): (file name, data) pairs, applied in order.
+        """
+        lines = [(name, self._encode(name, data)) for name, data in items]
+        if not lines:
+            return
+        with self._locked(exclusive=True):
+            self._append(lines)
+            self._maybe_compact()
+            # The index is saved every so often; records appended since are re-indexed on open
+            if self._unsaved_bytes >= SEGMENT_INDEX_SAVE_BYTES:
+                self._save_index()
+
+    def names(self) -> List[str]:
+        """
+        Get the names of the stored files.
+
+        Returns:
+            List[str]: The file names, in order of first write.
+        """
+        with self._locked():
+            return list(self._index)
+
+    def __contains__(self, name: str) -> bool:
+        with self._locked():
+            return name in self._index
+
+    def load(self, name: str, base: Any = None) -> Any:
+        """
+        Replay the records of a file.
+
+        Args:
+            name (str): The file name, without extension.
+            base (Any): The data the first record applies to, such as a legacy JSON file.
+
+        Returns:
+            Any: The current data of the file, or `base` if it has no records.
+        """
+        handles = {}
+        try:
+            with self._locked():
+                return self._read(self._index.get(name, ()), handles, base)
+        finally:
+            for f in handles.values():
+                f.close()
+
+    def _read(self, entries: Iterable[Tuple[int, int, int]], handles: Dict[int, Any], base: Any = None) -> Any:
+        """
+        Replay records by their index entries, reusing the segment files open in `handles`.
+        """
+        data = base
+        for segment, offset, length in entries:
+            f = handles.get(segment)
+            if f is None:
+                f = handles[segment] = open(self._segment_path(segment), "rb")
+            f.seek(offset)
+            data = self._apply(data, codec.loads(f.read(length)))
+        return data
+
+    @staticmethod
+    def _apply(data: Any, record: Dict[str, Any]) -> Any:
+        """
+        Apply one record to the current data of a file.
+        """
+        value = record["d"]
+        if not record.get("r") and isinstance(data, dict) and isinstance(value, dict):
+            merged = dict(data)
+            merged.update(value)
+            return merged
+        return value
+
+    def scan(self) -> Iterator[Tuple[str, Any]]:
+        """
+        Read every file, one at a time, through one open handle per segment.
+
+        Only the file being yielded is held in memory, and no lock is held
+        between files, so the consumer may write to the store. Files written
+        during the scan are read in their latest state; files first written
+        during the scan are not yielded. Unreadable files are logged and skipped.
+
+        Yields:
+            Tuple[str, Any]: (file name, data) pairs, in order of first write.
+        """
+        with self._locked():
+            names = list(self._index)
+
+        handles = {}
+        generation = self._generation
+        try:
+            for name in names:
+                with self._locked():
+                    if self._generation != generation:
+                        # The segments were rewritten; the open handles may point at removed files
+                        for f in handles.values():
+                            f.close()
+                        handles, generation = {}, self._generation
+                    entries = self._index.get(name)
+                    if not entries:
+                        continue
+                    try:
+                        data = self._read(entries, handles)
+                    except (IOError, ValueError, KeyError) as e:
+                        logging.error(f"Error reading record '{name}' from '{self.segment_dir}': {e}")
+                        continue
+                yield name, data
+        finally:
+            for f in handles.values():
+                f.close()
+
+    def _replay(self) -> Tuple[Dict[str, Any], set]:
+        """
+        Replay every record in segment order.
+
+        Returns:
+            Tuple[Dict[str, Any], set]: The data of every file, and the names of the files whose data
+                no longer builds on a base because a record replaced it.
+        """
+        data: Dict[str, Any] = {}
+        replaced = set()
+        for segment, size in sorted(self._sizes.items()):
+            with open(self._segment_path(segment), "rb") as f:
+                remaining = size
+                for line in f:
+                    if remaining <= 0:
+                        break
+                    remaining -= len(line)
+                    record = codec.loads(line)
+                    name = record["f"]
+                    data[name] = self._apply(data.get(name), record)
+                    if record.get("r") or not isinstance(record["d"], dict):
+                        replaced.add(name)
+        return data, replaced
+
+    def _maybe_compact(self):
+        """
+        Compact once superseded records make up most of the store.
+        """
+        if self._records >= self.compact_min_records and self._records > 2 * len(self._index):
+            self._compact()
+
+    def compact(self):
+        """
+        Rewrite the store with one merged record per file, last writer wins.
+
+        The merged records are written to new segments before the old ones are
+        removed. A merged record holds every key of its file, so replaying old
+        and new segments after an interrupted compaction gives the same data.
+        Files whose history replaced their data keep that replacement, so a
+        base such as a legacy JSON file stays dropped.
+        """
+        with self._locked(exclusive=True):
+            self._compact()
+
+    def _compact(self):
+        old_segments = sorted(self._sizes)
+        merged, replaced = self._replay()
+
+        self._index = {}
+        self._records = 0
+        self._sizes = {(max(old_segments) if old_segments else 0) + 1: 0}
+        lines = [(name, self._encode(name, data, replace=name in replaced)) for name, data in merged.items()]
+        for start in range(0, len(lines), 1024):
+            self._append(lines[start:start + 1024])
+        self._sizes = {segment: size for segment, size in self._sizes.items() if size}
+
+        # Other stores index the new segments again instead of reading at offsets into removed ones
+        self._new_generation()
+        self._save_index()
+        for segment in old_segments:
+            os.remove(self._segment_path(segment))
+
+    def flush(self):
+        """
+        Persist the key index.
+        """
+        with self._locked(exclusive=True):
+            self._save_index()
+
+    def reset(self):
+        """
+        Remove every segment and the index.
+        """
+        with self._locked(exclusive=True):
+            for segment in self._list_segments():
+                os.remove(self._segment_path(segment))
+            index_path = os.path.join(self.segment_dir, self.INDEX_FILE)
+            if os.path.exists(index_path):
+                os.remove(index_path)
+            self._index, self._sizes, self._records = {}, {}, 0
+            self._new_generation()
@@ -0,0 +1,182 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from storage import codec
+from storage.config import SQLITE_PATH, SQLITE_FETCH_SIZE
+
+class SQLiteStore:
+    """
+    A single-file SQLite store holding the records of every datatype and subpath.
+
+    Records are keyed by (datatype, subpath, name) and kept in insertion
+    order. The database runs in WAL mode, so readers never block the writer,
+    and every thread gets its own connection.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS records (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            datatype TEXT NOT NULL,
+            subpath TEXT NOT NULL,
+            name TEXT NOT NULL,
+            data TEXT NOT NULL,
+            UNIQUE (datatype, subpath, name)
+        );
+        CREATE INDEX IF NOT EXISTS records_by_location ON records (datatype, subpath, seq);
+    """
+
+    # One store per database file and process
+    _stores: Dict[str, "SQLiteStore"] = {}
+    _stores_lock = threading.Lock()
+
+    @classmethod
+    def open(cls, path: str = SQLITE_PATH) -> "SQLiteStore":
+        """
+        Get the store of a database file, opening it on first use.
+
+        Args:
+            path (str): The database file.
+
+        Returns:
+            SQLiteStore: The shared store of the file.
+        """
+        key = os.path.abspath(path)
+        with cls._stores_lock:
+            store = cls._stores.get(key)
+            if store is None:
+                store = cls._stores[key] = cls(path)
+            return store
+
+    def __init__(self, path: str = SQLITE_PATH):
+        """
+        Initialize the SQLiteStore with the given parameters.
+
+        Args:
+            path (str): The database file, created if missing.
+        """
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.connection.executescript(self.SCHEMA)
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """
+        The connection of the calling thread, opened on first use.
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # Transactions are managed explicitly by transaction()
+            connection = sqlite3.connect(self.path, isolation_level=None, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Run a block of statements in one write transaction.
+
+        Yields:
+            sqlite3.Connection: The connection to run the statements on.
+        """
+        connection = self.connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def get(self, datatype: str, subpath: str, name: str) -> Optional[Any]:
+        """
+        Look up one record.
+
+        Args:
+            datatype (str): The datatype of the record.
+            subpath (str): The subpath of the record.
+            name (str): The record name.
+
+        Returns:
+            Any: The record data, or None if there is no such record.
+        """
+        row = self.connection.execute(
+            "SELECT data FROM records WHERE datatype = ? AND subpath = ? AND name = ?",
+            (datatype, subpath, name)
+        ).fetchone()
+        return codec.loads(row[0]) if row else None
+
+    def save_many(self, datatype: str, subpath: str, items: Iterable[Tuple[str, Any]],
+                  base: Callable[[str], Any] = lambda name: None):
+        """
+        Merge several records into the store in one transaction.
+
+        Dict data is merged into the stored dict like JSONDataManager.save_json;
+        anything else replaces the stored data.
+
+        Args:
+            datatype (str): The datatype of the records.
+            subpath (str): The subpath of the records.
+            items (Iterable[Tuple[str, Any]]): (name, data) pairs, applied in order.
+            base (Callable[[str], Any]): Returns the data a record without a row builds on.
+        """
+        with self.transaction() as connection:
+            for name, data in items:
+                current = self.get(datatype, subpath, name)
+                if current is None:
+                    current = base(name)
+                if isinstance(current, dict) and isinstance(data, dict):
+                    data = {**current, **data}
+                connection.execute(
+                    "INSERT INTO records (datatype, subpath, name, data) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (datatype, subpath, name) DO UPDATE SET data = excluded.data",
+                    (datatype, subpath, name, codec.dumps(data).decode("utf-8"))
+                )
+
+    def names(self, datatype: str, subpath: str) -> List[str]:
+        """
+        Get the names of the records of a datatype and subpath, in insertion order.
+        """
+        rows = self.connection.execute(
+            "SELECT name FROM records WHERE datatype = ? AND subpath = ? ORDER BY seq",
+            (datatype, subpath)
+        )
+        return [name for name, in rows]
+
+    def scan(self, datatype: str, subpath: str, fetch_size: int = SQLITE_FETCH_SIZE) -> Iterator[Tuple[str, Any]]:
+        """
+        Stream the records of a datatype and subpath with a cursor, in insertion order.
+
+        Args:
+            datatype (str): The datatype of the records.
+            subpath (str): The subpath of the records.
+            fetch_size (int): The number of rows fetched from the cursor at once.
+
+        Yields:
+            Tuple[str, Any]: (name, data) pairs.
+        """
+        cursor = self.connection.execute(
+            "SELECT name, data FROM records WHERE datatype = ? AND subpath = ? ORDER BY seq",
+            (datatype, subpath)
+        )
+        try:
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                for name, data in rows:
+                    yield name, codec.loads(data)
+        finally:
+            cursor.close()
+
+    def delete(self, datatype: str, subpath: str):
+        """
+        Delete every record of a datatype and subpath.
+        """
+        with self.transaction() as connection:
+            connection.execute("DELETE FROM records WHERE datatype = ? AND subpath = ?", (datatype, subpath))
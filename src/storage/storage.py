@@ -1,23 +1,55 @@
-import json
 import os
+import queue
 import shutil
+import sqlite3
 import logging
-from typing import List, Dict, Any
+import threading
+from typing import Iterable, Iterator, List, Dict, Any, Tuple, Union
 
-from storage.config import RAW_DATA_LOC, CLEANSED_DATA_LOC
+from storage import codec
+from storage.config import (RAW, RAW_DATA_LOC, CLEANSED_DATA_LOC, STORAGE_BACKEND, STORAGE_COMPACT_JSON,
+                            STORAGE_PREFETCH_RECORDS, RAW_BLOB_STORAGE)
+from storage.blobs import BlobStore
+from storage.manifest import StageManifest
+from storage.segments import SegmentStore
+from storage.sqlite_store import SQLiteStore
 
 class JSONDataManager:
     """
     A class to manage JSON file operations for raw and cleansed data, including subfolder structures.
+
+    With the 'segments' backend, records are appended to JSONL segments
+    instead of rewriting one JSON file per record. get_files then returns
+    virtual `<name>.json` paths that load_json resolves, and JSON files
+    written by the 'json' backend are still read as the base of each record.
+
+    The 'sqlite' backend keeps every record in one SQLite database keyed by
+    (datatype, subpath, filename), with the same virtual paths and base.
+
+    JSON is parsed and written with orjson or msgspec when one is installed.
+
+    With RAW_BLOB_STORAGE on, or blobs=True, long strings are kept once,
+    compressed, in a content-addressed blob store and referenced by hash from
+    the record. Loading always resolves the references, so the setting can be
+    changed without migrating stored data.
     """
 
-    def __init__(self, datatype: str, subpath: str):
+    def __init__(self, datatype: str, subpath: str, backend: str = STORAGE_BACKEND,
+                 compact: bool = STORAGE_COMPACT_JSON, blobs: bool = None):
+        if backend not in ('json', 'segments', 'sqlite'):
+            raise ValueError(f"Invalid backend '{backend}'. Valid options are: ['json', 'segments', 'sqlite']")
+
         self.data_locations = {
             'raw': RAW_DATA_LOC,
             'cleansed': CLEANSED_DATA_LOC,
         }
         self.datatype = datatype
         self.subpath = subpath
+        self.backend = backend
+        # Whether the 'json' backend writes compact JSON instead of indenting it
+        self.compact = compact
+        # Whether long strings are moved to the blob store; RAW_BLOB_STORAGE sets it for raw data
+        self.blobs = (datatype == RAW and RAW_BLOB_STORAGE) if blobs is None else blobs
 
     def _get_data_location(self) -> str:
         """
@@ -33,31 +65,103 @@ class JSONDataManager:
         os.makedirs(full_path, exist_ok=True)
         return full_path
 
+    def _segment_store(self) -> SegmentStore:
+        """
+        Get the segment store of the datatype and subpath directory.
+        """
+        return SegmentStore.open(self._get_data_location())
+
+    def _sqlite_store(self) -> SQLiteStore:
+        """
+        Get the SQLite store shared by every datatype and subpath.
+        """
+        return SQLiteStore.open()
+
+    def _blob_store(self) -> BlobStore:
+        """
+        Get the blob store of the datatype and subpath directory.
+        """
+        return BlobStore(self._get_data_location())
+
+    def _legacy_record(self, filename: str) -> Any:
+        """
+        Read the JSON file a record was stored in by the 'json' backend, if any.
+        """
+        file_path = os.path.join(self._get_data_location(), f"{filename}.json")
+        return self._read_json_file(file_path) if os.path.exists(file_path) else None
+
+    def manifest(self, stage: str, version: Any) -> StageManifest:
+        """
+        Get the manifest of a pipeline stage, kept in the specified datatype and subpath directory
+        and removed by reset_storage.
+
+        Args:
+            stage (str): The name of the stage.
+            version (Any): The stage version; inputs processed by another version are processed again.
+
+        Returns:
+            StageManifest: The manifest of the stage.
+        """
+        return StageManifest(self._get_data_location(), stage, version)
+
     def save_json(self, filename: str, data: Dict[str, Any]) -> None:
         """
         Save data to a JSON file in the specified datatype and subpath directory.
         """
+        if self.backend in ('segments', 'sqlite'):
+            self.save_many([(filename, data)])
+            return
+
         data_loc = self._get_data_location()
         file_path = os.path.join(data_loc, f"{filename}.json")
 
         try:
+            if self.blobs:
+                data = self._blob_store().pack(data)
+
             if os.path.exists(file_path):
-                with open(file_path, "r", encoding="utf-8") as f:
-                    existing_data = json.load(f)
+                with open(file_path, "rb") as f:
+                    existing_data = codec.loads(f.read())
 
                 if isinstance(existing_data, dict):
                     existing_data.update(data)
                 else:
                     existing_data = data
 
-                with open(file_path, "w", encoding="utf-8") as f:
-                    json.dump(existing_data, f, indent=2, ensure_ascii=False)
+                with open(file_path, "wb") as f:
+                    f.write(codec.dumps(existing_data, indent=not self.compact))
             else:
-                with open(file_path, "w", encoding="utf-8") as f:
-                    json.dump(data, f, indent=2, ensure_ascii=False)
-        except IOError as e:
+                with open(file_path, "wb") as f:
+                    f.write(codec.dumps(data, indent=not self.compact))
+        except (IOError, ValueError) as e:
             logging.error(f"Error saving JSON file: {e}")
 
+    def save_many(self, items: Union[Dict[str, Dict[str, Any]], Iterable[Tuple[str, Dict[str, Any]]]]) -> None:
+        """
+        Save several records at once, with the same semantics as save_json per record.
+        With the 'segments' backend they are appended in a single write, with the
+        'sqlite' backend they are written in a single transaction.
+        """
+        if isinstance(items, dict):
+            items = items.items()
+
+        if self.backend == 'json':
+            for filename, data in items:
+                self.save_json(filename, data)
+            return
+
+        try:
+            if self.blobs:
+                blob_store = self._blob_store()
+                items = [(filename, blob_store.pack(data)) for filename, data in items]
+
+            if self.backend == 'sqlite':
+                self._sqlite_store().save_many(self.datatype, self.subpath, items, base=self._legacy_record)
+            else:
+                self._segment_store().save_many(items)
+        except (IOError, sqlite3.Error) as e:
+            logging.error(f"Error saving JSON records: {e}")
+
     def get_files(self) -> List[str]:
         """
         Get a list of JSON file paths in the specified datatype and subpath directory.
@@ -65,7 +169,7 @@ class JSONDataManager:
         data_loc = self._get_data_location()
 
         try:
-            return [
+            files = [
                 os.path.join(data_loc, f) 
                 for f in os.listdir(data_loc) 
                 if f.endswith('.json')
@@ -74,14 +178,162 @@ class JSONDataManager:
             logging.error(f"Error accessing directory: {e}")
             return []
 
+        if self.backend in ('segments', 'sqlite'):
+            if self.backend == 'sqlite':
+                names = self._sqlite_store().names(self.datatype, self.subpath)
+            else:
+                names = self._segment_store().names()
+            stored = [os.path.join(data_loc, f"{name}.json") for name in names]
+            files = stored + sorted(set(files) - set(stored))
+        return files
+
     def load_json(self, filepath: str) -> Dict[str, Any]:
         """
         Load JSON data from the specified file.
         """
         try:
-            with open(filepath, 'r', encoding='utf-8') as file:
-                return json.load(file)
-        except (IOError, json.JSONDecodeError) as e:
+            return self._blob_store().unpack(self._load_stored_json(filepath))
+        except (IOError, ValueError, sqlite3.Error) as e:
+            logging.error(f"Error loading JSON record: {e}")
+            return {}
+
+    def _load_stored_json(self, filepath: str) -> Dict[str, Any]:
+        """
+        Load a record as stored by the backend, with blob references unresolved.
+        """
+        if self.backend == 'segments':
+            name = os.path.basename(filepath)[:-len('.json')]
+            store = self._segment_store()
+            if name in store:
+                base = self._read_json_file(filepath) if os.path.exists(filepath) else None
+                return store.load(name, base)
+
+        if self.backend == 'sqlite':
+            name = os.path.basename(filepath)[:-len('.json')]
+            data = self._sqlite_store().get(self.datatype, self.subpath, name)
+            if data is not None:
+                return data
+
+        return self._read_json_file(filepath)
+
+    def iter_records(self, prefetch: int = STORAGE_PREFETCH_RECORDS) -> Iterator[Tuple[str, Any]]:
+        """
+        Lazily iterate over every record in the specified datatype and subpath directory.
+
+        Args:
+            prefetch (int): The number of records read ahead on a background thread, or 0 to read
+                each record only when it is requested.
+
+        Returns:
+            Iterator[Tuple[str, Any]]: (file name without extension, data) pairs, in get_files order.
+        """
+        records = self._unpack_records(self._iter_stored_records())
+        if prefetch > 0:
+            return self._prefetch(records, prefetch)
+        return records
+
+    def _unpack_records(self, records: Iterator[Tuple[str, Any]]) -> Iterator[Tuple[str, Any]]:
+        """
+        Resolve the blob references of records, logging and skipping records whose blobs are unreadable.
+        """
+        blob_store = self._blob_store()
+        try:
+            for name, data in records:
+                try:
+                    data = blob_store.unpack(data)
+                except IOError as e:
+                    logging.error(f"Error loading JSON record '{name}': {e}")
+                    continue
+                yield name, data
+        finally:
+            records.close()
+
+    def _iter_stored_records(self) -> Iterator[Tuple[str, Any]]:
+        """
+        Read every record, streaming them from the store of the backend before any remaining JSON files.
+        """
+        data_loc = self._get_data_location()
+        try:
+            json_files = [f[:-len('.json')] for f in os.listdir(data_loc) if f.endswith('.json')]
+        except FileNotFoundError as e:
+            logging.error(f"Error accessing directory: {e}")
+            return
+
+        if self.backend == 'json':
+            for name in json_files:
+                yield name, self._read_json_file(os.path.join(data_loc, f"{name}.json"))
+            return
+
+        legacy = set(json_files)
+        stored = set()
+        if self.backend == 'sqlite':
+            # Rows already hold the legacy JSON file they were merged into
+            for name, data in self._sqlite_store().scan(self.datatype, self.subpath):
+                stored.add(name)
+                yield name, data
+        else:
+            store = self._segment_store()
+            for name, data in store.scan():
+                stored.add(name)
+                if name in legacy:
+                    # Records building on a legacy JSON file are replayed onto it
+                    data = store.load(name, self._read_json_file(os.path.join(data_loc, f"{name}.json")))
+                yield name, data
+
+        for name in sorted(legacy - stored):
+            yield name, self._read_json_file(os.path.join(data_loc, f"{name}.json"))
+
+    @staticmethod
+    def _prefetch(records: Iterator[Tuple[str, Any]], size: int) -> Iterator[Tuple[str, Any]]:
+        """
+        Read records on a background thread, keeping up to `size` of them ready for the consumer.
+        """
+        buffer = queue.Queue(maxsize=size)
+        stop = threading.Event()
+
+        def put(item) -> bool:
+            # Give up once the consumer has stopped iterating
+            while not stop.is_set():
+                try:
+                    buffer.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def produce():
+            try:
+                for record in records:
+                    if not put(('record', record)):
+                        return
+                put(('done', None))
+            except Exception as e:
+                put(('error', e))
+            finally:
+                # Close the reader on its own thread, which owns its cursor or file handles
+                records.close()
+
+        threading.Thread(target=produce, daemon=True).start()
+        try:
+            while True:
+                kind, payload = buffer.get()
+                if kind == 'done':
+                    return
+                if kind == 'error':
+                    raise payload
+                yield payload
+        finally:
+            stop.set()
+
+    @staticmethod
+    def _read_json_file(filepath: str) -> Dict[str, Any]:
+        """
+        Read a JSON file from disk.
+        """
+        try:
+            with open(filepath, 'rb') as file:
+                return codec.loads(file.read())
+        except (IOError, ValueError) as e:
             logging.error(f"Error loading JSON file: {e}")
             return {}
 
@@ -93,3 +345,7 @@ class JSONDataManager:
 
         shutil.rmtree(data_loc, ignore_errors=True)
         os.makedirs(data_loc, exist_ok=True)
+        if self.backend == 'segments':
+            self._segment_store().reset()
+        elif self.backend == 'sqlite':
+            self._sqlite_store().delete(self.datatype, self.subpath)